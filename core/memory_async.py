@@ -0,0 +1,326 @@
+"""Native asyncio front end for ``core.memory_store``.
+
+``AsyncMemoryStore`` mirrors the ``MemoryStore`` API with coroutines, for FastAPI handlers and
+other code that already runs in an event loop:
+
+- Postgres (``MEMORY_DB_URL`` + asyncpg): queries are awaited directly on the caller's loop,
+  using a long-lived asyncpg pool bound to that loop (one pool per loop, created on first use).
+- SQLite: calls run on a small shared thread pool (``MEMORY_ASYNC_SQLITE_WORKERS``) against the
+  same pooled shard connections, write-behind buffer and vector indexes the sync store uses,
+  so sync and async callers in one process always see the same data.
+
+Sync callers keep using ``MemoryStore``; its Postgres calls are dispatched onto one background
+event-loop thread, so they share one pool as well instead of creating a loop per call.
+
+Example::
+
+    store = AsyncMemoryStore().for_agent("a1")
+    await store.add("a1", "met the supplier", tags=["meeting"])
+    hits = await store.get_relevant("a1", "supplier", limit=3)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, BinaryIO, Callable, Iterable, List, Sequence
+
+from . import memory_changes, memory_store
+from .memory_changes import ChangeBatch
+from .memory_store import MemoryItem, MemoryStore, QueryResult, TagFilter, _deadline_at
+
+MEMORY_ASYNC_SQLITE_WORKERS = int(os.getenv("MEMORY_ASYNC_SQLITE_WORKERS", "4"))
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _sqlite_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MEMORY_ASYNC_SQLITE_WORKERS, thread_name_prefix="memory-sqlite")
+        return _executor
+
+
+def _use_pg() -> bool:
+    return bool(memory_store.MEMORY_DB_URL) and memory_store.asyncpg is not None
+
+
+class AsyncMemoryStore:
+    def __init__(self, shard: str | None = None) -> None:
+        self._store = MemoryStore(shard)
+
+    @property
+    def shard(self) -> str | None:
+        return self._store.shard
+
+    def for_agent(self, agent_id: str) -> "AsyncMemoryStore":
+        return AsyncMemoryStore(shard=f"agent_{agent_id}")
+
+    def for_business(self, biz_id: str) -> "AsyncMemoryStore":
+        return AsyncMemoryStore(shard=f"business_{biz_id}")
+
+    async def _call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking ``MemoryStore`` method on the shared SQLite thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_sqlite_executor(), functools.partial(fn, *args, **kwargs))
+
+    # ---------- writes ----------
+    async def add(
+        self,
+        agent_id: str,
+        text: str,
+        *,
+        tags: Sequence[str] | None = None,
+        importance: float = 0.5,
+        ttl: float | None = None,
+        source: str | None = None,
+        metadata: dict[str, Any] | None = None,
+        blob: bytes | BinaryIO | None = None,
+        embedding: Sequence[float] | None = None,
+    ) -> MemoryItem:
+        kwargs = dict(
+            tags=tags, importance=importance, ttl=ttl, source=source, metadata=metadata, blob=blob, embedding=embedding
+        )
+        if not _use_pg():
+            return await self._call(self._store.add, agent_id, text, **kwargs)
+        # Blob copies and embeddings are blocking work; only the insert runs on the loop.
+        entry = await self._call(self._store._new_entry, agent_id, text, **kwargs)
+        await self._store._add_pg(entry)
+        return entry
+
+    async def add_many(self, items: Iterable[dict[str, Any]]) -> List[MemoryItem]:
+        if not _use_pg():
+            return await self._call(self._store.add_many, list(items))
+        entries = await self._call(lambda: [self._store._new_entry(**item) for item in items])
+        if entries:
+            await self._store._add_many_pg(entries)
+        return entries
+
+    async def update(
+        self,
+        entry_id: str,
+        *,
+        text: str | None = None,
+        tags: Sequence[str] | None = None,
+        ttl: float | None = None,
+        metadata: dict[str, Any] | None = None,
+        importance: float | None = None,
+    ) -> None:
+        if _use_pg():
+            return await self._store._update_pg(entry_id, text, tags, ttl, metadata, importance)
+        await self._call(
+            self._store.update, entry_id, text=text, tags=tags, ttl=ttl, metadata=metadata, importance=importance
+        )
+
+    async def update_many(self, updates: Iterable[tuple[str, dict[str, Any]]]) -> int:
+        if _use_pg():
+            updates = [(entry_id, dict(changes)) for entry_id, changes in updates if changes]
+            for _, changes in updates:
+                MemoryStore._check_changes(changes)
+            return await self._store._update_many_pg(updates) if updates else 0
+        return await self._call(self._store.update_many, list(updates))
+
+    async def soft_delete(self, entry_id: str) -> None:
+        if _use_pg():
+            return await self._store._soft_delete_pg(entry_id)
+        await self._call(self._store.soft_delete, entry_id)
+
+    async def delete(self, entry_id: str) -> None:
+        if _use_pg():
+            return await self._store._delete_pg(entry_id)
+        await self._call(self._store.delete, entry_id)
+
+    async def flush(self) -> int:
+        return await self._call(self._store.flush)
+
+    # ---------- reads ----------
+    async def get(
+        self,
+        agent_id: str,
+        limit: int | None = None,
+        include_deleted: bool = False,
+        *,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        if _use_pg():
+            tag_filter = TagFilter.build(None, tags_any, tags_all, tags_none)
+            deadline = _deadline_at(deadline_ms)
+            result = await self._store._get_pg(agent_id, limit, include_deleted, tag_filter, deadline, since)
+            return MemoryStore._record_deadline("get", deadline, result)
+        return await self._call(
+            self._store.get,
+            agent_id,
+            limit,
+            include_deleted,
+            tags_any=tags_any,
+            tags_all=tags_all,
+            tags_none=tags_none,
+            deadline_ms=deadline_ms,
+            since=since,
+        )
+
+    async def search(
+        self,
+        agent_id: str,
+        query: str,
+        limit: int | None = None,
+        tags: Sequence[str] | None = None,
+        metadata_filter: dict[str, Any] | None = None,
+        *,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        if _use_pg():
+            tag_filter = TagFilter.build(tags, tags_any, tags_all, tags_none)
+            deadline = _deadline_at(deadline_ms)
+            result = await self._store._search_pg(agent_id, query, limit, tag_filter, metadata_filter, deadline, since)
+            return MemoryStore._record_deadline("search", deadline, result)
+        return await self._call(
+            self._store.search,
+            agent_id,
+            query,
+            limit,
+            tags,
+            metadata_filter,
+            tags_any=tags_any,
+            tags_all=tags_all,
+            tags_none=tags_none,
+            deadline_ms=deadline_ms,
+            since=since,
+        )
+
+    async def get_relevant(
+        self,
+        agent_id: str,
+        query: str,
+        *,
+        tags: Sequence[str] | None = None,
+        limit: int | None = None,
+        semantic: bool = False,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        if _use_pg() and not (semantic and query):
+            tag_filter = TagFilter.build(tags, tags_any, tags_all, tags_none)
+            deadline = _deadline_at(deadline_ms)
+            result = await self._store._get_relevant_pg(
+                agent_id, query, tag_filter, limit or memory_store.MEMORY_MAX_RESULTS, deadline, since
+            )
+            return MemoryStore._record_deadline("get_relevant", deadline, result)
+        return await self._call(
+            self._store.get_relevant,
+            agent_id,
+            query,
+            tags=tags,
+            limit=limit,
+            semantic=semantic,
+            tags_any=tags_any,
+            tags_all=tags_all,
+            tags_none=tags_none,
+            deadline_ms=deadline_ms,
+            since=since,
+        )
+
+    async def semantic_search(
+        self,
+        agent_id: str,
+        query: str | Sequence[float],
+        limit: int = 5,
+        deadline_ms: float | None = None,
+        **tag_filters: Sequence[str] | None,
+    ) -> QueryResult:
+        if not _use_pg():
+            return await self._call(self._store.semantic_search, agent_id, query, limit, deadline_ms=deadline_ms, **tag_filters)
+        vec = await self._call(self._store._embed, query) if isinstance(query, str) else list(query)
+        if not vec:
+            return QueryResult()
+        tag_filter = TagFilter.build(None, tag_filters.get("tags_any"), tag_filters.get("tags_all"), tag_filters.get("tags_none"))
+        deadline = _deadline_at(deadline_ms)
+        result = await self._store._semantic_pg(agent_id, vec, limit, tag_filter, deadline)
+        return MemoryStore._record_deadline("semantic_search", deadline, result)
+
+    # ---------- maintenance ----------
+    async def prune_expired(self) -> None:
+        if _use_pg():
+            return await self._store._prune_expired_pg()
+        await self._call(self._store.prune_expired)
+
+    async def prune_importance(self, threshold: float = 0.2) -> None:
+        if _use_pg():
+            return await self._store._prune_importance_pg(threshold)
+        await self._call(self._store.prune_importance, threshold)
+
+    async def apply_importance_decay(self) -> None:
+        """No-op; importance decays lazily (see ``MemoryStore.apply_importance_decay``)."""
+
+    async def integrity_check(self) -> bool:
+        return await self._call(self._store.integrity_check)
+
+    async def dump_all(self) -> List[dict[str, Any]]:
+        if _use_pg():
+            return await self._store._dump_pg()
+        return await self._call(self._store.dump_all)
+
+    async def load_dump(self, items: Iterable[dict[str, Any]]) -> None:
+        if _use_pg():
+            return await self._store._load_pg(items)
+        await self._call(self._store.load_dump, list(items))
+
+    async def export_stream(self, dest: Any, **kwargs: Any) -> dict[str, Any]:
+        """``MemoryStore.export_stream`` off the event loop (it does blocking file I/O)."""
+        return await self._call(self._store.export_stream, dest, **kwargs)
+
+    async def import_stream(self, src: Any, **kwargs: Any) -> dict[str, Any]:
+        return await self._call(self._store.import_stream, src, **kwargs)
+
+    # ---------- change feed ----------
+    async def changes_since(self, seq: int = 0, *, limit: int = 1000, agent_id: str | None = None) -> ChangeBatch:
+        if _use_pg():
+            return await self._store._changes_since_pg(seq, limit, agent_id)
+        return await self._call(self._store.changes_since, seq, limit=limit, agent_id=agent_id)
+
+    async def subscribe(
+        self,
+        since: int | None = None,
+        *,
+        agent_id: str | None = None,
+        limit: int = 1000,
+        poll_interval: float | None = None,
+    ) -> AsyncIterator[ChangeBatch]:
+        """Yield non-empty change batches after ``since`` (default: from now on) as they are committed.
+
+        Polls ``changes_since`` every ``poll_interval`` seconds (``MEMORY_CHANGES_POLL_INTERVAL``)
+        while idle and without waiting while it is catching up. Check ``batch.truncated``.
+        """
+        interval = memory_changes.MEMORY_CHANGES_POLL_INTERVAL if poll_interval is None else poll_interval
+        if since is None:
+            since = await (self._store._latest_change_seq_pg() if _use_pg() else self._call(self._store.latest_change_seq))
+        while True:
+            batch = await self.changes_since(since, limit=limit, agent_id=agent_id)
+            since = batch.next_seq
+            if batch or batch.truncated:
+                yield batch
+            if len(batch) < limit:
+                await asyncio.sleep(interval)
+
+    async def aclose(self) -> None:
+        """Close this event loop's asyncpg pool (e.g. from an application shutdown hook)."""
+        await memory_store.close_pg_pool()
+
+
+__all__ = ["AsyncMemoryStore", "MEMORY_ASYNC_SQLITE_WORKERS"]
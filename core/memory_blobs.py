@@ -0,0 +1,323 @@
+"""Content-addressed, deduplicating blob store for memory entry payloads.
+
+Blobs are keyed by SHA-256 and stored once under two levels of fan-out directories
+(``blobs/ab/cd/abcd...``); the reference stored in ``memory_entries.blob_ref`` is
+``sha256:<hex>``. Legacy refs (absolute paths to ``blobs/<uuid>.bin``) remain readable.
+
+Reference counts for all shards live in ``blobs/index.db``:
+
+- a write increments the blob's count (writing the file only if it is new); the row that
+  stores the new ref takes that reference over (``adopt_written``), and until then the writer
+  may give it back (``release_written``)
+- every shard has triggers that queue each ``sha256:`` ref a row gains (insert, or an update
+  of ``blob_ref``: imports, dump loads, upserts) in ``blob_acquires`` and each ref a row loses
+  (delete, or the replaced ref of an update) in ``blob_releases``
+- ``sweep`` drains both queues one shard at a time, acquisitions first, and only then
+  unlinks blobs whose count has been zero for longer than ``MEMORY_BLOB_GRACE`` seconds
+
+So orphan collection reads only the release queues and the index, never the whole
+blob directory. Postgres rows have no queues: the store releases the refs its deletes return
+and counts the refs its imports bring in or replace. ``reconcile`` recomputes exact counts
+from shard (and Postgres) references when needed (e.g. after restoring shards from a backup).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import mmap
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, suppress
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Iterable, Iterator
+
+from .memory_shards import ShardFileMissing, shard_connections
+
+MEMORY_BLOB_GRACE = float(os.getenv("MEMORY_BLOB_GRACE", "3600"))  # seconds an unreferenced blob is kept
+MEMORY_BLOB_CHUNK = int(os.getenv("MEMORY_BLOB_CHUNK", str(1 << 20)))  # streaming chunk size in bytes
+MEMORY_BLOB_SWEEP_BATCH = int(os.getenv("MEMORY_BLOB_SWEEP_BATCH", "1000"))
+
+REF_PREFIX = "sha256:"
+
+logger = logging.getLogger(__name__)
+
+# References taken by writes in this process that no row has adopted yet, by ref. Only these
+# can be released by hand; every other reference belongs to a row and goes with it. A write
+# reference this process does not know about (taken by another process or before a restart)
+# cannot be told apart from a row's, so it is left for ``reconcile``.
+_unadopted: dict[str, int] = {}
+_unadopted_lock = threading.Lock()
+
+
+def _ensure_index_schema(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS blobs ("
+        "sha TEXT PRIMARY KEY,"
+        "size INTEGER,"
+        "refcount INTEGER NOT NULL DEFAULT 0,"
+        "created_at REAL,"
+        "released_at REAL"
+        ")"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(released_at) WHERE refcount <= 0")
+    conn.commit()
+
+
+class BlobStore:
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.index_path = root / "index.db"
+
+    # ---------- layout ----------
+    def path_for(self, blob_ref: str) -> Path:
+        if blob_ref.startswith(REF_PREFIX):
+            sha = blob_ref[len(REF_PREFIX):]
+            return self.root / sha[:2] / sha[2:4] / sha
+        return Path(blob_ref)  # legacy absolute path ref
+
+    @contextmanager
+    def _index(self) -> Iterator[sqlite3.Connection]:
+        with shard_connections.connection(self.index_path, init=_ensure_index_schema) as conn:
+            yield conn
+
+    # ---------- writes ----------
+    def write(self, data: bytes) -> str:
+        return self.write_stream(io.BytesIO(data))
+
+    def write_stream(self, stream: BinaryIO | IO[bytes], chunk_size: int | None = None) -> str:
+        """Hash and copy ``stream`` in chunks; identical content is stored once. Returns the blob ref."""
+        chunk_size = chunk_size or MEMORY_BLOB_CHUNK
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            sha = digest.hexdigest()
+            ref = REF_PREFIX + sha
+            dest = self.path_for(ref)
+            with self._index() as conn:
+                # Serialized with sweep() through the index lock, so a blob is never unlinked
+                # between the existence check and the refcount increment.
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    "INSERT INTO blobs (sha, size, refcount, created_at) VALUES (?, ?, 1, ?) "
+                    "ON CONFLICT(sha) DO UPDATE SET refcount = refcount + 1, released_at = NULL",
+                    (sha, size, time.time()),
+                )
+                if not dest.exists():
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_name, dest)
+                conn.commit()
+            with _unadopted_lock:
+                _unadopted[ref] = _unadopted.get(ref, 0) + 1
+        finally:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+        return ref
+
+    # ---------- reads ----------
+    def read(self, blob_ref: str) -> bytes:
+        return self.path_for(blob_ref).read_bytes()
+
+    def open(self, blob_ref: str, *, use_mmap: bool = False) -> Any:
+        """Open a blob for streaming reads, or as a read-only ``mmap`` for large artifacts.
+
+        Both results are context managers; close them when done.
+        """
+        path = self.path_for(blob_ref)
+        if not use_mmap:
+            return path.open("rb")
+        with path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return io.BytesIO(b"")  # zero-length files cannot be mapped
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # ---------- reference counting ----------
+    def acquire(self, blob_refs: Iterable[str]) -> None:
+        """Add one reference per ``sha256:`` ref; refs the index has not seen (e.g. copied from another store) are added."""
+        now = time.time()
+        counted = []
+        for ref in blob_refs:
+            if ref and ref.startswith(REF_PREFIX):
+                path = self.path_for(ref)
+                counted.append((ref[len(REF_PREFIX):], path.stat().st_size if path.exists() else None, now))
+        if not counted:
+            return
+        with self._index() as conn:
+            conn.executemany(
+                "INSERT INTO blobs (sha, size, refcount, created_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(sha) DO UPDATE SET refcount = refcount + 1, released_at = NULL",
+                counted,
+            )
+            conn.commit()
+
+    def release(self, blob_refs: Iterable[str]) -> None:
+        """Drop one reference per ref; legacy path refs are unlinked immediately."""
+        counted: list[tuple[float, str]] = []
+        now = time.time()
+        for ref in blob_refs:
+            if not ref:
+                continue
+            if ref.startswith(REF_PREFIX):
+                counted.append((now, ref[len(REF_PREFIX):]))
+            else:
+                Path(ref).unlink(missing_ok=True)
+        if not counted:
+            return
+        with self._index() as conn:
+            conn.executemany(
+                "UPDATE blobs SET refcount = refcount - 1, "
+                "released_at = CASE WHEN refcount - 1 <= 0 THEN ? ELSE released_at END WHERE sha = ?",
+                counted,
+            )
+            conn.commit()
+
+    def release_written(self, blob_ref: str) -> bool:
+        """Give back one reference taken by ``write``/``write_stream`` that no row has adopted.
+
+        Legacy path refs are unlinked. Any other ``sha256:`` ref is left alone and logged, so a
+        row's reference is never released twice. Returns whether anything was released.
+        """
+        if blob_ref and not blob_ref.startswith(REF_PREFIX):
+            self.release([blob_ref])
+            return True
+        with _unadopted_lock:
+            if _unadopted.get(blob_ref, 0) <= 0:
+                logger.warning("not releasing blob ref %s: no unadopted write of it in this process", blob_ref)
+                return False
+            self.release([blob_ref])
+            _unadopted[blob_ref] -= 1
+            if not _unadopted[blob_ref]:
+                del _unadopted[blob_ref]
+        return True
+
+    def _drain(self, conn: sqlite3.Connection, table: str, apply: Any, batch: int | None) -> int:
+        batch = batch or MEMORY_BLOB_SWEEP_BATCH
+        drained = 0
+        while True:
+            rows = conn.execute(f"SELECT rowid, blob_ref FROM {table} ORDER BY rowid LIMIT ?", (batch,)).fetchall()
+            if not rows:
+                return drained
+            apply(r[1] for r in rows)
+            conn.execute(f"DELETE FROM {table} WHERE rowid IN ({','.join('?' * len(rows))})", [r[0] for r in rows])
+            conn.commit()
+            drained += len(rows)
+
+    def drain_acquires(self, conn: sqlite3.Connection, batch: int | None = None) -> int:
+        """Apply queued ``blob_acquires`` from one shard connection; returns refs acquired."""
+        return self._drain(conn, "blob_acquires", self.acquire, batch)
+
+    def drain_releases(self, conn: sqlite3.Connection, batch: int | None = None) -> int:
+        """Apply queued ``blob_releases`` from one shard connection; returns refs released."""
+        return self._drain(conn, "blob_releases", self.release, batch)
+
+    def drain(self, conn: sqlite3.Connection) -> None:
+        """Apply both queues of one shard; acquisitions first, so a moved ref never drops to zero."""
+        self.drain_acquires(conn)
+        self.drain_releases(conn)
+
+    def sweep(self, shard_paths: Iterable[Path], init: Any, grace: float | None = None) -> int:
+        """Drain every shard's queues, then unlink blobs unreferenced for ``grace`` seconds."""
+        for path in shard_paths:
+            with suppress(ShardFileMissing), shard_connections.connection(path, init=init, create=False) as conn:
+                self.drain(conn)  # a file dropped since it was listed drained its queues first
+        grace = MEMORY_BLOB_GRACE if grace is None else grace
+        cutoff = time.time() - grace
+        removed = 0
+        with self._index() as conn:
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                shas = [
+                    r[0]
+                    for r in conn.execute(
+                        "SELECT sha FROM blobs WHERE refcount <= 0 AND released_at <= ? LIMIT ?",
+                        (cutoff, MEMORY_BLOB_SWEEP_BATCH),
+                    )
+                ]
+                for sha in shas:
+                    self.path_for(REF_PREFIX + sha).unlink(missing_ok=True)
+                conn.executemany("DELETE FROM blobs WHERE sha = ?", [(sha,) for sha in shas])
+                conn.commit()
+                removed += len(shas)
+                if len(shas) < MEMORY_BLOB_SWEEP_BATCH:
+                    return removed
+
+    def reconcile(
+        self, shard_paths: Iterable[Path], init: Any, extra_refs: Iterable[tuple[str, int]] = ()
+    ) -> dict[str, int]:
+        """Recompute refcounts from the references in every shard (one shard at a time).
+
+        ``extra_refs``: ``(ref, count)`` pairs held outside SQLite shards (Postgres rows); every blob
+        not counted here or in a shard drops to zero and is collected by the next ``sweep``.
+        """
+        counts: dict[str, int] = {}
+        for ref, n in extra_refs:
+            if ref and ref.startswith(REF_PREFIX):
+                sha = ref[len(REF_PREFIX):]
+                counts[sha] = counts.get(sha, 0) + n
+        for path in shard_paths:
+            with suppress(ShardFileMissing), shard_connections.connection(path, init=init, create=False) as conn:
+                self.drain(conn)
+                cur = conn.execute(
+                    "SELECT blob_ref, count(*) FROM memory_entries WHERE blob_ref LIKE ? GROUP BY blob_ref",
+                    (REF_PREFIX + "%",),
+                )
+                for ref, n in cur:
+                    sha = ref[len(REF_PREFIX):]
+                    counts[sha] = counts.get(sha, 0) + n
+        now = time.time()
+        with self._index() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE blobs SET refcount = 0, released_at = coalesce(released_at, ?)", (now,))
+            conn.executemany(
+                "UPDATE blobs SET refcount = ?, released_at = NULL WHERE sha = ?",
+                [(n, sha) for sha, n in counts.items()],
+            )
+            conn.commit()
+        return counts
+
+    def stats(self) -> dict[str, Any]:
+        with self._index() as conn:
+            row = conn.execute(
+                "SELECT count(*), coalesce(sum(size), 0), coalesce(sum(refcount), 0), "
+                "coalesce(sum(CASE WHEN refcount <= 0 THEN 1 ELSE 0 END), 0) FROM blobs"
+            ).fetchone()
+        return {"blobs": row[0], "bytes": row[1], "references": row[2], "unreferenced": row[3]}
+
+
+def adopt_written(conn: sqlite3.Connection | None, blob_refs: Iterable[str | None]) -> None:
+    """Hand the references taken by ``write``/``write_stream`` over to the rows just inserted with them.
+
+    Run in the inserting transaction: it drops the acquisitions the insert trigger queued for those
+    refs, which the write already counted. The write's reference keeps the blob alive until then.
+    ``conn`` is None for rows outside SQLite shards, which have no trigger queues.
+    """
+    refs = [ref for ref in blob_refs if ref and ref.startswith(REF_PREFIX)]
+    if conn is not None:
+        conn.executemany(
+            "DELETE FROM blob_acquires WHERE rowid = (SELECT max(rowid) FROM blob_acquires WHERE blob_ref = ?)",
+            [(ref,) for ref in refs],
+        )
+    with _unadopted_lock:
+        for ref in refs:
+            if _unadopted.get(ref, 0) > 1:
+                _unadopted[ref] -= 1
+            else:
+                _unadopted.pop(ref, None)
+
+
+__all__ = ["BlobStore", "REF_PREFIX", "adopt_written"]
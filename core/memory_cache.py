@@ -0,0 +1,164 @@
+"""Read-through result cache for ``MemoryStore.get``/``get_relevant``.
+
+Prompt builders call ``get``/``get_relevant`` with the same arguments over and over; a hit
+skips SQLite and the JSON decoding of every row. Entries are keyed on the shard plus the
+call's arguments and stamped with:
+
+- the shard's in-process version counter, bumped by every add/update/delete/prune/import
+  (including the background reaper and compaction), and
+- the pooled connections' ``PRAGMA data_version`` of every file the call reads (the shard file
+  and its segments, see ``core.memory_segments``), which moves when another process commits
+  to that file.
+
+A stamp mismatch is a miss, so results are never served across a write. Entries also expire
+after ``MEMORY_CACHE_TTL`` seconds (recency scores drift with time) or when the first of their
+rows expires, and the cache is LRU-bounded to ``MEMORY_CACHE_MAX_BYTES`` of estimated item size.
+Hits return fresh ``MemoryItem`` copies, down to their tags, metadata and embedding, so callers
+may mutate them freely.
+
+Only the SQLite backend is cached; Postgres has no cheap cross-process change marker.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Sequence
+
+MEMORY_CACHE_ENABLED = os.getenv("MEMORY_CACHE_ENABLED", "true").lower() == "true"
+MEMORY_CACHE_MAX_BYTES = int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+MEMORY_CACHE_TTL = float(os.getenv("MEMORY_CACHE_TTL", "30"))  # seconds
+
+_ITEM_OVERHEAD = 400  # rough per-item cost of the dataclass, its dicts and lists
+
+
+def _fresh(item: Any) -> Any:
+    """A copy of ``item`` sharing nothing mutable with it (cheaper than ``deepcopy`` on embeddings)."""
+    clone = copy.copy(item)
+    clone.tags = list(item.tags)
+    clone.metadata = copy.deepcopy(item.metadata)
+    if item.embedding is not None:
+        clone.embedding = list(item.embedding)
+    return clone
+
+
+def _estimate_size(items: Sequence[Any]) -> int:
+    size = 64
+    for item in items:
+        size += _ITEM_OVERHEAD + len(item.text or "")
+        size += sum(len(t) for t in item.tags) + 64 * len(item.metadata)
+        size += 8 * len(item.embedding or ())
+    return size
+
+
+class _Entry:
+    __slots__ = ("shard", "stamp", "expires", "size", "items")
+
+    def __init__(self, shard: str, stamp: Hashable, expires: float, size: int, items: List[Any]) -> None:
+        self.shard = shard
+        self.stamp = stamp
+        self.expires = expires
+        self.size = size
+        self.items = items
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache of query results with per-shard version counters."""
+
+    def __init__(self, max_bytes: int = MEMORY_CACHE_MAX_BYTES, ttl: float = MEMORY_CACHE_TTL) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._by_shard: dict[str, set[Hashable]] = {}
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def version(self, shard: str) -> int:
+        with self._lock:
+            return self._versions.get(shard, 0)
+
+    def bump(self, shard: str) -> None:
+        """Record a write to ``shard``: its cached results are dropped."""
+        with self._lock:
+            self._versions[shard] = self._versions.get(shard, 0) + 1
+            for key in self._by_shard.pop(shard, ()):
+                self._drop_locked(key, shard_index=False)
+
+    def get(self, shard: str, key: Hashable, stamp: Hashable) -> List[Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.stamp != stamp or entry.expires <= time.time():
+                self._drop_locked(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            items = entry.items
+        return [_fresh(item) for item in items]
+
+    def put(self, shard: str, key: Hashable, stamp: Hashable, items: Sequence[Any]) -> None:
+        expires = time.time() + self.ttl
+        for item in items:
+            if item.expires_at is not None:
+                expires = min(expires, item.expires_at)
+        size = _estimate_size(items)
+        if size > self.max_bytes:
+            return
+        stored = [_fresh(item) for item in items]
+        with self._lock:
+            if key in self._entries:
+                self._drop_locked(key)
+            self._entries[key] = _Entry(shard, stamp, expires, size, stored)
+            self._by_shard.setdefault(shard, set()).add(key)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop_locked(oldest)
+                self.evictions += 1
+
+    def _drop_locked(self, key: Hashable, shard_index: bool = True) -> None:
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        if shard_index:
+            keys = self._by_shard.get(entry.shard)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_shard[entry.shard]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_shard.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache()
+
+__all__ = ["MEMORY_CACHE_ENABLED", "MEMORY_CACHE_MAX_BYTES", "MEMORY_CACHE_TTL", "ResultCache", "result_cache"]
@@ -0,0 +1,263 @@
+"""Append-only change log (CDC) for ``MemoryStore`` shards.
+
+Triggers on ``memory_entries`` append one ``memory_changes`` row per inserted, updated,
+soft-deleted or deleted entry, with a monotonic ``seq`` (never reused, also after trimming).
+Downstream caches, vector indexes and analytics keep a cursor and read only what changed::
+
+    batch = store.changes_since(cursor)
+    for change in batch:          # Change(seq, op, entry_id, agent_id, changed_at)
+        ...                       # re-read change.entry_id; it may be gone
+    cursor = batch.next_seq
+    if batch.truncated:           # retention dropped changes after the cursor: resync
+        ...
+
+``AsyncMemoryStore.subscribe`` yields the same batches as they appear.
+
+Ops are hints about what happened to an entry, not a replayable history: consumers should
+treat every change as "re-read this entry". That is what makes the log compactable
+(``compact_changes`` keeps only the newest change per entry). Retention is bounded by
+``MEMORY_CHANGES_RETENTION`` rows and ``MEMORY_CHANGES_MAX_AGE`` seconds per shard, enforced by
+the background reaper; a cursor older than the trimmed range gets ``truncated=True``.
+
+Setting ``MEMORY_CHANGE_LOG=false`` drops the triggers (writes no longer pay for the log).
+On Postgres one log covers the whole table; changes from transactions still in flight are
+held back so a cursor never skips a sequence number that commits late.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, List, Sequence
+
+from .memory_compression import unz_sql
+
+MEMORY_CHANGE_LOG = os.getenv("MEMORY_CHANGE_LOG", "true").lower() == "true"
+MEMORY_CHANGES_RETENTION = int(os.getenv("MEMORY_CHANGES_RETENTION", "100000"))  # newest rows kept per shard; 0 = unbounded
+MEMORY_CHANGES_MAX_AGE = float(os.getenv("MEMORY_CHANGES_MAX_AGE", str(7 * 86400)))  # seconds; 0 = any age
+MEMORY_CHANGES_POLL_INTERVAL = float(os.getenv("MEMORY_CHANGES_POLL_INTERVAL", "0.5"))  # subscribe() idle wait
+
+OPS = ("insert", "update", "soft_delete", "delete")
+
+_NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+# Only columns callers write; decay re-keying (decay_key/importance_at) is not a change.
+_WATCHED = "text, text_z, tags, importance, expires_at, source, metadata, metadata_z, blob_ref, deleted, embedding"
+_PLAIN_WATCHED = ("tags", "importance", "expires_at", "source", "blob_ref", "deleted", "embedding")
+
+
+def _changed_sql(compressed: bool) -> str:
+    """WHEN condition of the update trigger: some watched value really differs.
+
+    On a compressed shard, compressing a row in place (``compress_backlog``) rewrites text and
+    metadata without changing their values, so those are compared decompressed, and only when
+    their stored form moved at all. Uncompressed shards keep plain comparisons, so connections
+    that never registered ``memory_unz()`` can still write to them.
+    """
+    checks = [f"old.{c} IS NOT new.{c}" for c in _PLAIN_WATCHED]
+    for c in ("text", "metadata"):
+        moved = f"old.{c} IS NOT new.{c} OR old.{c}_z IS NOT new.{c}_z"
+        checks.append(f"(({moved}) AND {unz_sql(c, 'old.')} IS NOT {unz_sql(c, 'new.')})" if compressed else moved)
+    return " OR ".join(checks)
+
+
+def _triggers(compressed: bool) -> dict[str, str]:
+    return {
+        "memory_changes_ai": (
+            "AFTER INSERT ON memory_entries BEGIN "
+            f"INSERT INTO memory_changes(op, entry_id, agent_id, changed_at) VALUES ('insert', new.id, new.agent_id, {_NOW_SQL}); END"
+        ),
+        "memory_changes_au": (
+            f"AFTER UPDATE OF {_WATCHED} ON memory_entries WHEN {_changed_sql(compressed)} BEGIN "
+            "INSERT INTO memory_changes(op, entry_id, agent_id, changed_at) VALUES ("
+            "CASE WHEN new.deleted = 1 AND COALESCE(old.deleted, 0) = 0 THEN 'soft_delete' ELSE 'update' END, "
+            f"new.id, new.agent_id, {_NOW_SQL}); END"
+        ),
+        "memory_changes_ad": (
+            "AFTER DELETE ON memory_entries BEGIN "
+            f"INSERT INTO memory_changes(op, entry_id, agent_id, changed_at) VALUES ('delete', old.id, old.agent_id, {_NOW_SQL}); END"
+        ),
+    }
+
+
+@dataclass(frozen=True)
+class Change:
+    seq: int
+    op: str  # one of OPS
+    entry_id: str
+    agent_id: str | None
+    changed_at: float
+
+
+class ChangeBatch(List[Change]):
+    """Changes after a cursor, oldest first.
+
+    ``next_seq`` is the cursor for the next call. ``truncated`` means retention already dropped
+    changes after the requested cursor, so the consumer has to resync from a full read.
+    """
+
+    def __init__(self, items: Sequence[Change] = (), next_seq: int = 0, truncated: bool = False) -> None:
+        super().__init__(items)
+        self.next_seq = next_seq
+        self.truncated = truncated
+
+
+def ensure_change_triggers(conn: sqlite3.Connection, enabled: bool | None = None, *, compressed: bool = False) -> None:
+    """Create (or, with ``MEMORY_CHANGE_LOG=false``, drop) the change-log triggers (idempotent).
+
+    ``compressed``: the shard stores compressed values (see ``ensure_compression``). A trigger
+    whose definition changed since the shard was created is replaced.
+    """
+    current = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'memory_changes_%'"))
+    for name, body in _triggers(compressed).items():
+        if MEMORY_CHANGE_LOG if enabled is None else enabled:
+            if current.get(name) != f"CREATE TRIGGER {name} {body}":
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+                conn.execute(f"CREATE TRIGGER {name} {body}")
+        elif name in current:
+            conn.execute(f"DROP TRIGGER {name}")
+
+
+def log_changes(conn: sqlite3.Connection, changes: Sequence[tuple[str, str, str | None]]) -> None:
+    """Append ``(op, entry_id, agent_id)`` changes made outside this file (see ``core.memory_segments``)."""
+    if not MEMORY_CHANGE_LOG or not changes:
+        return
+    now = time.time()
+    conn.executemany(
+        "INSERT INTO memory_changes(op, entry_id, agent_id, changed_at) VALUES (?, ?, ?, ?)",
+        [(op, entry_id, agent_id, now) for op, entry_id, agent_id in changes],
+    )
+    conn.commit()
+
+
+def _trimmed_through(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM memory_settings WHERE key = 'changes_trimmed_through'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def changes_since(conn: sqlite3.Connection, seq: int, limit: int, agent_id: str | None = None) -> ChangeBatch:
+    upper = latest_seq(conn)  # read first, so a commit racing this call is picked up next time
+    sql = "SELECT seq, op, entry_id, agent_id, changed_at FROM memory_changes WHERE seq > ? AND seq <= ?"
+    params: list[Any] = [seq, upper]
+    if agent_id is not None:
+        sql += " AND agent_id = ?"
+        params.append(agent_id)
+    rows = conn.execute(sql + " ORDER BY seq LIMIT ?", (*params, limit)).fetchall()
+    changes = [Change(*row) for row in rows]
+    if len(changes) < limit:
+        next_seq = max(seq, upper)  # also skips other agents' changes when filtering
+    else:
+        next_seq = changes[-1].seq
+    return ChangeBatch(changes, next_seq, seq < _trimmed_through(conn))
+
+
+def latest_seq(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'memory_changes'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def trim_changes(
+    conn: sqlite3.Connection, retention: int | None = None, max_age: float | None = None, now: float | None = None
+) -> int:
+    """Drop changes beyond the retention bounds; returns the number removed."""
+    retention = MEMORY_CHANGES_RETENTION if retention is None else retention
+    max_age = MEMORY_CHANGES_MAX_AGE if max_age is None else max_age
+    latest = latest_seq(conn)
+    through = latest - retention if retention else 0
+    if max_age:
+        cutoff = (now or time.time()) - max_age
+        # Walks the primary key from the oldest row and stops at the first one young enough.
+        young = conn.execute(
+            "SELECT seq FROM memory_changes WHERE changed_at >= ? ORDER BY seq LIMIT 1", (cutoff,)
+        ).fetchone()
+        through = max(through, (young[0] - 1) if young else latest)
+    if through <= _trimmed_through(conn):
+        return 0
+    removed = conn.execute("DELETE FROM memory_changes WHERE seq <= ?", (through,)).rowcount
+    conn.execute("INSERT OR REPLACE INTO memory_settings (key, value) VALUES ('changes_trimmed_through', ?)", (through,))
+    conn.commit()
+    return removed
+
+
+def compact_changes(conn: sqlite3.Connection) -> int:
+    """Keep only the newest change per entry; returns the number removed."""
+    removed = conn.execute(
+        "DELETE FROM memory_changes WHERE seq < "
+        "(SELECT max(c.seq) FROM memory_changes c WHERE c.entry_id = memory_changes.entry_id)"
+    ).rowcount
+    conn.commit()
+    return removed
+
+
+# ---------- Postgres ----------
+
+async def ensure_change_log_pg(conn: Any) -> None:
+    await conn.execute(f"ALTER TABLE memory_entries {'ENABLE' if MEMORY_CHANGE_LOG else 'DISABLE'} TRIGGER memory_changes_log")
+
+
+async def _trimmed_through_pg(conn: Any) -> int:
+    value = await conn.fetchval("SELECT value FROM memory_settings WHERE key = 'changes_trimmed_through'")
+    return int(value or 0)
+
+
+async def changes_since_pg(conn: Any, seq: int, limit: int, agent_id: str | None = None) -> ChangeBatch:
+    # Sequence numbers are handed out before commit; stop at the first change whose transaction
+    # may still be running so a concurrent, later-committing writer is never skipped.
+    sql = (
+        "SELECT seq, op, entry_id::text AS entry_id, agent_id, changed_at, "
+        "txid < pg_snapshot_xmin(pg_current_snapshot()) AS settled FROM memory_changes WHERE seq > $1"
+    )
+    args: list[Any] = [seq]
+    if agent_id is not None:
+        sql += " AND agent_id = $2"
+        args.append(agent_id)
+    rows = await conn.fetch(sql + f" ORDER BY seq LIMIT ${len(args) + 1}", *args, limit)
+    changes: list[Change] = []
+    for row in rows:
+        if not row["settled"]:
+            break
+        changes.append(Change(row["seq"], row["op"], row["entry_id"], row["agent_id"], row["changed_at"]))
+    return ChangeBatch(changes, changes[-1].seq if changes else seq, seq < await _trimmed_through_pg(conn))
+
+
+async def trim_changes_pg(conn: Any, retention: int | None = None, max_age: float | None = None) -> int:
+    retention = MEMORY_CHANGES_RETENTION if retention is None else retention
+    max_age = MEMORY_CHANGES_MAX_AGE if max_age is None else max_age
+    latest = int(await conn.fetchval("SELECT COALESCE(max(seq), 0) FROM memory_changes"))
+    through = latest - retention if retention else 0
+    if max_age:
+        young = await conn.fetchval(
+            "SELECT seq FROM memory_changes WHERE changed_at >= $1 ORDER BY seq LIMIT 1", time.time() - max_age
+        )
+        through = max(through, (young - 1) if young else latest)
+    if through <= await _trimmed_through_pg(conn):
+        return 0
+    async with conn.transaction():
+        status = await conn.execute("DELETE FROM memory_changes WHERE seq <= $1", through)
+        await conn.execute(
+            "INSERT INTO memory_settings (key, value) VALUES ('changes_trimmed_through', $1) "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+            float(through),
+        )
+    return int(status.split()[-1])
+
+
+__all__ = [
+    "Change",
+    "ChangeBatch",
+    "MEMORY_CHANGE_LOG",
+    "MEMORY_CHANGES_MAX_AGE",
+    "MEMORY_CHANGES_POLL_INTERVAL",
+    "MEMORY_CHANGES_RETENTION",
+    "OPS",
+    "changes_since",
+    "changes_since_pg",
+    "compact_changes",
+    "ensure_change_log_pg",
+    "ensure_change_triggers",
+    "latest_seq",
+    "log_changes",
+    "trim_changes",
+    "trim_changes_pg",
+]
@@ -0,0 +1,397 @@
+"""Transparent compression of ``memory_entries.text`` and ``metadata`` for SQLite shards.
+
+With ``MEMORY_COMPRESSION`` enabled, values of at least ``MEMORY_COMPRESSION_MIN_BYTES`` are
+stored compressed in ``text_z`` / ``metadata_z`` (the plain column is then NULL). Small entries
+compress poorly on their own, so each shard can train a dictionary from a sample of its rows
+(``MemoryStore.train_compression_dictionary``, or the reaper once a shard has enough rows);
+with a dictionary, values from ``MEMORY_COMPRESSION_DICT_MIN_BYTES`` up are compressed too.
+Writes pick up a dictionary trained by another process within ``MEMORY_COMPRESSION_DICT_RECHECK``
+seconds.
+Values that do not shrink by at least 10% stay plain.
+
+zstd is used when the ``zstandard`` package is installed, otherwise zlib (with the trained
+dictionary as its preset dictionary). Every value carries a header naming its codec and
+dictionary, so rows written by either codec, or before a newer dictionary, stay readable.
+
+The FTS index is still built from the uncompressed text: once a shard holds compressed rows its
+FTS triggers decompress through the ``memory_unz()`` SQL function, which every pooled connection
+registers. Other connections writing to such a shard must register it too (``register_functions``).
+Metadata filters read compressed metadata through the same function; hot keys
+(``MEMORY_METADATA_INDEX_KEYS``) are also kept plain in ``metadata`` so their indexes still apply.
+
+Postgres compresses large values itself (TOAST); with ``MEMORY_COMPRESSION`` the ``text`` and
+``metadata`` columns are switched to lz4 where the server supports it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any
+
+from . import memory_metadata
+
+try:  # optional zstd
+    import zstandard  # type: ignore
+except Exception:  # pragma: no cover
+    zstandard = None  # type: ignore
+
+MEMORY_COMPRESSION = os.getenv("MEMORY_COMPRESSION", "false").lower() == "true"
+MEMORY_COMPRESSION_LEVEL = int(os.getenv("MEMORY_COMPRESSION_LEVEL", "3"))
+MEMORY_COMPRESSION_MIN_BYTES = int(os.getenv("MEMORY_COMPRESSION_MIN_BYTES", "512"))  # without a dictionary
+MEMORY_COMPRESSION_DICT_MIN_BYTES = int(os.getenv("MEMORY_COMPRESSION_DICT_MIN_BYTES", "64"))  # with a dictionary
+MEMORY_COMPRESSION_DICT_MAX_BYTES = int(os.getenv("MEMORY_COMPRESSION_DICT_MAX_BYTES", "8192"))  # larger values skip it
+MEMORY_COMPRESSION_DICT_SIZE = int(os.getenv("MEMORY_COMPRESSION_DICT_SIZE", str(16 * 1024)))
+MEMORY_COMPRESSION_DICT_SAMPLES = int(os.getenv("MEMORY_COMPRESSION_DICT_SAMPLES", "2000"))  # rows sampled for training
+MEMORY_COMPRESSION_DICT_MIN_SAMPLES = int(os.getenv("MEMORY_COMPRESSION_DICT_MIN_SAMPLES", "200"))
+MEMORY_COMPRESSION_DICT_RECHECK = float(os.getenv("MEMORY_COMPRESSION_DICT_RECHECK", "1.0"))  # seconds between memory_dicts checks
+
+CODEC = "zstd" if zstandard is not None else "zlib"
+
+_CODEC_IDS = {"zstd": 1, "zlib": 2}
+_CODEC_NAMES = {v: k for k, v in _CODEC_IDS.items()}
+_HEADER = struct.Struct(">BII")  # codec id, dictionary id (0 = none), uncompressed length
+_MIN_SAVING = 0.9  # keep the compressed form only below this fraction of the original size
+_ZLIB_WINDOW = 32 * 1024  # zlib only looks back this far into a preset dictionary
+
+# Lazy, so rows that were never compressed do not call into Python.
+_UNZ_SQL = "(CASE WHEN {0}{1}_z IS NULL THEN {0}{1} ELSE memory_unz({0}{1}_z) END)"
+
+
+def unz_sql(column: str, alias: str = "") -> str:
+    """SQL for the plain value of ``text`` or ``metadata`` whether or not the row is compressed."""
+    return _UNZ_SQL.format(alias, column)
+
+
+_FTS_TRIGGERS = {
+    "memory_entries_ai": (
+        "AFTER INSERT ON memory_entries BEGIN "
+        f"INSERT INTO fts_entries(rowid, text) VALUES (new.rowid, {unz_sql('text', 'new.')}); END"
+    ),
+    "memory_entries_ad": (
+        "AFTER DELETE ON memory_entries BEGIN "
+        f"INSERT INTO fts_entries(fts_entries, rowid, text) VALUES ('delete', old.rowid, {unz_sql('text', 'old.')}); END"
+    ),
+    # Compressing a row in place leaves its text as it was: skip the re-index.
+    "memory_entries_au": (
+        f"AFTER UPDATE OF text, text_z ON memory_entries WHEN {unz_sql('text', 'old.')} IS NOT {unz_sql('text', 'new.')} "
+        f"BEGIN INSERT INTO fts_entries(fts_entries, rowid, text) VALUES ('delete', old.rowid, {unz_sql('text', 'old.')}); "
+        f"INSERT INTO fts_entries(rowid, text) VALUES (new.rowid, {unz_sql('text', 'new.')}); END"
+    ),
+}
+
+
+def _compress(codec: str, data: bytes, dictionary: bytes | None) -> bytes:
+    if codec == "zstd":
+        zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdCompressor(level=MEMORY_COMPRESSION_LEVEL, dict_data=zdict).compress(data)
+    level = min(MEMORY_COMPRESSION_LEVEL, 9)
+    obj = zlib.compressobj(level, zdict=dictionary) if dictionary else zlib.compressobj(level)
+    return obj.compress(data) + obj.flush()
+
+
+def _decompress(codec: str, data: bytes, dictionary: bytes | None, size: int) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("value was compressed with zstd; install the zstandard package to read it")
+        zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        return zstandard.ZstdDecompressor(dict_data=zdict).decompress(data, max_output_size=size)
+    obj = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+    return obj.decompress(data) + obj.flush()
+
+
+def _train(samples: list[bytes]) -> bytes:
+    if CODEC == "zstd":
+        return zstandard.train_dictionary(MEMORY_COMPRESSION_DICT_SIZE, samples).as_bytes()
+    # zlib has no trainer; its preset dictionary is simply text likely to recur, most useful last.
+    return b"".join(samples)[-min(MEMORY_COMPRESSION_DICT_SIZE, _ZLIB_WINDOW):]
+
+
+class ShardCodec:
+    """Compresses and decompresses one shard's values; holds its dictionaries and read-cost counters."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._dicts: dict[int, tuple[str, bytes]] = {}
+        self._active: int | None = None  # newest dictionary of CODEC
+        self._newest = 0  # max(memory_dicts.id) as of the last load
+        self._checked_at = float("-inf")
+        self.decompressions = 0
+        self.decompress_seconds = 0.0
+
+    def load(self, conn: sqlite3.Connection) -> None:
+        rows = conn.execute("SELECT id, codec, data FROM memory_dicts ORDER BY id").fetchall()
+        with self._lock:
+            for dict_id, codec, data in rows:
+                self._dicts[dict_id] = (codec, bytes(data))
+                if codec == CODEC:
+                    self._active = dict_id
+            self._newest = rows[-1][0] if rows else 0
+            self._checked_at = time.monotonic()
+
+    def refresh(self, conn: sqlite3.Connection) -> None:
+        """Load dictionaries trained since the last load (by another process, say); checks at most
+        once per ``MEMORY_COMPRESSION_DICT_RECHECK`` seconds."""
+        if time.monotonic() - self._checked_at < MEMORY_COMPRESSION_DICT_RECHECK:
+            return
+        newest = conn.execute("SELECT coalesce(max(id), 0) FROM memory_dicts").fetchone()[0]
+        if newest != self._newest:
+            self.load(conn)
+        else:
+            self._checked_at = time.monotonic()
+
+    def _dictionary(self, dict_id: int, conn: sqlite3.Connection | None = None) -> tuple[str, bytes]:
+        with self._lock:
+            found = self._dicts.get(dict_id)
+        if found is None and conn is not None:  # trained by another process since we loaded
+            self.load(conn)
+            with self._lock:
+                found = self._dicts.get(dict_id)
+        if found is None:
+            raise LookupError(f"compression dictionary {dict_id} of {self.path} is not in memory_dicts")
+        return found
+
+    def compress(self, value: str, conn: sqlite3.Connection | None = None) -> bytes | None:
+        """The stored form of ``value``, or None when it should stay plain.
+
+        ``conn``: a connection to this shard, through which a newer dictionary is picked up.
+        """
+        if conn is not None:
+            self.refresh(conn)
+        data = value.encode("utf-8")
+        dict_id = self._active if len(data) < MEMORY_COMPRESSION_DICT_MAX_BYTES else None
+        if len(data) < (MEMORY_COMPRESSION_DICT_MIN_BYTES if dict_id else MEMORY_COMPRESSION_MIN_BYTES):
+            return None
+        dictionary = self._dictionary(dict_id)[1] if dict_id else None
+        packed = _HEADER.pack(_CODEC_IDS[CODEC], dict_id or 0, len(data)) + _compress(CODEC, data, dictionary)
+        return packed if len(packed) < len(data) * _MIN_SAVING else None
+
+    def decompress(self, packed: bytes, conn: sqlite3.Connection | None = None) -> str:
+        """``conn``: a connection to this shard (or a copy of it) to load a dictionary it has not seen."""
+        start = time.perf_counter()
+        codec_id, dict_id, size = _HEADER.unpack_from(packed)
+        dictionary = self._dictionary(dict_id, conn)[1] if dict_id else None
+        data = _decompress(_CODEC_NAMES[codec_id], packed[_HEADER.size:], dictionary, size)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.decompressions += 1
+            self.decompress_seconds += elapsed
+        return data.decode("utf-8")
+
+    def encode_text(self, text: str | None, conn: sqlite3.Connection | None = None) -> tuple[str | None, bytes | None]:
+        """``(text, text_z)`` column values."""
+        if not MEMORY_COMPRESSION or not text:
+            return text, None
+        packed = self.compress(text, conn)
+        return (text, None) if packed is None else (None, packed)
+
+    def encode_metadata(
+        self, metadata: dict[str, Any], conn: sqlite3.Connection | None = None
+    ) -> tuple[str, bytes | None]:
+        """``(metadata, metadata_z)`` column values; hot keys stay readable in ``metadata``."""
+        plain = json.dumps(metadata)
+        if not MEMORY_COMPRESSION or not metadata:
+            return plain, None
+        packed = self.compress(plain, conn)
+        if packed is None:
+            return plain, None
+        hot = {k: metadata[k] for k in memory_metadata.MEMORY_METADATA_INDEX_KEYS if k in metadata}
+        return json.dumps(hot), packed
+
+    def decode(self, plain: str | None, packed: bytes | None, conn: sqlite3.Connection | None = None) -> str | None:
+        return plain if packed is None else self.decompress(packed, conn)
+
+    def train(self, conn: sqlite3.Connection, samples: int | None = None) -> int | None:
+        """Train a dictionary from this shard's smaller entries; returns its id (None: too few rows)."""
+        limit = samples or MEMORY_COMPRESSION_DICT_SAMPLES
+        rows = conn.execute(
+            f"SELECT {unz_sql('text')} FROM memory_entries WHERE deleted = 0 "
+            "AND length(coalesce(text, '')) < ? ORDER BY rowid DESC LIMIT ?",
+            (MEMORY_COMPRESSION_DICT_MAX_BYTES, limit),
+        ).fetchall()
+        corpus = [r[0].encode("utf-8") for r in reversed(rows) if r[0]]
+        if len(corpus) < MEMORY_COMPRESSION_DICT_MIN_SAMPLES:
+            return None
+        data = _train(corpus)
+        cur = conn.execute(
+            "INSERT INTO memory_dicts (codec, data, samples, created_at) VALUES (?, ?, ?, ?)",
+            (CODEC, data, len(corpus), time.time()),
+        )
+        # Plain rows written before the dictionary get another look from the backlog pass.
+        conn.execute("INSERT OR REPLACE INTO memory_settings (key, value) VALUES ('compression_scanned_through', 0)")
+        conn.commit()
+        with self._lock:
+            self._dicts[cur.lastrowid] = (CODEC, data)
+            self._active = cur.lastrowid
+            self._newest = max(self._newest, cur.lastrowid)
+        return cur.lastrowid
+
+    @property
+    def has_dictionary(self) -> bool:
+        return self._active is not None
+
+    def read_stats(self) -> dict[str, Any]:
+        with self._lock:
+            calls, seconds = self.decompressions, self.decompress_seconds
+        return {
+            "decompressions": calls,
+            "decompress_ms": round(seconds * 1000.0, 3),
+            "decompress_us_avg": round(seconds * 1e6 / calls, 2) if calls else 0.0,
+        }
+
+
+_codecs: dict[str, ShardCodec] = {}
+_codec_keys: dict[tuple[str, str], str] = {}  # (cwd, path as given) -> resolved path
+_codecs_lock = threading.Lock()
+
+
+def _codec_key(path: Any) -> str:
+    # Connections name their file by its absolute path, the store by a path that may be relative
+    # to the working directory: both must find the same codec.
+    raw = str(path)
+    cwd = "" if os.path.isabs(raw) else os.getcwd()
+    key = _codec_keys.get((cwd, raw))
+    if key is None:
+        key = _codec_keys[(cwd, raw)] = str(Path(raw).resolve())
+    return key
+
+
+def codec_for(path: Any) -> ShardCodec:
+    key = _codec_key(path)
+    with _codecs_lock:
+        codec = _codecs.get(key)
+        if codec is None:
+            codec = _codecs[key] = ShardCodec(key)
+        return codec
+
+
+def register_functions(conn: sqlite3.Connection, path: Any = None) -> ShardCodec:
+    """Register ``memory_unz()`` on ``conn`` for the shard file it has open (or ``path``, for a copy); returns that shard's codec."""
+    codec = codec_for(path or conn.execute("PRAGMA database_list").fetchone()[2])
+    # A dictionary missing from the codec is loaded through ``conn`` itself, also mid-query.
+    conn.create_function(
+        "memory_unz", 1, lambda packed: codec.decompress(packed, conn) if packed is not None else None, deterministic=True
+    )
+    return codec
+
+
+def _enabled_in(conn: sqlite3.Connection) -> bool:
+    return conn.execute("SELECT 1 FROM memory_settings WHERE key = 'compression'").fetchone() is not None
+
+
+def ensure_compression(conn: sqlite3.Connection) -> bool:
+    """Load dictionaries and, once compression is on for the shard, switch its FTS triggers (idempotent).
+
+    A shard that has been compressed keeps the decompressing triggers even if
+    ``MEMORY_COMPRESSION`` is turned off later, as its compressed rows remain. Returns whether
+    compression is on for the shard.
+    """
+    codec_for(conn.execute("PRAGMA database_list").fetchone()[2]).load(conn)
+    if not (MEMORY_COMPRESSION or _enabled_in(conn)):
+        return False
+    conn.execute("INSERT OR IGNORE INTO memory_settings (key, value) VALUES ('compression', 1)")
+    current = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'memory_entries_a_'"))
+    for name, body in _FTS_TRIGGERS.items():
+        if "memory_unz" not in (current.get(name) or ""):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+            conn.execute(f"CREATE TRIGGER {name} {body}")
+    return True
+
+
+def compress_backlog(conn: sqlite3.Connection, codec: ShardCodec, batch: int) -> int:
+    """Compress up to ``batch`` plain rows not yet looked at; returns the number compressed.
+
+    Walks the table by rowid from a watermark in ``memory_settings`` (new rows are compressed on
+    write), so each pass costs one small range scan.
+    """
+    if not MEMORY_COMPRESSION:
+        return 0
+    row = conn.execute("SELECT value FROM memory_settings WHERE key = 'compression_scanned_through'").fetchone()
+    start = int(row[0]) if row else 0
+    rows = conn.execute(
+        "SELECT rowid, text, metadata FROM memory_entries WHERE rowid > ? AND text_z IS NULL ORDER BY rowid LIMIT ?",
+        (start, batch),
+    ).fetchall()
+    if not rows:
+        return 0
+    updates = []
+    for rowid, text, metadata in rows:
+        text, text_z = codec.encode_text(text, conn)
+        try:
+            meta, meta_z = codec.encode_metadata(json.loads(metadata) if metadata else {}, conn)
+        except ValueError:
+            meta, meta_z = metadata, None
+        if text_z is not None or meta_z is not None:
+            updates.append((text, text_z, meta, meta_z, rowid))
+    conn.executemany("UPDATE memory_entries SET text = ?, text_z = ?, metadata = ?, metadata_z = ? WHERE rowid = ?", updates)
+    conn.execute(
+        "INSERT OR REPLACE INTO memory_settings (key, value) VALUES ('compression_scanned_through', ?)", (rows[-1][0],)
+    )
+    conn.commit()
+    return len(updates)
+
+
+def compression_stats(conn: sqlite3.Connection, codec: ShardCodec) -> dict[str, Any]:
+    """Stored vs. uncompressed size of the compressed values, plus the decompression cost so far."""
+    total = conn.execute("SELECT count(*) FROM memory_entries").fetchone()[0]
+    compressed = raw = stored = 0
+    for head_t, len_t, head_m, len_m in conn.execute(
+        "SELECT substr(text_z, 1, 9), length(text_z), substr(metadata_z, 1, 9), length(metadata_z) "
+        "FROM memory_entries WHERE text_z IS NOT NULL OR metadata_z IS NOT NULL"
+    ):
+        compressed += 1
+        for head, size in ((head_t, len_t), (head_m, len_m)):
+            if head is not None:
+                raw += _HEADER.unpack_from(head)[2]
+                stored += size
+    dictionaries = conn.execute("SELECT count(*) FROM memory_dicts").fetchone()[0]
+    return {
+        "enabled": MEMORY_COMPRESSION or _enabled_in(conn),
+        "codec": CODEC,
+        "rows": total,
+        "compressed_rows": compressed,
+        "raw_bytes": raw,
+        "stored_bytes": stored,
+        "ratio": round(raw / stored, 3) if stored else 1.0,
+        "dictionaries": dictionaries,
+        **codec.read_stats(),
+    }
+
+
+async def ensure_compression_pg(conn: Any) -> None:
+    if not MEMORY_COMPRESSION:
+        return
+    for column in ("text", "metadata"):
+        try:  # Postgres >= 14 built with lz4
+            await conn.execute(f"ALTER TABLE memory_entries ALTER COLUMN {column} SET COMPRESSION lz4")
+        except Exception:
+            pass  # pglz (the default) still compresses large values
+
+
+__all__ = [
+    "CODEC",
+    "MEMORY_COMPRESSION",
+    "MEMORY_COMPRESSION_DICT_MAX_BYTES",
+    "MEMORY_COMPRESSION_DICT_MIN_BYTES",
+    "MEMORY_COMPRESSION_DICT_MIN_SAMPLES",
+    "MEMORY_COMPRESSION_DICT_RECHECK",
+    "MEMORY_COMPRESSION_DICT_SAMPLES",
+    "MEMORY_COMPRESSION_DICT_SIZE",
+    "MEMORY_COMPRESSION_LEVEL",
+    "MEMORY_COMPRESSION_MIN_BYTES",
+    "ShardCodec",
+    "codec_for",
+    "compress_backlog",
+    "compression_stats",
+    "ensure_compression",
+    "ensure_compression_pg",
+    "register_functions",
+    "unz_sql",
+]
@@ -0,0 +1,152 @@
+"""Streaming NDJSON / Arrow IPC serialization for memory dumps.
+
+``MemoryStore.export_stream``/``import_stream`` move rows in batches of ``MEMORY_EXPORT_BATCH``
+through the writers and readers here, so a dump of any size is held in memory one batch at a
+time. Rows are the same dicts ``dump_all`` returns (``MemoryItem`` fields without ``score``).
+
+- ``ndjson``: one JSON object per line, UTF-8
+- ``arrow``:  an Arrow IPC stream of record batches (requires ``pyarrow``); ``metadata`` is
+  stored as a JSON string because its keys differ from row to row
+"""
+
+from __future__ import annotations
+
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Any, BinaryIO, Callable, Iterable, Iterator, Union
+
+try:  # optional Arrow IPC support
+    import pyarrow as pa  # type: ignore
+    import pyarrow.ipc  # type: ignore  # noqa: F401
+except Exception:  # pragma: no cover
+    pa = None  # type: ignore
+
+MEMORY_EXPORT_BATCH = int(os.getenv("MEMORY_EXPORT_BATCH", "5000"))  # rows per batch
+
+FORMATS = ("ndjson", "arrow")
+
+Target = Union[str, Path, BinaryIO, IO[bytes]]
+Progress = Callable[[int], None]
+
+
+def _arrow_schema() -> Any:
+    return pa.schema(
+        [
+            ("id", pa.string()),
+            ("agent_id", pa.string()),
+            ("text", pa.string()),
+            ("tags", pa.list_(pa.string())),
+            ("importance", pa.float64()),
+            ("created_at", pa.float64()),
+            ("expires_at", pa.float64()),
+            ("source", pa.string()),
+            ("metadata", pa.string()),
+            ("blob_ref", pa.string()),
+            ("deleted", pa.bool_()),
+            ("embedding", pa.list_(pa.float32())),
+        ]
+    )
+
+
+def _check_format(fmt: str) -> None:
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown dump format {fmt!r}; expected one of {FORMATS}")
+    if fmt == "arrow" and pa is None:
+        raise RuntimeError("Arrow dumps require pyarrow")
+
+
+def batched(rows: Iterable[dict[str, Any]], size: int) -> Iterator[list[dict[str, Any]]]:
+    batch: list[dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def _open(target: Target, mode: str) -> Iterator[Any]:
+    if isinstance(target, (str, Path)):
+        with open(target, mode) as f:
+            yield f
+    else:
+        yield target  # caller owns the stream
+
+
+@contextmanager
+def open_writer(dest: Target, fmt: str = "ndjson") -> Iterator[Callable[[list[dict[str, Any]]], None]]:
+    """Yield a function that appends one batch of rows to ``dest``."""
+    _check_format(fmt)
+    with _open(dest, "wb") as out:
+        if fmt == "ndjson":
+            def write(batch: list[dict[str, Any]]) -> None:
+                out.write("".join(json.dumps(row, separators=(",", ":")) + "\n" for row in batch).encode("utf-8"))
+
+            yield write
+            return
+        schema = _arrow_schema()
+        with pa.ipc.new_stream(out, schema) as writer:
+            def write_arrow(batch: list[dict[str, Any]]) -> None:
+                rows = [dict(row, metadata=json.dumps(row.get("metadata") or {})) for row in batch]
+                writer.write_batch(pa.RecordBatch.from_pylist(rows, schema=schema))
+
+            yield write_arrow
+
+
+def read_batches(src: Target, fmt: str = "ndjson", batch_size: int | None = None) -> Iterator[list[dict[str, Any]]]:
+    """Rows of a dump in batches of at most ``batch_size``."""
+    _check_format(fmt)
+    batch_size = batch_size or MEMORY_EXPORT_BATCH
+    with _open(src, "rb") as f:
+        if fmt == "ndjson":
+            text = io.TextIOWrapper(f, encoding="utf-8")
+            try:
+                lines = (line for line in text if line.strip())
+                yield from batched((json.loads(line) for line in lines), batch_size)
+            finally:
+                text.detach()  # leave a caller-owned stream open
+            return
+        reader = pa.ipc.open_stream(f)
+        for record_batch in reader:
+            rows = record_batch.to_pylist()
+            for row in rows:
+                row["metadata"] = json.loads(row["metadata"]) if row.get("metadata") else {}
+            yield from batched(rows, batch_size)
+
+
+class Transfer:
+    """Row counter for one export/import that feeds the progress callback and builds the report."""
+
+    def __init__(self, direction: str, fmt: str, progress: Progress | None = None) -> None:
+        self.direction = direction
+        self.fmt = fmt
+        self.progress = progress
+        self.rows = 0
+        self.batches = 0
+        self._start = time.perf_counter()
+
+    def add(self, count: int) -> None:
+        self.rows += count
+        self.batches += 1
+        if self.progress is not None:
+            self.progress(self.rows)
+
+    def report(self) -> dict[str, Any]:
+        elapsed = time.perf_counter() - self._start
+        return {
+            "direction": self.direction,
+            "format": self.fmt,
+            "rows": self.rows,
+            "batches": self.batches,
+            "seconds": round(elapsed, 4),
+            "rows_per_sec": round(self.rows / elapsed, 1) if elapsed else None,
+        }
+
+
+__all__ = ["FORMATS", "MEMORY_EXPORT_BATCH", "Transfer", "batched", "open_writer", "read_batches"]
@@ -0,0 +1,142 @@
+"""Indexed metadata filters for ``MemoryStore``.
+
+A ``metadata_filter`` maps metadata keys to conditions::
+
+    {"status": "open"}                    # typed equality (1 != "1")
+    {"priority": {">=": 2, "<": 5}}       # range; operators: == != < <= > >= in
+    {"owner": None}                       # key missing or null
+
+SQLite evaluates conditions with JSON1 ``json_extract``. Keys listed in
+``MEMORY_METADATA_INDEX_KEYS`` ("hot keys", e.g. ``status,priority``) are additionally
+materialized per shard as virtual generated columns ``meta_<key>`` with a B-tree index (an
+expression index on SQLite builds older than 3.31), so filters on them run at index speed.
+
+Postgres uses JSONB containment (``metadata @> ...``, GIN index) for equality and ``metadata->key``
+comparisons for ranges, with an expression index per hot key.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+from typing import Any, Callable
+
+_KEY_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+MEMORY_METADATA_INDEX_KEYS = tuple(
+    k.strip() for k in os.getenv("MEMORY_METADATA_INDEX_KEYS", "").split(",") if _KEY_RE.match(k.strip())
+)
+
+# ALTER TABLE ... ADD COLUMN ... GENERATED ALWAYS needs SQLite 3.31.
+_GENERATED_COLUMNS = sqlite3.sqlite_version_info >= (3, 31, 0)
+
+_OPERATORS = {"==": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">=", "in": "IN"}
+
+
+def _extract(key: str, alias: str = "") -> str:
+    # Written out literally so that queries match the expression index / generated column definition.
+    return f"(CASE WHEN json_valid({alias}metadata) THEN json_extract({alias}metadata, '$.{key}') END)"
+
+
+def _is_hot(key: str) -> bool:
+    return key in MEMORY_METADATA_INDEX_KEYS
+
+
+def ensure_hot_columns(conn: sqlite3.Connection) -> None:
+    """Create missing generated columns and indexes for the configured hot keys (idempotent)."""
+    if not MEMORY_METADATA_INDEX_KEYS:
+        return
+    columns = {r[1] for r in conn.execute("PRAGMA table_xinfo(memory_entries)")}
+    for key in MEMORY_METADATA_INDEX_KEYS:
+        if _GENERATED_COLUMNS:
+            if f"meta_{key}" not in columns:
+                conn.execute(f"ALTER TABLE memory_entries ADD COLUMN meta_{key} GENERATED ALWAYS AS {_extract(key)} VIRTUAL")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_memory_meta_{key} ON memory_entries(meta_{key})")
+        else:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_memory_meta_{key} ON memory_entries({_extract(key)})")
+
+
+def _operand(value: Any) -> Any:
+    """Python value as ``json_extract`` returns it: scalars as-is, bools as 0/1, containers as JSON text."""
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(",", ":"))
+    return value
+
+
+def _conditions(value: Any) -> list[tuple[str, Any]]:
+    if isinstance(value, dict) and value and all(op in _OPERATORS for op in value):
+        return list(value.items())
+    return [("==", value)]
+
+
+def metadata_clauses(metadata_filter: dict[str, Any], alias: str = "e.") -> tuple[list[str], list[Any]]:
+    """SQLite clauses (and parameters) for ``metadata_filter`` over ``memory_entries <alias>``."""
+    clauses: list[str] = []
+    params: list[Any] = []
+    for key, value in metadata_filter.items():
+        if _is_hot(key):
+            expr = f"{alias}meta_{key}" if _GENERATED_COLUMNS else _extract(key, alias)
+            key_params: list[Any] = []
+        else:
+            path = "$." + json.dumps(str(key))  # quoted member name; any key is allowed
+            # Compressed rows keep only hot keys in ``metadata`` (see core.memory_compression).
+            expr = (
+                f"(CASE WHEN {alias}metadata_z IS NOT NULL THEN json_extract(memory_unz({alias}metadata_z), ?) "
+                f"WHEN json_valid({alias}metadata) THEN json_extract({alias}metadata, ?) END)"
+            )
+            key_params = [path, path]
+        for op, operand in _conditions(value):
+            if operand is None and op in ("==", "!="):
+                clauses.append(f"{expr} IS {'NOT ' if op == '!=' else ''}NULL")
+                params += key_params
+            elif op == "in":
+                values = [_operand(v) for v in operand]
+                if not values:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{expr} IN ({','.join('?' * len(values))})")
+                params += key_params + values
+            else:
+                clauses.append(f"{expr} {_OPERATORS[op]} ?")
+                params += key_params + [_operand(operand)]
+    return clauses, params
+
+
+def metadata_clauses_pg(metadata_filter: dict[str, Any], add: Callable[[Any], str]) -> list[str]:
+    """Postgres clauses; ``add`` registers a parameter and returns its placeholder."""
+    clauses: list[str] = []
+    contains: dict[str, Any] = {}
+    for key, value in metadata_filter.items():
+        for op, operand in _conditions(value):
+            if op == "==" and operand is not None:
+                contains[key] = operand
+                continue
+            expr = f"(metadata->'{key}')" if _is_hot(key) else f"(metadata->{add(key)})"  # literal to match the index
+            if operand is None and op in ("==", "!="):
+                clauses.append(f"COALESCE({expr}, 'null'::jsonb) {'!=' if op == '!=' else '='} 'null'::jsonb")
+            elif op == "in":
+                clauses.append(f"{expr} = ANY({add(list(operand))}::jsonb[])")
+            else:
+                clauses.append(f"{expr} {_OPERATORS[op]} {add(operand)}::jsonb")
+    if contains:
+        clauses.insert(0, f"metadata @> {add(contains)}::jsonb")
+    return clauses
+
+
+async def ensure_indexes_pg(conn: Any) -> None:
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_metadata ON memory_entries USING GIN (metadata jsonb_path_ops)")
+    for key in MEMORY_METADATA_INDEX_KEYS:
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS idx_memory_meta_{key} ON memory_entries ((metadata->'{key}'))")
+
+
+__all__ = [
+    "MEMORY_METADATA_INDEX_KEYS",
+    "ensure_hot_columns",
+    "ensure_indexes_pg",
+    "metadata_clauses",
+    "metadata_clauses_pg",
+]
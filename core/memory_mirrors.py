@@ -0,0 +1,289 @@
+"""In-memory mirrors of the most-read SQLite shards.
+
+A few agents usually account for most reads, and their shards are small. With
+``MEMORY_MIRRORS=N`` the store counts reads per shard (decaying with
+``MEMORY_MIRROR_HALF_LIFE``) and copies the ``N`` hottest shards into ``:memory:`` SQLite
+databases with the backup API; ``get``/``search``/``get_relevant`` on a mirrored shard then
+run against the copy. Segment files and semantic search (vector index sidecars) stay on disk.
+
+Mirrors never serve stale rows. Each one carries the shard's write stamp (the same
+in-process version plus ``PRAGMA data_version`` the result cache uses) and change-log cursor.
+When the stamp moves, the next read first applies the shard's changes since the cursor to the
+copy, re-reading just the changed entries; a burst of more than ``MEMORY_MIRROR_RESYNC_ROWS``
+changes, a trimmed log or ``MEMORY_CHANGE_LOG=false`` re-copies the whole shard instead.
+
+Mirrors share ``MEMORY_MIRROR_MAX_BYTES``: promoting a shard drops colder mirrors to make room,
+and a shard larger than the budget is never mirrored. When the machine's available memory falls
+below ``MEMORY_MIRROR_MIN_FREE_BYTES`` the coldest mirror is dropped on each read until it
+recovers. ``MemoryStore.mirror_stats()`` reports hits, misses, hit rate and per-shard sizes.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Hashable, Iterator
+
+from .memory_changes import MEMORY_CHANGE_LOG, changes_since, latest_seq
+
+try:  # memory pressure checks
+    import psutil  # type: ignore
+except Exception:  # pragma: no cover
+    psutil = None  # type: ignore
+
+MEMORY_MIRRORS = int(os.getenv("MEMORY_MIRRORS", "0"))  # hottest shards kept in RAM; 0 = off
+MEMORY_MIRROR_MAX_BYTES = int(os.getenv("MEMORY_MIRROR_MAX_BYTES", str(256 * 1024 * 1024)))
+MEMORY_MIRROR_MIN_READS = float(os.getenv("MEMORY_MIRROR_MIN_READS", "50"))  # decayed reads before a shard qualifies
+MEMORY_MIRROR_HALF_LIFE = float(os.getenv("MEMORY_MIRROR_HALF_LIFE", "300"))  # seconds
+MEMORY_MIRROR_MIN_FREE_BYTES = int(os.getenv("MEMORY_MIRROR_MIN_FREE_BYTES", str(256 * 1024 * 1024)))
+MEMORY_MIRROR_RESYNC_ROWS = int(os.getenv("MEMORY_MIRROR_RESYNC_ROWS", "1000"))  # larger bursts re-copy the shard
+MEMORY_MIRROR_RETRY = 10.0  # seconds before a shard that could not be mirrored is considered again
+
+Disk = Callable[[], ContextManager[sqlite3.Connection]]
+Prepare = Callable[[sqlite3.Connection, Path], None]
+
+
+def _available_memory() -> int | None:
+    # MemAvailable, not MemFree: reclaimable page cache counts as available.
+    if psutil is None:  # pragma: no cover
+        return None
+    try:
+        return int(psutil.virtual_memory().available)
+    except Exception:  # pragma: no cover - not available on this platform
+        return None
+
+
+def _db_size(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+class _Mirror:
+    __slots__ = ("path", "conn", "lock", "stamp", "seq", "size", "hits", "dropped")
+
+    def __init__(self, path: Path, conn: sqlite3.Connection, stamp: Hashable, seq: int) -> None:
+        self.path = path
+        self.conn = conn
+        # Reentrant: a sync that drops this mirror runs while its reader holds the lock.
+        self.lock = threading.RLock()
+        self.stamp = stamp
+        self.seq = seq
+        self.size = _db_size(conn)
+        self.hits = 0
+        self.dropped = False
+
+
+class MirrorManager:
+    """Read-frequency tracking plus the set of mirrored shards; thread-safe."""
+
+    def __init__(self, prepare: Prepare) -> None:
+        self._prepare = prepare  # registers SQL functions etc. on a fresh copy
+        self._lock = threading.Lock()
+        self._mirrors: dict[str, _Mirror] = {}
+        self._reads: dict[str, tuple[float, float]] = {}  # shard -> (decayed count, at)
+        self._retry_at: dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.promotions = 0
+        self.drops = 0
+        self.incremental_syncs = 0
+        self.full_copies = 0
+
+    # ---------- read tracking ----------
+    def _count_read(self, key: str, now: float) -> float:
+        with self._lock:
+            count, at = self._reads.get(key, (0.0, now))
+            count = count * 2.0 ** (-(now - at) / MEMORY_MIRROR_HALF_LIFE) + 1.0
+            self._reads[key] = (count, now)
+            return count
+
+    def _heat(self, key: str, now: float) -> float:
+        count, at = self._reads.get(key, (0.0, now))
+        return count * 2.0 ** (-(now - at) / MEMORY_MIRROR_HALF_LIFE)
+
+    # ---------- reads ----------
+    @contextmanager
+    def connection(self, path: Path, stamp: Hashable, disk: Disk) -> Iterator[sqlite3.Connection]:
+        """A connection to read shard ``path`` from: its mirror when it has (or now earns) one, else ``disk()``.
+
+        ``stamp`` must be taken before the read and change with every write to the shard.
+        """
+        key = str(path)
+        now = time.monotonic()
+        heat = self._count_read(key, now)
+        self._relieve_pressure()
+        mirror = self._mirrors.get(key)
+        if mirror is None and heat >= MEMORY_MIRROR_MIN_READS and now >= self._retry_at.get(key, 0.0):
+            mirror = self._promote(path, stamp, disk, heat, now)
+        if mirror is not None:
+            with mirror.lock:
+                if mirror.stamp != stamp and not mirror.dropped:
+                    self._sync(mirror, stamp, disk)
+                if not mirror.dropped:
+                    with self._lock:
+                        self.hits += 1
+                        mirror.hits += 1
+                    yield mirror.conn
+                    return
+        with self._lock:
+            self.misses += 1
+        with disk() as conn:
+            yield conn
+
+    # ---------- promotion / eviction ----------
+    def _promote(self, path: Path, stamp: Hashable, disk: Disk, heat: float, now: float) -> _Mirror | None:
+        key = str(path)
+        with self._lock:
+            self._retry_at[key] = now + MEMORY_MIRROR_RETRY
+            if key in self._mirrors:
+                return self._mirrors[key]
+            if len(self._mirrors) >= MEMORY_MIRRORS:
+                coldest = min(self._mirrors.values(), key=lambda m: self._heat(str(m.path), now))
+                if self._heat(str(coldest.path), now) >= heat:
+                    return None
+                self._drop_locked(coldest)
+        mirror = self._copy(path, stamp, disk)
+        if mirror is None:
+            return None
+        with self._lock:
+            if key in self._mirrors:  # another thread won the race
+                return self._mirrors[key]
+            if not self._fit_locked(mirror.size, now, keep=key):
+                return None
+            self._mirrors[key] = mirror
+            self.promotions += 1
+        return mirror
+
+    def _copy(self, path: Path, stamp: Hashable, disk: Disk) -> _Mirror | None:
+        with disk() as conn:
+            if _db_size(conn) > MEMORY_MIRROR_MAX_BYTES:
+                return None
+            seq = latest_seq(conn)
+            mem = sqlite3.connect(":memory:", check_same_thread=False)
+            conn.backup(mem)
+        mem.row_factory = sqlite3.Row
+        self._prepare(mem, path)
+        with self._lock:
+            self.full_copies += 1
+        return _Mirror(path, mem, stamp, seq)
+
+    def _fit_locked(self, size: int, now: float, keep: str) -> bool:
+        """Drop the coldest other mirrors until ``size`` more bytes fit the budget."""
+        if size > MEMORY_MIRROR_MAX_BYTES:
+            return False
+        others = sorted(
+            (m for k, m in self._mirrors.items() if k != keep), key=lambda m: self._heat(str(m.path), now)
+        )
+        while sum(m.size for m in self._mirrors.values() if str(m.path) != keep) + size > MEMORY_MIRROR_MAX_BYTES:
+            self._drop_locked(others.pop(0))
+        return True
+
+    def _drop_locked(self, mirror: _Mirror) -> None:
+        # Readers holding the copy finish with it; the connection closes when the last one lets go.
+        if self._mirrors.pop(str(mirror.path), None) is mirror:
+            mirror.dropped = True
+            self.drops += 1
+
+    def _relieve_pressure(self) -> None:
+        if not self._mirrors:
+            return
+        available = _available_memory()
+        if available is None or available >= MEMORY_MIRROR_MIN_FREE_BYTES:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._mirrors:
+                self._drop_locked(min(self._mirrors.values(), key=lambda m: self._heat(str(m.path), now)))
+
+    def drop(self, path: Path) -> None:
+        with self._lock:
+            mirror = self._mirrors.get(str(path))
+            if mirror is not None:
+                self._drop_locked(mirror)
+
+    def clear(self) -> None:
+        with self._lock:
+            for mirror in list(self._mirrors.values()):
+                self._drop_locked(mirror)
+            self._reads.clear()
+            self._retry_at.clear()
+
+    # ---------- keeping mirrors current ----------
+    def _sync(self, mirror: _Mirror, stamp: Hashable, disk: Disk) -> None:
+        """Bring ``mirror`` up to ``stamp`` (caller holds ``mirror.lock``)."""
+        with disk() as conn:
+            batch = changes_since(conn, mirror.seq, MEMORY_MIRROR_RESYNC_ROWS + 1) if MEMORY_CHANGE_LOG else None
+            if batch is None or batch.truncated or len(batch) > MEMORY_MIRROR_RESYNC_ROWS:
+                mirror.seq = latest_seq(conn)
+                conn.backup(mirror.conn)
+                rows = None
+            else:
+                ids = json.dumps(sorted({c.entry_id for c in batch}))
+                rows = conn.execute(
+                    "SELECT rowid AS _rowid, * FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))", (ids,)
+                ).fetchall()
+                # Changed rows may be compressed with a dictionary trained since the copy.
+                newest = mirror.conn.execute("SELECT coalesce(max(id), 0) FROM memory_dicts").fetchone()[0]
+                dicts = conn.execute("SELECT * FROM memory_dicts WHERE id > ?", (newest,)).fetchall()
+                mirror.seq = batch.next_seq
+        mem = mirror.conn
+        if rows is None:
+            self._prepare(mem, mirror.path)  # the copy brought the file's triggers back
+            with self._lock:
+                self.full_copies += 1
+        else:
+            # Delete-then-insert keeps the FTS and tag triggers in step; rowids match the file.
+            for d in dicts:
+                mem.execute(f"INSERT INTO memory_dicts VALUES ({', '.join('?' * len(d))})", tuple(d))
+            mem.execute("DELETE FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+            if rows:
+                columns = [c for c in rows[0].keys() if c != "_rowid"]
+                mem.executemany(
+                    f"INSERT INTO memory_entries (rowid, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))})",
+                    [(r["_rowid"], *(r[c] for c in columns)) for r in rows],
+                )
+            mem.commit()
+            with self._lock:
+                self.incremental_syncs += 1
+        mirror.stamp = stamp
+        mirror.size = _db_size(mem)
+        with self._lock:
+            if not self._fit_locked(mirror.size, time.monotonic(), keep=str(mirror.path)):
+                self._drop_locked(mirror)
+
+    # ---------- reporting ----------
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            reads = self.hits + self.misses
+            return {
+                "mirrors": len(self._mirrors),
+                "bytes": sum(m.size for m in self._mirrors.values()),
+                "budget_bytes": MEMORY_MIRROR_MAX_BYTES,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / reads, 4) if reads else 0.0,
+                "promotions": self.promotions,
+                "drops": self.drops,
+                "incremental_syncs": self.incremental_syncs,
+                "full_copies": self.full_copies,
+                "shards": {
+                    Path(key).stem: {"bytes": m.size, "hits": m.hits, "heat": round(self._heat(key, now), 2)}
+                    for key, m in self._mirrors.items()
+                },
+            }
+
+
+__all__ = [
+    "MEMORY_MIRRORS",
+    "MEMORY_MIRROR_HALF_LIFE",
+    "MEMORY_MIRROR_MAX_BYTES",
+    "MEMORY_MIRROR_MIN_FREE_BYTES",
+    "MEMORY_MIRROR_MIN_READS",
+    "MEMORY_MIRROR_RESYNC_ROWS",
+    "MirrorManager",
+]
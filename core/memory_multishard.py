@@ -0,0 +1,183 @@
+"""Scatter-gather queries across several memory shards.
+
+``MultiShardQuery`` fans ``search``/``get_relevant``/``semantic_search`` out to a set of
+shards on a bounded, process-wide thread pool, asks each shard for at most
+``per_shard_limit`` rows, and merges the results with a global top-k heap on
+``MemoryItem.score``. Per-shard latency (and any per-shard error) is reported on the
+returned ``MultiShardResult`` so slow shards are visible.
+
+Example::
+
+    query = MultiShardQuery.for_agent("a1", business_id="b7")   # agent + business + global
+    hits = query.get_relevant(None, "quarterly kpi", limit=10)
+    hits.latency_ms   # {"agent_a1": 1.2, "business_b7": 0.8, "global": 3.4}
+"""
+
+from __future__ import annotations
+
+import fnmatch
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, List, Sequence
+
+from . import memory_store
+from .memory_store import MemoryItem, MemoryStore
+
+MEMORY_SCATTER_WORKERS = int(os.getenv("MEMORY_SCATTER_WORKERS", "8"))
+
+GLOBAL_SHARD = "global"
+
+_executor: ThreadPoolExecutor | None = None
+_executor_lock = threading.Lock()
+
+
+def _shared_executor() -> Executor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MEMORY_SCATTER_WORKERS, thread_name_prefix="memory-scatter")
+        return _executor
+
+
+class MultiShardResult(List[MemoryItem]):
+    """Merged results plus per-shard latency (ms), errors and shards cut short by a deadline."""
+
+    def __init__(self, items: Sequence[MemoryItem] = ()) -> None:
+        super().__init__(items)
+        self.latency_ms: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self.timed_out_shards: list[str] = []
+
+    @property
+    def timed_out(self) -> bool:
+        return bool(self.timed_out_shards)
+
+    @property
+    def slowest_shard(self) -> str | None:
+        return max(self.latency_ms, key=self.latency_ms.__getitem__) if self.latency_ms else None
+
+
+class MultiShardQuery:
+    def __init__(
+        self,
+        shards: Sequence[str] | None = None,
+        *,
+        pattern: str | None = None,
+        per_shard_limit: int | None = None,
+        executor: Executor | None = None,
+    ) -> None:
+        """Query ``shards`` (names like ``agent_<id>``; ``"global"`` for the global DB) and/or
+        every shard on disk whose name matches the glob ``pattern``."""
+        names = list(shards or [])
+        if pattern is not None:
+            names.extend(self.matching_shards(pattern))
+        self.shards = list(dict.fromkeys(names))
+        self.per_shard_limit = per_shard_limit
+        self._executor = executor
+
+    @classmethod
+    def for_agent(cls, agent_id: str, business_id: str | None = None, **kwargs: Any) -> "MultiShardQuery":
+        shards = [f"agent_{agent_id}"] + ([f"business_{business_id}"] if business_id else []) + [GLOBAL_SHARD]
+        return cls(shards, **kwargs)
+
+    @staticmethod
+    def matching_shards(pattern: str) -> list[str]:
+        names = [p.stem for p in memory_store.SHARDS_DIR.glob("*.db")] if memory_store.SHARDS_DIR.exists() else []
+        if memory_store.GLOBAL_DB.exists():
+            names.append(GLOBAL_SHARD)
+        return sorted(n for n in names if fnmatch.fnmatchcase(n, pattern))
+
+    @staticmethod
+    def _store(shard: str) -> MemoryStore:
+        return MemoryStore(shard=None if shard == GLOBAL_SHARD else shard)
+
+    def _scatter(self, limit: int, call: Callable[[MemoryStore, int], List[MemoryItem]]) -> MultiShardResult:
+        per_shard = self.per_shard_limit or limit
+        executor = self._executor or _shared_executor()
+
+        def run(shard: str) -> tuple[List[MemoryItem], float]:
+            start = time.perf_counter()
+            store = self._store(shard)
+            if not memory_store.MEMORY_DB_URL and not store._db_path().exists():
+                return [], 0.0  # don't create empty shard files just to query them
+            items = call(store, per_shard)
+            return items, (time.perf_counter() - start) * 1000.0
+
+        futures = {shard: executor.submit(run, shard) for shard in self.shards}
+        result = MultiShardResult()
+        gathered: list[MemoryItem] = []
+        for shard, future in futures.items():
+            try:
+                items, elapsed = future.result()
+            except Exception as exc:  # one bad shard must not fail the whole query
+                result.errors[shard] = str(exc)
+                continue
+            result.latency_ms[shard] = round(elapsed, 3)
+            if getattr(items, "timed_out", False):
+                result.timed_out_shards.append(shard)
+            gathered.extend(items)
+        unique: dict[str, MemoryItem] = {}
+        for item in gathered:  # a Postgres backend serves every "shard" from one table
+            unique.setdefault(item.id, item)
+        result.extend(
+            heapq.nlargest(limit, unique.values(), key=lambda i: i.score if i.score is not None else float("-inf"))
+        )
+        return result
+
+    def search(
+        self,
+        agent_id: str | None,
+        query: str,
+        limit: int | None = None,
+        tags: Sequence[str] | None = None,
+        metadata_filter: dict[str, Any] | None = None,
+        deadline_ms: float | None = None,
+        **tag_filters: Sequence[str] | None,
+    ) -> MultiShardResult:
+        """FTS search on every shard; ``agent_id=None`` matches any agent.
+
+        ``tag_filters`` are ``tags_any``/``tags_all``/``tags_none``, as on ``MemoryStore.search``.
+        Shards run in parallel, so ``deadline_ms`` applies to each of them; shards that hit it
+        contribute partial results and are listed in ``timed_out_shards``.
+        """
+        limit = limit or memory_store.MEMORY_MAX_RESULTS
+        return self._scatter(
+            limit,
+            lambda store, n: store.search(
+                agent_id, query, limit=n, tags=tags, metadata_filter=metadata_filter, deadline_ms=deadline_ms, **tag_filters  # type: ignore[arg-type]
+            ),
+        )
+
+    def get_relevant(
+        self,
+        agent_id: str | None,
+        query: str,
+        *,
+        tags: Sequence[str] | None = None,
+        limit: int | None = None,
+        semantic: bool = False,
+        deadline_ms: float | None = None,
+        **tag_filters: Sequence[str] | None,
+    ) -> MultiShardResult:
+        limit = limit or memory_store.MEMORY_MAX_RESULTS
+        return self._scatter(
+            limit,
+            lambda store, n: store.get_relevant(
+                agent_id, query, tags=tags, limit=n, semantic=semantic, deadline_ms=deadline_ms, **tag_filters  # type: ignore[arg-type]
+            ),
+        )
+
+    def semantic_search(
+        self, agent_id: str | None, query: str | Sequence[float], limit: int = 5, deadline_ms: float | None = None
+    ) -> MultiShardResult:
+        if isinstance(query, str):  # embed once, not once per shard
+            query = MemoryStore()._embed(query) or []
+        return self._scatter(
+            limit, lambda store, n: store.semantic_search(agent_id, query, limit=n, deadline_ms=deadline_ms)  # type: ignore[arg-type]
+        )
+
+
+__all__ = ["MultiShardQuery", "MultiShardResult", "MEMORY_SCATTER_WORKERS"]
@@ -0,0 +1,176 @@
+"""Postgres schema, migrations and connection setup for ``MemoryStore``'s asyncpg path.
+
+The schema is versioned (``memory_settings.schema_version``) and migrated once per process
+under an advisory lock, so several workers can start against the same database:
+
+- v1: the original table (JSONB tags/metadata/embedding) and its B-tree / GIN indexes
+- v2: ``embedding`` becomes a pgvector ``vector(MEMORY_PG_VECTOR_DIM)`` column with an HNSW
+  index (cosine); existing JSONB embeddings of that dimension are converted, others dropped
+- v3: a stored generated ``text_tsv`` column (``to_tsvector('english', text)``) with a GIN index,
+  so full-text search no longer computes ``to_tsvector`` per row per query
+- v4: the ``memory_changes`` change log and its trigger (``core.memory_changes``)
+
+Every pooled connection gets a ``jsonb`` codec (Python objects in and out) and a binary
+``vector`` codec (lists of floats, no ``pgvector`` package needed), and sets ``hnsw.ef_search``. Hot queries have fixed SQL text and run
+through asyncpg's per-connection prepared-statement cache (``MEMORY_PG_STATEMENT_CACHE``; set it
+to 0 behind PgBouncer in transaction mode).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+from typing import Any, Awaitable, Callable, Sequence
+
+MEMORY_PG_VECTOR_DIM = int(os.getenv("MEMORY_PG_VECTOR_DIM", "384"))  # all-MiniLM-L6-v2
+MEMORY_PG_HNSW_M = int(os.getenv("MEMORY_PG_HNSW_M", "16"))
+MEMORY_PG_HNSW_EF_CONSTRUCTION = int(os.getenv("MEMORY_PG_HNSW_EF_CONSTRUCTION", "64"))
+MEMORY_PG_HNSW_EF_SEARCH = int(os.getenv("MEMORY_PG_HNSW_EF_SEARCH", "100"))
+MEMORY_PG_STATEMENT_CACHE = int(os.getenv("MEMORY_PG_STATEMENT_CACHE", "256"))  # prepared statements per connection
+
+_MIGRATION_LOCK = 0x6D656D6F  # pg_advisory_xact_lock key ("memo")
+
+TSQUERY = "plainto_tsquery('english', {})"
+
+
+async def _migrate_v1(conn: Any) -> None:
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS memory_entries ("
+        "id UUID PRIMARY KEY,"
+        "agent_id TEXT,"
+        "text TEXT,"
+        "tags JSONB,"
+        "importance DOUBLE PRECISION,"
+        "created_at DOUBLE PRECISION,"
+        "expires_at DOUBLE PRECISION,"
+        "source TEXT,"
+        "metadata JSONB,"
+        "blob_ref TEXT,"
+        "deleted BOOLEAN DEFAULT FALSE,"
+        "embedding JSONB"
+        ")"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_agent ON memory_entries(agent_id)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_deleted ON memory_entries(deleted)")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memory_agent_recent ON memory_entries(agent_id, deleted, created_at DESC)"
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memory_expires ON memory_entries(expires_at) WHERE expires_at IS NOT NULL"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_tags ON memory_entries USING GIN (tags)")
+
+
+async def _migrate_v2(conn: Any) -> None:
+    await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    kind = await conn.fetchval(
+        "SELECT udt_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'memory_entries' AND column_name = 'embedding'"
+    )
+    if kind == "jsonb":
+        dim = MEMORY_PG_VECTOR_DIM
+        await conn.execute(f"ALTER TABLE memory_entries ADD COLUMN embedding_vec vector({dim})")
+        await conn.execute(
+            "UPDATE memory_entries SET embedding_vec = (embedding::text)::vector "
+            f"WHERE jsonb_typeof(embedding) = 'array' AND jsonb_array_length(embedding) = {dim}"
+        )
+        await conn.execute("ALTER TABLE memory_entries DROP COLUMN embedding")
+        await conn.execute("ALTER TABLE memory_entries RENAME COLUMN embedding_vec TO embedding")
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memory_embedding ON memory_entries USING hnsw (embedding vector_cosine_ops) "
+        f"WITH (m = {MEMORY_PG_HNSW_M}, ef_construction = {MEMORY_PG_HNSW_EF_CONSTRUCTION})"
+    )
+
+
+async def _migrate_v3(conn: Any) -> None:
+    await conn.execute(
+        "ALTER TABLE memory_entries ADD COLUMN IF NOT EXISTS text_tsv tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('english', coalesce(text, ''))) STORED"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_text_tsv ON memory_entries USING GIN (text_tsv)")
+
+
+async def _migrate_v4(conn: Any) -> None:
+    # Change log (see core.memory_changes); txid lets readers hold back changes of running transactions.
+    await conn.execute(
+        "CREATE TABLE IF NOT EXISTS memory_changes ("
+        "seq BIGSERIAL PRIMARY KEY,"
+        "op TEXT NOT NULL,"
+        "entry_id UUID NOT NULL,"
+        "agent_id TEXT,"
+        "changed_at DOUBLE PRECISION NOT NULL DEFAULT extract(epoch FROM clock_timestamp()),"
+        "txid xid8 NOT NULL DEFAULT pg_current_xact_id()"
+        ")"
+    )
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_changes_entry ON memory_changes(entry_id, seq)")
+    await conn.execute(
+        "CREATE OR REPLACE FUNCTION memory_log_change() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "IF TG_OP = 'DELETE' THEN "
+        "INSERT INTO memory_changes(op, entry_id, agent_id) VALUES ('delete', OLD.id, OLD.agent_id); RETURN OLD; "
+        "END IF; "
+        "INSERT INTO memory_changes(op, entry_id, agent_id) VALUES ("
+        "CASE WHEN TG_OP = 'INSERT' THEN 'insert' "
+        "WHEN NEW.deleted AND NOT COALESCE(OLD.deleted, FALSE) THEN 'soft_delete' ELSE 'update' END, "
+        "NEW.id, NEW.agent_id); RETURN NEW; END $$"
+    )
+    await conn.execute("DROP TRIGGER IF EXISTS memory_changes_log ON memory_entries")
+    await conn.execute(
+        "CREATE TRIGGER memory_changes_log AFTER INSERT OR DELETE OR UPDATE OF "
+        "text, tags, importance, expires_at, source, metadata, blob_ref, deleted, embedding "
+        "ON memory_entries FOR EACH ROW EXECUTE FUNCTION memory_log_change()"
+    )
+
+
+_MIGRATIONS: list[Callable[[Any], Awaitable[None]]] = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4]
+
+
+async def migrate(conn: Any) -> None:
+    """Bring the schema up to date; safe to race from several processes."""
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", _MIGRATION_LOCK)
+        await conn.execute("CREATE TABLE IF NOT EXISTS memory_settings (key TEXT PRIMARY KEY, value DOUBLE PRECISION)")
+        version = int(await conn.fetchval("SELECT value FROM memory_settings WHERE key = 'schema_version'") or 0)
+        for target, step in enumerate(_MIGRATIONS, start=1):
+            if version < target:
+                await step(conn)
+        await conn.execute(
+            "INSERT INTO memory_settings (key, value) VALUES ('schema_version', $1) "
+            "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+            float(len(_MIGRATIONS)),
+        )
+
+
+def _encode_vector(vec: Sequence[float]) -> bytes:
+    # pgvector binary format: uint16 dim, uint16 unused, dim big-endian float4
+    return struct.pack(f">HH{len(vec)}f", len(vec), 0, *vec)
+
+
+def _decode_vector(data: bytes) -> list[float]:
+    dim = struct.unpack_from(">H", data)[0]
+    return list(struct.unpack_from(f">{dim}f", data, 4))
+
+
+async def init_connection(conn: Any) -> None:
+    """Per-connection setup for the pool: ``jsonb``/``vector`` codecs and HNSW search breadth."""
+    await conn.set_type_codec("jsonb", schema="pg_catalog", encoder=json.dumps, decoder=json.loads, format="text")
+    schema = await conn.fetchval(
+        "SELECT n.nspname FROM pg_type t JOIN pg_namespace n ON n.oid = t.typnamespace WHERE t.typname = 'vector'"
+    )
+    await conn.set_type_codec("vector", schema=schema, encoder=_encode_vector, decoder=_decode_vector, format="binary")
+    await conn.execute(f"SET hnsw.ef_search = {MEMORY_PG_HNSW_EF_SEARCH}")
+    try:  # pgvector >= 0.8: keep scanning the graph when filters reject candidates
+        await conn.execute("SET hnsw.iterative_scan = strict_order")
+    except Exception:
+        pass
+
+
+__all__ = [
+    "MEMORY_PG_HNSW_EF_CONSTRUCTION",
+    "MEMORY_PG_HNSW_EF_SEARCH",
+    "MEMORY_PG_HNSW_M",
+    "MEMORY_PG_STATEMENT_CACHE",
+    "MEMORY_PG_VECTOR_DIM",
+    "init_connection",
+    "migrate",
+]
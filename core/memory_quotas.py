@@ -0,0 +1,205 @@
+"""Row and byte quotas for ``MemoryStore`` shards, enforced by evicting the least valuable entries.
+
+Limits apply per shard (the base file plus its segments, see ``core.memory_segments``) and per
+agent within a shard; 0 means unlimited::
+
+    MEMORY_QUOTA_ROWS=200000  MEMORY_QUOTA_BYTES=536870912          # whole shard
+    MEMORY_AGENT_QUOTA_ROWS=50000  MEMORY_AGENT_QUOTA_BYTES=0       # each agent_id
+
+A row's size is the stored length of its text, metadata and embedding (compressed size when
+compressed). With any limit set, triggers keep per-agent totals in ``memory_usage``, so checking a
+quota reads a handful of rows instead of scanning the shard. Checks are amortized: a shard is
+looked at every ``MEMORY_QUOTA_CHECK_EVERY`` writes through this process and on every reaper pass.
+
+A shard over a limit is brought down to ``MEMORY_EVICTION_TARGET`` of it, deleting
+``MEMORY_EVICTION_BATCH`` rows per transaction in order of lowest effective importance, then
+oldest. That order is read from the ``decay_key`` indexes (``idx_memory_decay`` and
+``idx_memory_agent_decay``), so finding victims never sorts the table. Evictions are ordinary
+deletes: FTS, tags, blobs and the change log follow as usual.
+
+Quotas apply to SQLite shards; on Postgres bound the table with ``prune_importance`` or TTLs.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+MEMORY_QUOTA_ROWS = int(os.getenv("MEMORY_QUOTA_ROWS", "0"))  # per shard; 0 = unlimited
+MEMORY_QUOTA_BYTES = int(os.getenv("MEMORY_QUOTA_BYTES", "0"))
+MEMORY_AGENT_QUOTA_ROWS = int(os.getenv("MEMORY_AGENT_QUOTA_ROWS", "0"))  # per agent within a shard
+MEMORY_AGENT_QUOTA_BYTES = int(os.getenv("MEMORY_AGENT_QUOTA_BYTES", "0"))
+MEMORY_EVICTION_BATCH = int(os.getenv("MEMORY_EVICTION_BATCH", "500"))  # rows deleted per transaction
+MEMORY_EVICTION_TARGET = float(os.getenv("MEMORY_EVICTION_TARGET", "0.9"))  # evict down to this fraction of a limit
+MEMORY_QUOTA_CHECK_EVERY = int(os.getenv("MEMORY_QUOTA_CHECK_EVERY", "100"))  # writes per shard between checks
+
+_ROW_BYTES = (
+    "(coalesce(length(CAST({0}text AS BLOB)), 0) + coalesce(length({0}text_z), 0) "
+    "+ coalesce(length(CAST({0}metadata AS BLOB)), 0) + coalesce(length({0}metadata_z), 0) "
+    "+ coalesce(length({0}embedding), 0))"
+)
+
+
+def row_bytes_sql(alias: str = "") -> str:
+    return _ROW_BYTES.format(alias)
+
+
+_ADD = (
+    "INSERT INTO memory_usage (agent_id, rows, bytes) VALUES (coalesce(new.agent_id, ''), 1, {0}) "
+    "ON CONFLICT(agent_id) DO UPDATE SET rows = rows + 1, bytes = bytes + excluded.bytes;"
+).format(row_bytes_sql("new."))
+_SUB = "UPDATE memory_usage SET rows = rows - 1, bytes = bytes - {0} WHERE agent_id = coalesce(old.agent_id, '');".format(
+    row_bytes_sql("old.")
+)
+_TRIGGERS = {
+    "memory_usage_ai": f"AFTER INSERT ON memory_entries BEGIN {_ADD} END",
+    "memory_usage_ad": f"AFTER DELETE ON memory_entries BEGIN {_SUB} END",
+    "memory_usage_au": (
+        "AFTER UPDATE OF text, text_z, metadata, metadata_z, embedding ON memory_entries "
+        f"BEGIN {_SUB} {_ADD} END"
+    ),
+}
+
+
+def enabled() -> bool:
+    return bool(MEMORY_QUOTA_ROWS or MEMORY_QUOTA_BYTES or MEMORY_AGENT_QUOTA_ROWS or MEMORY_AGENT_QUOTA_BYTES)
+
+
+def ensure_usage_tracking(conn: sqlite3.Connection) -> None:
+    """Create (or, with no quota set, drop) the usage triggers; totals are rebuilt when tracking starts."""
+    present = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'memory_usage_%'")}
+    if not enabled():
+        for name in present:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        return
+    if present == set(_TRIGGERS):
+        return
+    for name, body in _TRIGGERS.items():
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"CREATE TRIGGER {name} {body}")
+    conn.execute("DELETE FROM memory_usage")  # totals went stale while the triggers were off
+    conn.execute(
+        "INSERT INTO memory_usage (agent_id, rows, bytes) "
+        f"SELECT coalesce(agent_id, ''), count(*), sum({row_bytes_sql()}) FROM memory_entries GROUP BY 1"
+    )
+
+
+def usage(conn: sqlite3.Connection) -> dict[str, tuple[int, int]]:
+    """``agent_id -> (rows, bytes)`` for one file."""
+    return {r[0]: (r[1], r[2]) for r in conn.execute("SELECT agent_id, rows, bytes FROM memory_usage WHERE rows > 0")}
+
+
+@dataclass(frozen=True)
+class Overage:
+    """Rows and bytes to evict from a shard (``agent_id=None``) or one agent in it."""
+
+    agent_id: str | None
+    rows: int
+    bytes: int
+
+
+def _excess(used: int, limit: int) -> int:
+    if not limit or used <= limit:
+        return 0
+    return used - int(limit * MEMORY_EVICTION_TARGET)
+
+
+def agent_overages(totals: dict[str, tuple[int, int]]) -> list[Overage]:
+    """Agents whose ``totals`` (summed over a shard's files) exceed the per-agent quotas."""
+    found = []
+    for agent_id, (rows, size) in sorted(totals.items()):
+        over = Overage(agent_id, _excess(rows, MEMORY_AGENT_QUOTA_ROWS), _excess(size, MEMORY_AGENT_QUOTA_BYTES))
+        if over.rows or over.bytes:
+            found.append(over)
+    return found
+
+
+def shard_overage(totals: dict[str, tuple[int, int]]) -> Overage | None:
+    rows = sum(r for r, _ in totals.values())
+    size = sum(b for _, b in totals.values())
+    over = Overage(None, _excess(rows, MEMORY_QUOTA_ROWS), _excess(size, MEMORY_QUOTA_BYTES))
+    return over if over.rows or over.bytes else None
+
+
+def candidates(conn: sqlite3.Connection, agent_id: str | None, limit: int) -> list[sqlite3.Row]:
+    """The ``limit`` entries to evict first (lowest decay_key, then oldest), read in index order."""
+    columns = f"rowid AS _rowid, id, agent_id, vec_seq, decay_key, created_at, {row_bytes_sql()} AS _bytes"
+    if agent_id is None:
+        sql = f"SELECT {columns} FROM memory_entries INDEXED BY idx_memory_decay ORDER BY decay_key, rowid LIMIT ?"
+        return conn.execute(sql, (limit,)).fetchall()
+    sql = (
+        f"SELECT {columns} FROM memory_entries INDEXED BY idx_memory_agent_decay "
+        "WHERE agent_id = ? ORDER BY decay_key, rowid LIMIT ?"
+    )
+    return conn.execute(sql, (agent_id, limit)).fetchall()
+
+
+class _EvictionStats:
+    """Process-wide eviction counters per shard."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def record(self, shard: str, rows: int, size: int) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(shard, {"runs": 0, "evicted_rows": 0, "evicted_bytes": 0})
+            counts["runs"] += 1
+            counts["evicted_rows"] += rows
+            counts["evicted_bytes"] += size
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {shard: dict(counts) for shard, counts in self._counts.items()}
+
+
+eviction_stats = _EvictionStats()
+
+
+def headroom(totals: dict[str, tuple[int, int]]) -> dict[str, Any]:
+    """Usage against the quotas for one shard; ``*_headroom`` is None when that limit is off."""
+
+    def room(used: int, limit: int) -> int | None:
+        return limit - used if limit else None
+
+    rows = sum(r for r, _ in totals.values())
+    size = sum(b for _, b in totals.values())
+    return {
+        "rows": rows,
+        "bytes": size,
+        "row_headroom": room(rows, MEMORY_QUOTA_ROWS),
+        "byte_headroom": room(size, MEMORY_QUOTA_BYTES),
+        "agents": {
+            agent_id: {
+                "rows": r,
+                "bytes": b,
+                "row_headroom": room(r, MEMORY_AGENT_QUOTA_ROWS),
+                "byte_headroom": room(b, MEMORY_AGENT_QUOTA_BYTES),
+            }
+            for agent_id, (r, b) in sorted(totals.items())
+        },
+    }
+
+
+__all__ = [
+    "MEMORY_AGENT_QUOTA_BYTES",
+    "MEMORY_AGENT_QUOTA_ROWS",
+    "MEMORY_EVICTION_BATCH",
+    "MEMORY_EVICTION_TARGET",
+    "MEMORY_QUOTA_BYTES",
+    "MEMORY_QUOTA_CHECK_EVERY",
+    "MEMORY_QUOTA_ROWS",
+    "Overage",
+    "agent_overages",
+    "candidates",
+    "enabled",
+    "ensure_usage_tracking",
+    "eviction_stats",
+    "headroom",
+    "row_bytes_sql",
+    "shard_overage",
+    "usage",
+]
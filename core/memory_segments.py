@@ -0,0 +1,179 @@
+"""Time-partitioned segment files for ``MemoryStore`` shards.
+
+With ``MEMORY_SEGMENTS`` set (``hourly``, ``daily``, ``weekly`` or a span in seconds), entries
+that carry an expiry (``ttl`` or ``MEMORY_TTL_DEFAULT``) are written to a per-shard segment
+file for the time bucket of their ``created_at``; entries that never expire stay in the shard's
+base file::
+
+    shards/agent_a1.db                          # base file: rows without expiry, change log
+    shards/agent_a1.segments/1760572800_86400.db  # rows created in that day (start_span.db)
+
+Each segment is a complete shard database (FTS, tag index, vector index, compression) opened
+through the same connection pool. Reads query the base file plus the segments that can hold
+matching rows and merge the results: ``since=`` skips segments that ended before it, and
+``get`` stops at the first segment older than the rows it already has, so recency-bounded
+queries only touch the newest files.
+
+Once a segment's bucket has closed and its last row has expired, the reaper drops the whole
+file instead of deleting row by row (blob references are released and ``delete`` changes
+logged first). The drop holds the file's pool lock until it is unlinked, and segment files are
+never created by opening them, so a read that listed a dropped segment skips it. Rows in a
+live segment are hidden from reads when they expire and leave with the segment. Segments have
+no change log of their own: their writes are recorded in the base file's log. The layout
+applies to SQLite; on Postgres use native table partitioning.
+"""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+MEMORY_SEGMENTS = os.getenv("MEMORY_SEGMENTS", "")  # "", "hourly", "daily", "weekly" or seconds
+
+_SPANS = {"hourly": 3600.0, "daily": 86400.0, "weekly": 7 * 86400.0}
+SEGMENT_SUFFIX = ".segments"
+# Files a segment may leave behind: WAL/SHM and the vector index sidecars (core.memory_vectors).
+_SIDECARS = ("-wal", "-shm")
+_INDEX_SUFFIXES = (".vec", ".ids", ".vmeta", ".vlock")
+
+
+def segment_span() -> float:
+    """Configured bucket width in seconds; 0 when segments are off."""
+    value = MEMORY_SEGMENTS.strip().lower()
+    if not value:
+        return 0.0
+    return _SPANS.get(value) or float(value)
+
+
+@dataclass(frozen=True)
+class Segment:
+    path: Path
+    start: float
+    end: float
+
+
+def segments_dir(base: Path) -> Path:
+    return base.with_suffix(SEGMENT_SUFFIX)
+
+
+def is_segment(path: Path | str) -> bool:
+    return Path(path).parent.suffix == SEGMENT_SUFFIX
+
+
+def base_of(segment_path: Path) -> Path:
+    directory = segment_path.parent
+    return directory.with_suffix(".db")
+
+
+def segment_for(base: Path, created_at: float, span: float) -> Path:
+    start = int(created_at // span * span)
+    return segments_dir(base) / f"{start}_{int(span)}.db"
+
+
+def _parse(path: Path) -> Segment | None:
+    try:
+        start, span = (int(part) for part in path.stem.split("_"))
+    except ValueError:
+        return None
+    return Segment(path, float(start), float(start + span))
+
+
+# Coarsest directory timestamp granularity we expect (FAT: 2 s). A listing taken within this
+# long of the directory's mtime may have missed a file created in the same tick.
+_MTIME_SLACK_NS = 2_000_000_000
+
+_listings: dict[str, tuple[int, int, list[Segment]]] = {}  # dir -> (mtime, listed at, segments)
+_listings_lock = threading.Lock()
+
+
+def list_segments(base: Path) -> list[Segment]:
+    """Segments of ``base``, newest first; re-read only when the directory changes.
+
+    The cached listing is trusted only once it was taken well after the directory's last
+    modification, so filesystems with coarse timestamps cannot hide a new segment.
+    """
+    directory = segments_dir(base)
+    try:
+        mtime = directory.stat().st_mtime_ns
+    except FileNotFoundError:
+        return []
+    key = str(directory)
+    with _listings_lock:
+        cached = _listings.get(key)
+        if cached is not None and cached[0] == mtime and cached[1] - mtime > _MTIME_SLACK_NS:
+            return cached[2]
+    listed_at = time.time_ns()
+    found = [s for s in (_parse(p) for p in directory.glob("*.db")) if s is not None]
+    found.sort(key=lambda s: s.start, reverse=True)
+    with _listings_lock:
+        _listings[key] = (mtime, listed_at, found)
+    return found
+
+
+def create(path: Path) -> None:
+    """Create segment file ``path`` (an empty file is an empty database) unless it exists.
+
+    Drops the cached listing of its shard, so this process sees the new segment at once.
+    """
+    if path.exists():
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    with _listings_lock:
+        _listings.pop(str(path.parent), None)
+
+
+def overlapping(base: Path, since: float | None) -> list[Segment]:
+    """Segments that can hold rows created at or after ``since`` (all when None), newest first."""
+    segments = list_segments(base)
+    return segments if since is None else [s for s in segments if s.end > since]
+
+
+def all_segments(bases: Iterable[Path]) -> list[Segment]:
+    return [s for base in bases for s in list_segments(base)]
+
+
+def droppable(conn: sqlite3.Connection, segment: Segment, now: float) -> bool:
+    """True once the bucket has closed and every row in it has expired (one index lookup).
+
+    Only rows with an expiry are routed to segments, and ``update`` can extend but not clear one.
+    """
+    if segment.end > now:
+        return False
+    newest = conn.execute("SELECT max(expires_at) FROM memory_entries WHERE expires_at IS NOT NULL").fetchone()[0]
+    return newest is None or newest <= now
+
+
+def unlink(segment: Segment) -> None:
+    """Remove a segment's files; its pooled connection must be closed first."""
+    path = segment.path
+    for suffix in _SIDECARS:
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+    for suffix in _INDEX_SUFFIXES:
+        path.with_suffix(suffix).unlink(missing_ok=True)
+    path.unlink(missing_ok=True)
+    with _listings_lock:
+        _listings.pop(str(path.parent), None)
+
+
+__all__ = [
+    "MEMORY_SEGMENTS",
+    "SEGMENT_SUFFIX",
+    "Segment",
+    "all_segments",
+    "base_of",
+    "create",
+    "droppable",
+    "is_segment",
+    "list_segments",
+    "overlapping",
+    "segment_for",
+    "segment_span",
+    "segments_dir",
+    "unlink",
+]
@@ -0,0 +1,252 @@
+"""Process-wide cache of open SQLite shard connections.
+
+Each memory shard (``agent_<id>``, ``business_<id>`` or the global DB) is a separate
+SQLite file. Opening one costs a ``connect``, the WAL pragmas and a schema check, so
+instead of paying that on every call the store borrows connections from a shared,
+LRU-bounded pool. The pool:
+
+- keeps at most ``MEMORY_MAX_OPEN_SHARDS`` connections open (each WAL connection holds
+  the db, ``-wal`` and ``-shm`` files), closing the least recently used idle one
+- serializes use of a connection with a per-shard lock, so it is safe to share between threads
+- runs the schema initializer only when a connection is opened, never on a cache hit
+- exposes hit/miss/eviction counters via ``stats()``
+- reports ``data_version`` so caches can detect commits made by other processes
+- opens files that must already exist (``create=False``, e.g. segments) with a ``mode=rw``
+  URI, so a file deleted after it was listed raises ``ShardFileMissing`` instead of coming
+  back empty; ``retire`` lets the deleter remove a file while it holds the shard lock
+"""
+
+from __future__ import annotations
+
+import errno
+import itertools
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Iterator
+
+MEMORY_MAX_OPEN_SHARDS = int(os.getenv("MEMORY_MAX_OPEN_SHARDS", "64"))
+MEMORY_SQLITE_BUSY_TIMEOUT = float(os.getenv("MEMORY_SQLITE_BUSY_TIMEOUT", "30"))
+
+SchemaInit = Callable[[sqlite3.Connection], None]
+
+
+class ShardFileMissing(FileNotFoundError):
+    """A file borrowed with ``create=False`` does not exist (any more)."""
+
+
+class _ShardHandle:
+    __slots__ = ("path", "conn", "lock", "closed", "generation")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.conn: sqlite3.Connection | None = None
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+
+class ShardConnectionManager:
+    """LRU-bounded, thread-safe pool of one open connection per shard file."""
+
+    def __init__(self, max_open: int = MEMORY_MAX_OPEN_SHARDS) -> None:
+        self.max_open = max(1, max_open)
+        self._handles: OrderedDict[str, _ShardHandle] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.schema_inits = 0
+        self._generations = itertools.count(1)
+
+    @contextmanager
+    def connection(self, path: Path, init: SchemaInit | None = None, *, create: bool = True) -> Iterator[sqlite3.Connection]:
+        """Borrow the shard connection for ``path``, opening it on a miss.
+
+        The shard lock is held for the duration of the ``with`` block. Any transaction
+        left open by an exception is rolled back before the connection is returned.
+        With ``create=False`` a missing file raises ``ShardFileMissing``.
+        """
+        handle = self._checkout(path, init, create)
+        try:
+            yield handle.conn  # type: ignore[misc]
+        except BaseException:
+            if handle.conn is not None and handle.conn.in_transaction:
+                handle.conn.rollback()
+            raise
+        finally:
+            handle.lock.release()
+            if len(self._handles) > self.max_open:
+                with self._lock:
+                    self._evict_locked(keep=str(path))
+
+    @contextmanager
+    def retire(self, path: Path, init: SchemaInit | None = None) -> Iterator[sqlite3.Connection]:
+        """Borrow ``path`` (which must exist) in order to delete it inside the ``with`` block.
+
+        The connection is closed (rolling back anything left open) and dropped from the pool
+        before the shard lock is released, so borrowers waiting for the lock reopen the file
+        afresh and, once the caller has removed it, get ``ShardFileMissing``. The block may
+        close the connection itself before removing the file.
+        """
+        handle = self._checkout(path, init, create=False)
+        try:
+            yield handle.conn  # type: ignore[misc]
+        finally:
+            with self._lock:
+                if self._handles.get(str(path)) is handle:
+                    del self._handles[str(path)]
+            self._close_handle(handle)
+            handle.lock.release()
+
+    def _checkout(self, path: Path, init: SchemaInit | None, create: bool = True) -> _ShardHandle:
+        key = str(path)
+        while True:
+            with self._lock:
+                self._reset_after_fork()
+                handle = self._handles.get(key)
+                if handle is not None:
+                    self.hits += 1
+                    self._handles.move_to_end(key)
+                else:
+                    self.misses += 1
+                    handle = _ShardHandle(path)
+                    self._handles[key] = handle
+                    self._evict_locked(keep=key)
+            handle.lock.acquire()
+            if handle.closed:
+                # Evicted between lookup and lock; retry with a fresh handle.
+                handle.lock.release()
+                continue
+            if handle.conn is None:
+                try:
+                    handle.conn = self._open(path, init, create)
+                    handle.generation = next(self._generations)
+                except BaseException:
+                    handle.lock.release()
+                    self._discard(key, handle)
+                    raise
+            return handle
+
+    def data_version(self, path: Path, init: SchemaInit | None = None, *, create: bool = True) -> tuple[int, int]:
+        """``(generation, PRAGMA data_version)`` of the pooled connection for ``path``.
+
+        ``data_version`` changes when another connection, e.g. in another process, commits to the
+        file. Its values are per connection, so ``generation`` changes whenever the pooled
+        connection is reopened.
+        """
+        handle = self._checkout(path, init, create)
+        try:
+            return handle.generation, handle.conn.execute("PRAGMA data_version").fetchone()[0]  # type: ignore[union-attr]
+        finally:
+            handle.lock.release()
+
+    def _open(self, path: Path, init: SchemaInit | None, create: bool = True) -> sqlite3.Connection:
+        if create:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=MEMORY_SQLITE_BUSY_TIMEOUT, check_same_thread=False)
+        else:
+            try:
+                conn = sqlite3.connect(
+                    f"{path.absolute().as_uri()}?mode=rw", uri=True, timeout=MEMORY_SQLITE_BUSY_TIMEOUT, check_same_thread=False
+                )
+            except sqlite3.OperationalError:
+                if path.exists():
+                    raise
+                raise ShardFileMissing(errno.ENOENT, "shard file does not exist", str(path)) from None
+        conn.row_factory = sqlite3.Row
+        # Only takes effect on a new file, and only before WAL mode is set; existing files keep their mode.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        if init is not None:
+            init(conn)
+            with self._lock:
+                self.schema_inits += 1
+        return conn
+
+    def _evict_locked(self, keep: str) -> None:
+        """Close least recently used idle handles until under the cap (caller holds ``_lock``).
+
+        Handles that are in use are skipped, so the cap is exceeded temporarily when every
+        other shard is busy rather than blocking the caller.
+        """
+        if len(self._handles) <= self.max_open:
+            return
+        for key in list(self._handles):
+            if len(self._handles) <= self.max_open:
+                break
+            if key == keep:
+                continue
+            handle = self._handles[key]
+            if not handle.lock.acquire(blocking=False):
+                continue  # in use; try the next least recently used
+            try:
+                self._close_handle(handle)
+            finally:
+                handle.lock.release()
+            del self._handles[key]
+            self.evictions += 1
+
+    def _discard(self, key: str, handle: _ShardHandle) -> None:
+        with self._lock:
+            if self._handles.get(key) is handle:
+                del self._handles[key]
+            handle.closed = True
+
+    @staticmethod
+    def _close_handle(handle: _ShardHandle) -> None:
+        handle.closed = True
+        if handle.conn is not None:
+            try:
+                handle.conn.close()
+            except Exception:
+                pass
+            handle.conn = None
+
+    def _reset_after_fork(self) -> None:
+        # SQLite connections must not be shared across fork(); drop (without closing) inherited ones.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            for handle in self._handles.values():
+                handle.closed = True
+            self._handles.clear()
+
+    def close(self, path: Path) -> None:
+        """Close the cached connection for ``path`` (e.g. before deleting the shard file)."""
+        with self._lock:
+            handle = self._handles.pop(str(path), None)
+        if handle is None:
+            return
+        with handle.lock:
+            self._close_handle(handle)
+
+    def close_all(self) -> None:
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+        for handle in handles:
+            with handle.lock:
+                self._close_handle(handle)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "open": len(self._handles),
+                "max_open": self.max_open,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "schema_inits": self.schema_inits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+shard_connections = ShardConnectionManager()
+
+__all__ = ["ShardConnectionManager", "ShardFileMissing", "shard_connections", "MEMORY_MAX_OPEN_SHARDS"]
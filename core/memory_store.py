@@ -4,12 +4,31 @@
 This is the central long-term memory engine for RaeburnBrainAI/BusinessFactory.
 It supports:
 - Sharded SQLite backends (per agent/business + global)
-- TTL expiry and importance pruning/decay
-- Tag filtering + FTS5 keyword search
-- Hybrid scoring (BM25 + recency + importance)
-- Blob references for large binary payloads
+- TTL expiry and importance pruning; importance decays lazily (computed at read time, no rewrite passes)
+- FTS5 kept in sync on insert/update/delete by triggers, merged incrementally in the background
+- Tag filtering (any/all/none) through a normalized, trigger-maintained tag index + FTS5 keyword search
+- Hybrid scoring (BM25 + recency + importance) computed inside the SQL query
+- Per-call ``deadline_ms``: SQLite progress-handler interrupts / Postgres ``statement_timeout``, ``timed_out`` results
+- Read-through LRU/TTL cache for ``get``/``get_relevant`` with precise write invalidation (``core.memory_cache``)
+- Optional zstd compression of large ``text``/``metadata`` with per-shard dictionaries; FTS still sees plain
+  text (``core.memory_compression``)
+- Content-addressed, deduplicated blob payloads with cross-shard refcounts (``core.memory_blobs``)
 - Integrity checks, orphan blob cleanup, soft deletes
-- Optional Postgres backend (JSONB + tsvector) with optional embeddings
+- Online compaction: batched hard deletes + ``incremental_vacuum`` with a per-shard fragmentation metric
+- Append-only change log with ``changes_since`` cursors for incremental consumers (``core.memory_changes``)
+- Typed metadata filters via JSON1 / JSONB with indexed hot keys (``core.memory_metadata``)
+- Streaming NDJSON / Arrow IPC export and bulk import (``core.memory_export``)
+- Pooled per-shard connections (see ``core.memory_shards``) with one-time schema migration
+- Bulk ``add_many`` and an optional write-behind buffer with group commit
+- Indexed TTL expiry: reads filter expired rows, a background reaper deletes them in batches
+- Optional time-bucketed segment files for expiring rows, dropped whole once expired (``core.memory_segments``)
+- Optional per-shard and per-agent row/byte quotas with index-ordered eviction (``core.memory_quotas``)
+- Optional in-memory mirrors of the most-read shards (``core.memory_mirrors``)
+- Optional latency histograms, row counters and a slow-query log (``core.memory_telemetry``)
+- Optional Postgres backend (JSONB, stored tsvector, pgvector HNSW; schema in ``core.memory_pg``); sync
+  calls run on one background event loop so its asyncpg pool is long-lived (``core.memory_async``
+  has the native API)
+- Semantic search over float32 embedding BLOBs via a per-shard vector index (``core.memory_vectors``)
 
 Vector/pg integrations are optional; if MEMORY_DB_URL is set and asyncpg is available,
 Postgres will be used for read/write paths.
@@ -18,15 +37,39 @@ Postgres will be used for read/write paths.
 from __future__ import annotations
 
 import asyncio
+import atexit
 import json
+import logging
+import math
 import os
 import sqlite3
 import threading
 import time
 import uuid
+import weakref
+from contextlib import contextmanager, suppress
 from dataclasses import dataclass, asdict, field
 from pathlib import Path
-from typing import Any, Iterable, List, Sequence
+from typing import IO, Any, BinaryIO, Callable, ContextManager, Iterable, Iterator, List, Sequence
+
+from . import memory_cache, memory_compression, memory_mirrors, memory_quotas, memory_segments, memory_telemetry
+from .memory_blobs import BlobStore, adopt_written
+from .memory_cache import result_cache
+from .memory_changes import ChangeBatch, ensure_change_log_pg, ensure_change_triggers
+from .memory_changes import changes_since as _changes_since
+from .memory_changes import changes_since_pg, compact_changes, latest_seq, log_changes, trim_changes, trim_changes_pg
+from .memory_compression import codec_for, compress_backlog, compression_stats, ensure_compression
+from .memory_compression import ensure_compression_pg, register_functions, unz_sql
+from .memory_metadata import ensure_hot_columns, ensure_indexes_pg, metadata_clauses, metadata_clauses_pg
+from .memory_pg import MEMORY_PG_STATEMENT_CACHE, TSQUERY
+from .memory_pg import init_connection as init_pg_connection
+from .memory_pg import migrate as migrate_pg
+from .memory_export import MEMORY_EXPORT_BATCH, Progress, Target, Transfer, batched, open_writer, read_batches
+from .memory_segments import Segment, all_segments, droppable, is_segment, list_segments, overlapping, segment_for
+from .memory_segments import unlink as unlink_segment
+from .memory_shards import ShardFileMissing, shard_connections
+from .memory_telemetry import timed
+from .memory_vectors import decode_embedding, forget_vector_index, has_vector_index, pack_vector, vector_index
 
 try:  # optional postgres
     import asyncpg  # type: ignore
@@ -45,19 +88,347 @@ MEMORY_TTL_DEFAULT = float(os.getenv("MEMORY_TTL_DEFAULT", "0")) or None
 MEMORY_MAX_RESULTS = int(os.getenv("MEMORY_MAX_RESULTS", "5"))
 MEMORY_QUERY_STRICT = os.getenv("MEMORY_QUERY_STRICT", "false").lower() == "true"
 MEMORY_IMPORTANCE_DECAY = os.getenv("MEMORY_IMPORTANCE_DECAY", "false").lower() == "true"
-MEMORY_DECAY_FACTOR = float(os.getenv("MEMORY_DECAY_FACTOR", "0.98"))  # applied per decay pass
+MEMORY_DECAY_FACTOR = float(os.getenv("MEMORY_DECAY_FACTOR", "0.98"))  # importance multiplier per decay period
+MEMORY_DECAY_PERIOD = float(os.getenv("MEMORY_DECAY_PERIOD", "86400"))  # seconds
 MEMORY_EMBEDDINGS_ENABLED = os.getenv("MEMORY_EMBEDDINGS_ENABLED", "false").lower() == "true"
 MEMORY_DB_URL = os.getenv("MEMORY_DB_URL")  # optional Postgres path (pgvector recommended)
+MEMORY_WRITE_BEHIND = os.getenv("MEMORY_WRITE_BEHIND", "false").lower() == "true"
+MEMORY_WRITE_BATCH_SIZE = int(os.getenv("MEMORY_WRITE_BATCH_SIZE", "256"))  # flush a shard buffer at this size
+MEMORY_WRITE_FLUSH_INTERVAL = float(os.getenv("MEMORY_WRITE_FLUSH_INTERVAL", "0.5"))  # seconds
+MEMORY_WEIGHT_BM25 = float(os.getenv("MEMORY_WEIGHT_BM25", "0.5"))
+MEMORY_WEIGHT_RECENCY = float(os.getenv("MEMORY_WEIGHT_RECENCY", "0.3"))
+MEMORY_WEIGHT_IMPORTANCE = float(os.getenv("MEMORY_WEIGHT_IMPORTANCE", "0.2"))
+MEMORY_RECENCY_SCALE = float(os.getenv("MEMORY_RECENCY_SCALE", "3600"))  # seconds until recency halves
+MEMORY_RRF_K = int(os.getenv("MEMORY_RRF_K", "60"))  # reciprocal-rank-fusion constant for semantic get_relevant
+MEMORY_REAPER_INTERVAL = float(os.getenv("MEMORY_REAPER_INTERVAL", "300"))  # seconds; 0 disables the reaper
+MEMORY_REAPER_BATCH = int(os.getenv("MEMORY_REAPER_BATCH", "500"))  # rows deleted per transaction
+MEMORY_VACUUM_PAGES = int(os.getenv("MEMORY_VACUUM_PAGES", "512"))  # pages released per incremental_vacuum step
+MEMORY_AUTO_COMPACT = os.getenv("MEMORY_AUTO_COMPACT", "true").lower() == "true"  # reaper compacts fragmented shards
+MEMORY_COMPACT_FREE_RATIO = float(os.getenv("MEMORY_COMPACT_FREE_RATIO", "0.2"))  # free pages / total pages
+MEMORY_COMPACT_DEAD_ROWS = int(os.getenv("MEMORY_COMPACT_DEAD_ROWS", "1000"))  # soft-deleted + expired rows
+MEMORY_FTS_MERGE_PAGES = int(os.getenv("MEMORY_FTS_MERGE_PAGES", "256"))  # pages written per FTS5 merge step
+MEMORY_FTS_MERGE_STEPS = int(os.getenv("MEMORY_FTS_MERGE_STEPS", "16"))  # merge steps per shard per reaper pass
+MEMORY_QUERY_DEADLINE_MS = float(os.getenv("MEMORY_QUERY_DEADLINE_MS", "0"))  # default per-call deadline; 0 = none
+MEMORY_PROGRESS_STEPS = int(os.getenv("MEMORY_PROGRESS_STEPS", "1000"))  # SQLite VM steps between deadline checks
+MEMORY_PG_POOL_MIN = int(os.getenv("MEMORY_PG_POOL_MIN", "1"))
+MEMORY_PG_POOL_MAX = int(os.getenv("MEMORY_PG_POOL_MAX", "10"))  # per event loop
 
 SHARDS_DIR = MEMORY_PATH / "shards"
 BLOBS_DIR = MEMORY_PATH / "blobs"
 GLOBAL_DB = MEMORY_PATH / "global.db"
 
-_pg_pool: Any | None = None
-_pg_lock = asyncio.Lock()
+logger = logging.getLogger(__name__)
+
+# asyncpg pools are bound to the loop that created them, so there is one per event loop.
+_pg_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+_pg_pool_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+_pg_pool_locks_guard = threading.Lock()
 _embed_model: Any | None = None
 
 
+def _migrate_v1(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS memory_entries ("
+        "id TEXT PRIMARY KEY,"
+        "agent_id TEXT,"
+        "text TEXT,"
+        "tags TEXT,"
+        "importance REAL,"
+        "created_at REAL,"
+        "expires_at REAL,"
+        "source TEXT,"
+        "metadata TEXT,"
+        "blob_ref TEXT,"
+        "deleted INTEGER DEFAULT 0,"
+        "embedding TEXT"
+        ")"
+    )
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS fts_entries USING fts5(text, content='memory_entries', content_rowid='rowid')"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_ai AFTER INSERT ON memory_entries "
+        "BEGIN INSERT INTO fts_entries(rowid, text) VALUES (new.rowid, new.text); END;"
+    )
+    # Ensure new columns exist on older DBs
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(memory_entries)")}
+    for column, decl in (("deleted", "INTEGER DEFAULT 0"), ("embedding", "TEXT")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE memory_entries ADD COLUMN {column} {decl}")
+
+
+def _migrate_v2(conn: sqlite3.Connection) -> None:
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memory_agent_recent ON memory_entries(agent_id, deleted, created_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_memory_expires ON memory_entries(expires_at) WHERE expires_at IS NOT NULL"
+    )
+
+
+def _migrate_v3(conn: sqlite3.Connection) -> None:
+    # Embeddings move from JSON text to packed float32 BLOBs.
+    rows = conn.execute("SELECT rowid, embedding FROM memory_entries WHERE typeof(embedding) = 'text'").fetchall()
+    updates = []
+    for rowid, value in rows:
+        vec = decode_embedding(value)
+        updates.append((pack_vector(vec) if vec else None, rowid))
+    conn.executemany("UPDATE memory_entries SET embedding = ? WHERE rowid = ?", updates)
+
+
+def _migrate_v4(conn: sqlite3.Connection) -> None:
+    # Deleted rows queue their blob ref so the blob store can drop the reference (see BlobStore.sweep).
+    conn.execute("CREATE TABLE IF NOT EXISTS blob_releases (blob_ref TEXT NOT NULL)")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_blob_ad AFTER DELETE ON memory_entries "
+        "WHEN old.blob_ref IS NOT NULL BEGIN INSERT INTO blob_releases(blob_ref) VALUES (old.blob_ref); END;"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_blob ON memory_entries(blob_ref) WHERE blob_ref IS NOT NULL")
+
+
+def _migrate_v5(conn: sqlite3.Connection) -> None:
+    # Lazy decay: ``importance`` is the value at ``importance_at``; ``decay_key`` indexes the decayed value.
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(memory_entries)")}
+    for column in ("importance_at", "decay_key"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE memory_entries ADD COLUMN {column} REAL")
+    # Existing importances already include the old decay passes, so they decay on from now.
+    conn.execute("UPDATE memory_entries SET importance_at = ?", (time.time(),))
+    conn.execute("CREATE TABLE IF NOT EXISTS memory_settings (key TEXT PRIMARY KEY, value)")
+    _rekey_decay(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_decay ON memory_entries(decay_key)")
+
+
+_TAGS_JSON = "CASE WHEN json_valid({0}.tags) THEN {0}.tags ELSE '[]' END"
+
+
+def _migrate_v6(conn: sqlite3.Connection) -> None:
+    # Normalized tag index kept in step with memory_entries.tags by triggers (keyed by rowid, like FTS).
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS memory_tags (tag TEXT NOT NULL, entry_rowid INTEGER NOT NULL, "
+        "PRIMARY KEY (tag, entry_rowid)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_tags_entry ON memory_tags(entry_rowid)")
+    # The leading DELETE also clears tags left behind by a REPLACE whose rowid is reused.
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_tags_ai AFTER INSERT ON memory_entries BEGIN "
+        "DELETE FROM memory_tags WHERE entry_rowid = new.rowid; "
+        f"INSERT OR IGNORE INTO memory_tags(tag, entry_rowid) SELECT value, new.rowid FROM json_each({_TAGS_JSON.format('new')}); "
+        "END;"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_tags_au AFTER UPDATE OF tags ON memory_entries BEGIN "
+        "DELETE FROM memory_tags WHERE entry_rowid = old.rowid; "
+        f"INSERT OR IGNORE INTO memory_tags(tag, entry_rowid) SELECT value, new.rowid FROM json_each({_TAGS_JSON.format('new')}); "
+        "END;"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_tags_ad AFTER DELETE ON memory_entries BEGIN "
+        "DELETE FROM memory_tags WHERE entry_rowid = old.rowid; END;"
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO memory_tags(tag, entry_rowid) "
+        f"SELECT j.value, e.rowid FROM memory_entries e, json_each({_TAGS_JSON.format('e')}) j"
+    )
+
+
+def _migrate_v7(conn: sqlite3.Connection) -> None:
+    # fts_entries is external-content: removals must be fed back as 'delete' commands with the old text.
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_ad AFTER DELETE ON memory_entries BEGIN "
+        "INSERT INTO fts_entries(fts_entries, rowid, text) VALUES ('delete', old.rowid, old.text); END;"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_au AFTER UPDATE OF text ON memory_entries BEGIN "
+        "INSERT INTO fts_entries(fts_entries, rowid, text) VALUES ('delete', old.rowid, old.text); "
+        "INSERT INTO fts_entries(rowid, text) VALUES (new.rowid, new.text); END;"
+    )
+    # Drop the stale entries left by earlier updates and deletes.
+    conn.execute("INSERT INTO fts_entries(fts_entries) VALUES ('rebuild')")
+
+
+def _migrate_v8(conn: sqlite3.Connection) -> None:
+    # Lets compaction find soft-deleted rows without a scan.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_soft_deleted ON memory_entries(deleted) WHERE deleted = 1")
+
+
+def _migrate_v9(conn: sqlite3.Connection) -> None:
+    # Change log (core.memory_changes); AUTOINCREMENT so sequence numbers are never reused after trimming.
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS memory_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, op TEXT NOT NULL, "
+        "entry_id TEXT NOT NULL, agent_id TEXT, changed_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_changes_entry ON memory_changes(entry_id, seq)")
+
+
+def _migrate_v10(conn: sqlite3.Connection) -> None:
+    # Compressed text/metadata (core.memory_compression); a row uses either the plain or the _z column.
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(memory_entries)")}
+    for column in ("text_z", "metadata_z"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE memory_entries ADD COLUMN {column} BLOB")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS memory_dicts (id INTEGER PRIMARY KEY, codec TEXT NOT NULL, data BLOB NOT NULL, "
+        "samples INTEGER, created_at REAL)"
+    )
+
+
+def _migrate_v11(conn: sqlite3.Connection) -> None:
+    # Quotas (core.memory_quotas): per-agent usage totals and the per-agent eviction order.
+    conn.execute("CREATE TABLE IF NOT EXISTS memory_usage (agent_id TEXT PRIMARY KEY, rows INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_agent_decay ON memory_entries(agent_id, decay_key)")
+
+
+def _migrate_v12(conn: sqlite3.Connection) -> None:
+    # Refs a row gains are queued for the blob store as well, so imported and updated refs are counted.
+    conn.execute("CREATE TABLE IF NOT EXISTS blob_acquires (blob_ref TEXT NOT NULL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_blob_acquires_ref ON blob_acquires(blob_ref)")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_blob_ai AFTER INSERT ON memory_entries "
+        "WHEN new.blob_ref LIKE 'sha256:%' BEGIN INSERT INTO blob_acquires(blob_ref) VALUES (new.blob_ref); END;"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_blob_au AFTER UPDATE OF blob_ref ON memory_entries "
+        "WHEN old.blob_ref IS NOT new.blob_ref BEGIN "
+        "INSERT INTO blob_releases(blob_ref) SELECT old.blob_ref WHERE old.blob_ref IS NOT NULL; "
+        "INSERT INTO blob_acquires(blob_ref) SELECT new.blob_ref WHERE new.blob_ref LIKE 'sha256:%'; END;"
+    )
+
+
+_NEXT_VEC_SEQ = "(SELECT value FROM memory_settings WHERE key = 'vec_seq')"
+
+
+def _migrate_v13(conn: sqlite3.Connection) -> None:
+    # The vector index (core.memory_vectors) is keyed by vec_seq, not rowid: a row takes the next number
+    # whenever it gains or changes an embedding, and a number is never handed out twice, whereas
+    # SQLite gives the rowid of a deleted newest row to the next insert.
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(memory_entries)")}
+    if "vec_seq" not in columns:
+        conn.execute("ALTER TABLE memory_entries ADD COLUMN vec_seq INTEGER")
+    conn.execute("UPDATE memory_entries SET vec_seq = rowid WHERE embedding IS NOT NULL")
+    conn.execute(
+        "INSERT OR REPLACE INTO memory_settings (key, value) VALUES ('vec_seq', (SELECT coalesce(max(rowid), 0) FROM memory_entries))"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_vec_seq ON memory_entries(vec_seq) WHERE vec_seq IS NOT NULL")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_vec_ai AFTER INSERT ON memory_entries WHEN new.embedding IS NOT NULL BEGIN "
+        "UPDATE memory_settings SET value = value + 1 WHERE key = 'vec_seq'; "
+        f"UPDATE memory_entries SET vec_seq = {_NEXT_VEC_SEQ} WHERE rowid = new.rowid; END;"
+    )
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS memory_entries_vec_au AFTER UPDATE OF embedding ON memory_entries "
+        "WHEN new.embedding IS NOT old.embedding BEGIN "
+        "UPDATE memory_settings SET value = value + 1 WHERE key = 'vec_seq'; "
+        f"UPDATE memory_entries SET vec_seq = CASE WHEN new.embedding IS NULL THEN NULL ELSE {_NEXT_VEC_SEQ} END "
+        "WHERE rowid = new.rowid; END;"
+    )
+
+
+# Schema migrations, applied in order; a shard's ``PRAGMA user_version`` records how many have run.
+_MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    _migrate_v1,
+    _migrate_v2,
+    _migrate_v3,
+    _migrate_v4,
+    _migrate_v5,
+    _migrate_v6,
+    _migrate_v7,
+    _migrate_v8,
+    _migrate_v9,
+    _migrate_v10,
+    _migrate_v11,
+    _migrate_v12,
+    _migrate_v13,
+]
+
+_LOAD_COLUMNS = (
+    "id", "agent_id", "text", "tags", "importance", "created_at", "expires_at", "source", "metadata", "blob_ref",
+    "deleted", "embedding", "importance_at", "decay_key",
+)
+# An upsert rather than INSERT OR REPLACE: the row keeps its rowid and the UPDATE triggers
+# (FTS, tags) fire, whereas REPLACE deletes without running DELETE triggers.
+_LOAD_COLUMNS_SQLITE = (*_LOAD_COLUMNS, "text_z", "metadata_z")
+_LOAD_SQL = (
+    f"INSERT INTO memory_entries ({', '.join(_LOAD_COLUMNS_SQLITE)}) VALUES ({', '.join('?' * len(_LOAD_COLUMNS_SQLITE))}) "
+    "ON CONFLICT(id) DO UPDATE SET "
+    + ", ".join(f"{c} = excluded.{c}" for c in _LOAD_COLUMNS_SQLITE if c not in ("id", "agent_id"))
+)
+
+_INSERT_SQL = (
+    "INSERT INTO memory_entries (id, agent_id, text, tags, importance, created_at, expires_at, source, metadata, blob_ref, deleted, embedding, "
+    "importance_at, decay_key, text_z, metadata_z) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?)"
+)
+_INSERT_SQL_PG = (
+    "INSERT INTO memory_entries (id, agent_id, text, tags, importance, created_at, expires_at, source, metadata, blob_ref, deleted, embedding, "
+    "importance_at, decay_key) VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12,$13,$14)"
+)
+
+# ---------- Lazy importance decay ----------
+# Effective importance is importance * MEMORY_DECAY_FACTOR ** ((now - importance_at) / MEMORY_DECAY_PERIOD).
+# Its log is (ln(importance) + rate * importance_at) - rate * now, so the per-row part,
+# decay_key = ln(importance) + rate * importance_at, never changes and can be indexed:
+# effective < threshold  <=>  decay_key < ln(threshold) + rate * now.
+_NO_IMPORTANCE_KEY = -1e300  # decay_key for importance <= 0
+
+# Fields ``update_many`` accepts; pairs that cannot be combined in one change.
+_UPDATE_FIELDS = ("text", "tags", "metadata", "importance", "importance_delta", "ttl", "extend_ttl")
+_UPDATE_CONFLICTS = (("importance", "importance_delta"), ("ttl", "extend_ttl"))
+_UPDATE_NUMBERS = ("importance", "importance_delta", "ttl", "extend_ttl")
+
+
+def _decay_rate() -> float:
+    """Per-second decay constant (0 when decay is disabled)."""
+    if not MEMORY_IMPORTANCE_DECAY or not 0 < MEMORY_DECAY_FACTOR < 1 or MEMORY_DECAY_PERIOD <= 0:
+        return 0.0
+    return -math.log(MEMORY_DECAY_FACTOR) / MEMORY_DECAY_PERIOD
+
+
+def _decay_key(importance: float | None, importance_at: float) -> float | None:
+    if importance is None:
+        return None
+    if importance <= 0:
+        return _NO_IMPORTANCE_KEY
+    return math.log(importance) + _decay_rate() * importance_at
+
+
+def _effective_importance(importance: float | None, importance_at: float | None, now: float) -> float:
+    rate = _decay_rate()
+    if not importance or not rate or importance_at is None:
+        return importance or 0.0
+    return importance * math.exp(-rate * max(0.0, now - importance_at))
+
+
+def _importance_sql(now: float, alias: str = "e.") -> tuple[str, list[Any]]:
+    """SQL expression (and parameters) for the effective importance of a row."""
+    rate = _decay_rate()
+    if not rate:
+        return f"COALESCE({alias}importance, 0.0)", []
+    return f"COALESCE(exp({alias}decay_key - ?), 0.0)", [rate * now]
+
+
+def _rekey_decay(conn: sqlite3.Connection) -> None:
+    """Recompute ``decay_key`` when the decay rate differs from the one the keys were built with."""
+    rate = _decay_rate()
+    row = conn.execute("SELECT value FROM memory_settings WHERE key = 'decay_rate'").fetchone()
+    if row is not None and row[0] == rate:
+        return
+    conn.execute(
+        "UPDATE memory_entries SET decay_key = CASE WHEN importance IS NULL THEN NULL "
+        "WHEN importance <= 0 THEN ? ELSE ln(importance) + ? * importance_at END",
+        (_NO_IMPORTANCE_KEY, rate),
+    )
+    conn.execute("INSERT OR REPLACE INTO memory_settings (key, value) VALUES ('decay_rate', ?)", (rate,))
+
+
+def _register_math_functions(conn: sqlite3.Connection) -> None:
+    # SQLite builds without SQLITE_ENABLE_MATH_FUNCTIONS lack ln()/exp().
+    try:
+        conn.execute("SELECT ln(1.0), exp(0.0)").fetchone()
+    except sqlite3.OperationalError:
+        conn.create_function("ln", 1, lambda x: math.log(x) if x is not None and x > 0 else None, deterministic=True)
+        conn.create_function("exp", 1, lambda x: math.exp(x) if x is not None else None, deterministic=True)
+
+
 @dataclass
 class MemoryItem:
     id: str
@@ -72,6 +443,788 @@ class MemoryItem:
     blob_ref: str | None = None
     deleted: bool = False
     embedding: list[float] | None = None
+    score: float | None = None  # set by ranked queries (search/get_relevant)
+
+
+class _WriteBehindBuffer:
+    """Per-shard queues of pending inserts, written with one ``executemany`` + commit per flush.
+
+    A shard is flushed when its queue reaches ``MEMORY_WRITE_BATCH_SIZE`` or, at the latest,
+    ``MEMORY_WRITE_FLUSH_INTERVAL`` seconds after the first enqueue by a background thread.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[Path, list[tuple[Any, ...]]] = {}
+        self._init: dict[Path, Callable[[sqlite3.Connection], None]] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.flushed_rows = 0
+        self.flushes = 0
+
+    def enqueue(self, path: Path, init: Callable[[sqlite3.Connection], None], params: tuple[Any, ...]) -> None:
+        with self._lock:
+            queue = self._pending.setdefault(path, [])
+            queue.append(params)
+            self._init[path] = init
+            full = len(queue) >= MEMORY_WRITE_BATCH_SIZE
+            self._ensure_thread()
+        if full:
+            self.flush(path)
+        else:
+            self._wake.set()
+
+    def has_pending(self, path: Path) -> bool:
+        return bool(self._pending.get(path))
+
+    def flush(self, path: Path | None = None) -> int:
+        """Write pending rows for ``path`` (or every shard) and return how many were committed."""
+        with self._lock:
+            paths = [path] if path is not None else list(self._pending)
+            batches = [(p, self._pending.pop(p, []), self._init.get(p)) for p in paths]
+        written = 0
+        for shard_path, rows, init in batches:
+            if not rows:
+                continue
+            try:
+                with shard_connections.connection(shard_path, init=init) as conn:
+                    conn.executemany(_INSERT_SQL, rows)
+                    adopt_written(conn, (r[9] for r in rows))
+                    conn.commit()
+            except BaseException:
+                with self._lock:  # keep the rows so a later flush can retry
+                    self._pending[shard_path] = rows + self._pending.get(shard_path, [])
+                raise
+            written += len(rows)
+        if written:
+            with self._lock:
+                self.flushed_rows += written
+                self.flushes += 1
+        return written
+
+    def close(self) -> None:
+        """Stop the flusher thread and write everything still buffered."""
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5.0)
+        self._thread = None
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait()
+            # Let the batch fill before committing; close() cuts the wait short.
+            if self._stop.wait(MEMORY_WRITE_FLUSH_INTERVAL):
+                break
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:  # rows stay queued; retried on the next tick or on close()
+                logger.exception("write-behind flush failed; buffered rows are kept for the next attempt")
+
+
+_write_buffer = _WriteBehindBuffer()
+
+# FTS5 bm25() is <= 0 with lower meaning better; map it onto [0, 1) with higher meaning better.
+_BM25_NORM_SQL = "(-bm25(fts_entries) / (1.0 - bm25(fts_entries)))"
+
+
+def _hybrid_score_sql(text_match: bool) -> tuple[str, list[Any]]:
+    """SQLite expression (and its parameters) for the BM25 + recency + importance score of row ``e``."""
+    bm25 = f"? * {_BM25_NORM_SQL} + " if text_match else ""
+    now = time.time()
+    importance_sql, importance_params = _importance_sql(now)
+    sql = f"({bm25}? / (1.0 + (? - e.created_at) / ?) + ? * {importance_sql})"
+    params: list[Any] = [MEMORY_WEIGHT_BM25] if text_match else []
+    params += [MEMORY_WEIGHT_RECENCY, now, MEMORY_RECENCY_SCALE, MEMORY_WEIGHT_IMPORTANCE, *importance_params]
+    return sql, params
+
+
+@dataclass(frozen=True)
+class TagFilter:
+    """Tag conditions: entries tagged with any of ``any_of``, all of ``all_of`` and none of ``none_of``.
+
+    SQLite evaluates them against the ``memory_tags`` index, Postgres against the GIN index on ``tags``.
+    """
+
+    any_of: tuple[str, ...] = ()
+    all_of: tuple[str, ...] = ()
+    none_of: tuple[str, ...] = ()
+    exact: tuple[str, ...] | None = None  # MEMORY_QUERY_STRICT: the tag list must match exactly
+
+    @classmethod
+    def build(
+        cls,
+        tags: Sequence[str] | None = None,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+    ) -> "TagFilter | None":
+        """Combine the public keyword arguments; plain ``tags`` means "any of" unless MEMORY_QUERY_STRICT."""
+        any_of = list(tags_any or [])
+        exact = None
+        if tags:
+            if MEMORY_QUERY_STRICT:
+                exact = tuple(tags)
+            else:
+                any_of.extend(tags)
+        flt = cls(
+            tuple(dict.fromkeys(any_of)), tuple(dict.fromkeys(tags_all or [])), tuple(dict.fromkeys(tags_none or [])), exact
+        )
+        return flt if (flt.any_of or flt.all_of or flt.none_of or flt.exact is not None) else None
+
+    def sql(self) -> tuple[list[str], list[Any]]:
+        """SQLite clauses (and parameters) over ``memory_entries e``."""
+        clauses: list[str] = []
+        params: list[Any] = []
+        if self.any_of:
+            clauses.append(f"e.rowid IN (SELECT entry_rowid FROM memory_tags WHERE tag IN ({','.join('?' * len(self.any_of))}))")
+            params.extend(self.any_of)
+        if self.all_of:
+            clauses.append(
+                f"e.rowid IN (SELECT entry_rowid FROM memory_tags WHERE tag IN ({','.join('?' * len(self.all_of))}) "
+                "GROUP BY entry_rowid HAVING count(*) = ?)"
+            )
+            params.extend([*self.all_of, len(self.all_of)])
+        if self.none_of:
+            clauses.append(
+                f"e.rowid NOT IN (SELECT entry_rowid FROM memory_tags WHERE tag IN ({','.join('?' * len(self.none_of))}))"
+            )
+            params.extend(self.none_of)
+        if self.exact is not None:
+            clauses.append("e.tags = ?")
+            params.append(json.dumps(list(self.exact)))
+        return clauses, params
+
+    def sql_pg(self, args: "_PgArgs") -> list[str]:
+        clauses = []
+        if self.any_of:
+            clauses.append(f"tags ?| {args.add(list(self.any_of))}::text[]")
+        if self.all_of:
+            clauses.append(f"tags ?& {args.add(list(self.all_of))}::text[]")
+        if self.none_of:
+            clauses.append(f"NOT (tags ?| {args.add(list(self.none_of))}::text[])")
+        if self.exact is not None:
+            clauses.append(f"tags = {args.add(list(self.exact))}::jsonb")
+        return clauses
+
+
+class _PgArgs(list):
+    """Positional asyncpg arguments; ``add`` appends a value and returns its ``$n`` placeholder."""
+
+    def add(self, value: Any) -> str:
+        self.append(value)
+        return f"${len(self)}"
+
+
+class QueryResult(List[MemoryItem]):
+    """Query results; ``timed_out`` is set when the deadline cut the query short.
+
+    Results are then partial (rows produced before the interrupt, in order) or empty.
+    """
+
+    def __init__(self, items: Iterable[MemoryItem] = (), timed_out: bool = False) -> None:
+        super().__init__(items)
+        self.timed_out = timed_out
+
+
+class _DeadlineStats:
+    """Per-operation counts of queries run under a deadline and of deadline hits."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: dict[str, dict[str, int]] = {}
+
+    def record(self, op: str, timed_out: bool) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(op, {"queries": 0, "timed_out": 0})
+            counts["queries"] += 1
+            counts["timed_out"] += int(timed_out)
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {op: dict(counts) for op, counts in self._counts.items()}
+
+
+_deadline_stats = _DeadlineStats()
+
+
+def _deadline_at(deadline_ms: float | None) -> float | None:
+    """Absolute ``time.monotonic()`` deadline for a call; ``MEMORY_QUERY_DEADLINE_MS`` when not given."""
+    ms = MEMORY_QUERY_DEADLINE_MS if deadline_ms is None else deadline_ms
+    return time.monotonic() + ms / 1000.0 if ms and ms > 0 else None
+
+
+def _fetch(
+    conn: sqlite3.Connection, sql: str, params: Sequence[Any], deadline: float | None
+) -> tuple[list[sqlite3.Row], bool]:
+    """Run a query, interrupting it through the progress handler once ``deadline`` passes.
+
+    Returns the rows produced so far and whether the query was interrupted.
+    """
+    if memory_telemetry.MEMORY_TELEMETRY:
+        return _fetch_measured(conn, sql, params, deadline)
+    if deadline is None:
+        return conn.execute(sql, params).fetchall(), False
+    rows: list[sqlite3.Row] = []
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, MEMORY_PROGRESS_STEPS)
+    try:
+        for row in conn.execute(sql, params):
+            rows.append(row)
+        return rows, False
+    except sqlite3.OperationalError as exc:
+        if "interrupted" not in str(exc):
+            raise
+        return rows, True
+    finally:
+        conn.set_progress_handler(None, 0)  # the connection is pooled
+
+
+def _fetch_measured(
+    conn: sqlite3.Connection, sql: str, params: Sequence[Any], deadline: float | None
+) -> tuple[list[sqlite3.Row], bool]:
+    """``_fetch`` with telemetry: the progress handler also samples VM steps for the scan counter."""
+    every = memory_telemetry.MEMORY_TELEMETRY_STEPS
+    samples = 0
+
+    def progress() -> bool:
+        nonlocal samples
+        samples += 1
+        return deadline is not None and time.monotonic() > deadline
+
+    rows: list[sqlite3.Row] = []
+    timed_out = False
+    start = time.perf_counter()
+    conn.set_progress_handler(progress, every)
+    try:
+        for row in conn.execute(sql, params):
+            rows.append(row)
+    except sqlite3.OperationalError as exc:
+        if "interrupted" not in str(exc):
+            raise
+        timed_out = True
+    finally:
+        conn.set_progress_handler(None, 0)
+    memory_telemetry.record_query(
+        sql,
+        params,
+        time.perf_counter() - start,
+        len(rows),
+        samples * every,
+        lambda: [r[3] for r in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)],
+    )
+    return rows, timed_out
+
+
+async def _fetch_pg(conn: Any, sql: str, args: Sequence[Any], deadline: float | None) -> tuple[list[Any], bool]:
+    """Postgres counterpart of ``_fetch``: the remaining time becomes a local ``statement_timeout``."""
+    if memory_telemetry.MEMORY_TELEMETRY:
+        start = time.perf_counter()
+        rows, timed_out = await _fetch_pg_unmeasured(conn, sql, args, deadline)
+        seconds = time.perf_counter() - start
+        plan: list[str] = []
+        if seconds * 1000.0 >= memory_telemetry.MEMORY_SLOW_QUERY_MS:
+            plan = [r[0] for r in await conn.fetch(f"EXPLAIN {sql}", *args)]
+        memory_telemetry.record_query(sql, args, seconds, len(rows), 0, lambda: plan)
+        return rows, timed_out
+    return await _fetch_pg_unmeasured(conn, sql, args, deadline)
+
+
+async def _fetch_pg_unmeasured(conn: Any, sql: str, args: Sequence[Any], deadline: float | None) -> tuple[list[Any], bool]:
+    if deadline is None:
+        return await conn.fetch(sql, *args), False
+    remaining_ms = max(1, int((deadline - time.monotonic()) * 1000))
+    try:
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL statement_timeout = {remaining_ms}")
+            return await conn.fetch(sql, *args), False
+    except asyncpg.exceptions.QueryCanceledError:
+        return [], True
+
+
+def _shard_paths() -> list[Path]:
+    """Every SQLite shard file currently on disk (global DB first)."""
+    paths = [GLOBAL_DB] if GLOBAL_DB.exists() else []
+    if SHARDS_DIR.exists():
+        paths.extend(sorted(SHARDS_DIR.glob("*.db")))
+    return paths
+
+
+def _all_paths() -> list[Path]:
+    """Shard files plus their segment files."""
+    bases = _shard_paths()
+    return bases + [s.path for s in all_segments(bases)]
+
+
+def _shard_connection(path: Path) -> ContextManager[sqlite3.Connection]:
+    """Pooled connection to a shard or segment file. Segment files are only created by
+    ``memory_segments.create``: one dropped after it was listed raises ``ShardFileMissing``."""
+    return shard_connections.connection(path, init=MemoryStore._ensure_schema, create=not is_segment(path))
+
+
+def _shard_name(path: Path) -> str:
+    return f"{path.parent.stem}/{path.stem}" if is_segment(path) else path.stem
+
+
+def _drop_expired_segments(base: Path, now: float) -> int:
+    """Unlink the segments of ``base`` whose rows have all expired; returns the rows they held."""
+    dropped = 0
+    for segment in list_segments(base):
+        if segment.end > now:
+            continue
+        rows = None
+        # The segment's lock is held from the check to the unlink, so no write can land in between;
+        # readers that listed it wait and then skip it (gone already: another process dropped it).
+        with suppress(ShardFileMissing), shard_connections.retire(segment.path, init=MemoryStore._ensure_schema) as conn:
+            if not droppable(conn, segment, now):
+                continue
+            rows = conn.execute("SELECT id, agent_id, blob_ref FROM memory_entries").fetchall()
+            MemoryStore._blobs().drain(conn)
+            conn.close()
+            forget_vector_index(segment.path)
+            unlink_segment(segment)
+        if rows is None:
+            continue
+        MemoryStore._blobs().release(r[2] for r in rows if r[2])
+        with shard_connections.connection(base, init=MemoryStore._ensure_schema) as conn:
+            log_changes(conn, [("delete", r[0], r[1]) for r in rows])
+        dropped += len(rows)
+    if dropped:
+        result_cache.bump(str(base))
+    return dropped
+
+
+_EXPIRED_WHERE = "expires_at IS NOT NULL AND expires_at < ?"
+_SOFT_DELETED_WHERE = "deleted = 1"
+
+
+def _quota_usage(base: Path) -> dict[str, tuple[int, int]]:
+    """Per-agent ``(rows, bytes)`` of a shard, summed over its base file and segments."""
+    totals: dict[str, tuple[int, int]] = {}
+    for path in [base, *(s.path for s in list_segments(base))]:
+        with suppress(ShardFileMissing), _shard_connection(path) as conn:
+            for agent_id, (rows, size) in memory_quotas.usage(conn).items():
+                seen = totals.get(agent_id, (0, 0))
+                totals[agent_id] = (seen[0] + rows, seen[1] + size)
+    return totals
+
+
+def _evict(base: Path, over: memory_quotas.Overage) -> tuple[int, int]:
+    """Delete a shard's least valuable entries (of ``over.agent_id``, if set) until ``over`` is covered."""
+    paths = [base, *(s.path for s in list_segments(base))]
+    rows_left, bytes_left = over.rows, over.bytes
+    removed = size = 0
+    while rows_left > 0 or bytes_left > 0:
+        pool: list[tuple[Path, sqlite3.Row]] = []
+        for path in paths:
+            with suppress(ShardFileMissing), _shard_connection(path) as conn:
+                pool.extend((path, r) for r in memory_quotas.candidates(conn, over.agent_id, memory_quotas.MEMORY_EVICTION_BATCH))
+        if not pool:
+            break
+        pool.sort(key=lambda c: (c[1]["decay_key"] is not None, c[1]["decay_key"] or 0.0, c[1]["created_at"]))
+        victims: dict[Path, list[sqlite3.Row]] = {}
+        for path, row in pool[: memory_quotas.MEMORY_EVICTION_BATCH]:
+            if rows_left <= 0 and bytes_left <= 0:
+                break
+            victims.setdefault(path, []).append(row)
+            rows_left -= 1
+            bytes_left -= row["_bytes"]
+        for path, rows in victims.items():
+            rowids = [r["_rowid"] for r in rows]
+            with _shard_connection(path) as conn:
+                conn.execute("DELETE FROM memory_entries WHERE rowid IN (SELECT value FROM json_each(?))", (json.dumps(rowids),))
+                conn.commit()
+                if has_vector_index(path):
+                    vector_index(path).note_deleted(conn, [r["vec_seq"] for r in rows])
+            if is_segment(path):
+                with shard_connections.connection(base, init=MemoryStore._ensure_schema) as conn:
+                    log_changes(conn, [("delete", r["id"], r["agent_id"]) for r in rows])
+            removed += len(rows)
+            size += sum(r["_bytes"] for r in rows)
+    return removed, size
+
+
+def _enforce_quota(base: Path) -> int:
+    """Evict from one shard until it and each of its agents are within quota; returns rows evicted."""
+    if not memory_quotas.enabled():
+        return 0
+    if _write_buffer.has_pending(base):
+        _write_buffer.flush(base)
+    removed = size = 0
+    totals = _quota_usage(base)
+    for over in memory_quotas.agent_overages(totals):
+        rows, nbytes = _evict(base, over)
+        removed, size = removed + rows, size + nbytes
+    over = memory_quotas.shard_overage(_quota_usage(base) if removed else totals)
+    if over is not None:
+        rows, nbytes = _evict(base, over)
+        removed, size = removed + rows, size + nbytes
+    if removed:
+        memory_quotas.eviction_stats.record(base.stem, removed, size)
+        result_cache.bump(str(base))
+    return removed
+
+
+_quota_writes: dict[str, int] = {}
+_quota_writes_lock = threading.Lock()
+
+
+def _prepare_mirror(conn: sqlite3.Connection, path: Path) -> None:
+    _register_math_functions(conn)
+    register_functions(conn, path)
+    ensure_change_triggers(conn, enabled=False)  # the copy follows the file's log, it keeps none
+
+
+_mirrors = memory_mirrors.MirrorManager(prepare=_prepare_mirror)
+
+
+def _delete_batch(conn: sqlite3.Connection, where: str, params: Sequence[Any], batch: int) -> list[sqlite3.Row]:
+    """Delete at most ``batch`` rows matching ``where`` in one transaction; returns their ``(rowid, id, agent_id, vec_seq)``."""
+    rows = conn.execute(f"SELECT rowid, id, agent_id, vec_seq FROM memory_entries WHERE {where} LIMIT ?", (*params, batch)).fetchall()
+    if rows:
+        conn.execute(f"DELETE FROM memory_entries WHERE rowid IN ({','.join('?' * len(rows))})", [r[0] for r in rows])
+        conn.commit()
+    return rows
+
+
+def _delete_expired(conn: sqlite3.Connection, now: float, batch: int | None = None) -> list[sqlite3.Row]:
+    """Delete expired rows through the ``expires_at`` index, committing every ``batch`` rows.
+
+    Returns the deleted rows as ``_delete_batch`` does.
+    """
+    batch = batch or MEMORY_REAPER_BATCH
+    removed: list[sqlite3.Row] = []
+    while True:
+        rows = _delete_batch(conn, _EXPIRED_WHERE, (now,), batch)
+        removed.extend(rows)
+        if len(rows) < batch:
+            return removed
+
+
+def _incremental_vacuum(conn: sqlite3.Connection, pages: int | None = None) -> int:
+    """Release up to ``pages`` free pages to the filesystem (auto_vacuum=INCREMENTAL shards); returns pages freed."""
+    before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if not before or conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages or MEMORY_VACUUM_PAGES)})").fetchall()
+    conn.commit()
+    return before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def _fragmentation(conn: sqlite3.Connection) -> dict[str, Any]:
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    soft_deleted = conn.execute(f"SELECT count(*) FROM memory_entries WHERE {_SOFT_DELETED_WHERE}").fetchone()[0]
+    expired = conn.execute(f"SELECT count(*) FROM memory_entries WHERE {_EXPIRED_WHERE}", (time.time(),)).fetchone()[0]
+    free_ratio = free_pages / page_count if page_count else 0.0
+    return {
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "page_count": page_count,
+        "free_pages": free_pages,
+        "free_ratio": round(free_ratio, 4),
+        "soft_deleted": soft_deleted,
+        "expired": expired,
+        "incremental_vacuum": conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2,
+        "needs_compaction": free_ratio >= MEMORY_COMPACT_FREE_RATIO or soft_deleted + expired >= MEMORY_COMPACT_DEAD_ROWS,
+    }
+
+
+def _total_fragmentation(files: Sequence[dict[str, Any]]) -> dict[str, Any]:
+    """``_fragmentation`` summed over a shard's base file and segments; compaction is due if any file needs it."""
+    total = dict(files[0])
+    for key in ("page_count", "free_pages", "soft_deleted", "expired"):
+        total[key] = sum(f[key] for f in files)
+    total["free_ratio"] = round(total["free_pages"] / total["page_count"], 4) if total["page_count"] else 0.0
+    total["incremental_vacuum"] = all(f["incremental_vacuum"] for f in files)
+    total["needs_compaction"] = any(f["needs_compaction"] for f in files)
+    total["files"] = len(files)
+    return total
+
+
+def _merge_fts(conn: sqlite3.Connection, steps: int | None = None, stop: threading.Event | None = None) -> int:
+    """Run up to ``steps`` small FTS5 incremental merges; returns the number that did work."""
+    steps = MEMORY_FTS_MERGE_STEPS if steps is None else steps
+    merged = 0
+    for _ in range(steps):
+        if stop is not None and stop.is_set():
+            break
+        before = conn.total_changes
+        conn.execute("INSERT INTO fts_entries(fts_entries, rank) VALUES ('merge', ?)", (MEMORY_FTS_MERGE_PAGES,))
+        conn.commit()
+        if conn.total_changes - before < 2:  # FTS5: fewer than two changes means nothing was left to merge
+            break
+        merged += 1
+    return merged
+
+
+class _ExpiryReaper:
+    """Single background thread that expires TTL rows across all shards every ``MEMORY_REAPER_INTERVAL``
+    and then spends a few small FTS5 merge steps on each shard, keeping index maintenance off the hot path."""
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.reaped = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if MEMORY_REAPER_INTERVAL <= 0 or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="memory-expiry-reaper", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5.0)
+        self._thread = None
+
+    def reap_once(self, stop: threading.Event | None = None) -> int:
+        now = time.time()
+        removed = 0
+        for path in _shard_paths():
+            if stop is not None and stop.is_set():
+                break
+            with shard_connections.connection(path, init=MemoryStore._ensure_schema) as conn:
+                reaped = _delete_expired(conn, now)
+                if reaped and has_vector_index(path):
+                    vector_index(path).note_deleted(conn, [r["vec_seq"] for r in reaped])
+            if reaped:
+                result_cache.bump(str(path))
+            removed += len(reaped) + _drop_expired_segments(path, now)
+        self.runs += 1
+        self.reaped += removed
+        return removed
+
+    def compact_once(self, stop: threading.Event | None = None, force: bool = False) -> dict[str, dict[str, Any]]:
+        """Compact every shard whose fragmentation crosses the MEMORY_COMPACT_* thresholds (all with ``force``)."""
+        reports: dict[str, dict[str, Any]] = {}
+        for path in _shard_paths():
+            if stop is not None and stop.is_set():
+                break
+            store = MemoryStore(shard=None if path == GLOBAL_DB else path.stem)
+            if force or store.fragmentation()["needs_compaction"]:
+                reports[path.stem] = store.compact(stop=stop)
+        return reports
+
+    def merge_once(self, stop: threading.Event | None = None) -> int:
+        merged = 0
+        for path in _all_paths():
+            if stop is not None and stop.is_set():
+                break
+            with suppress(ShardFileMissing), _shard_connection(path) as conn:
+                merged += _merge_fts(conn, stop=stop)
+        return merged
+
+    def compress_once(self, stop: threading.Event | None = None) -> int:
+        """Train missing dictionaries and compress a batch of older plain rows in every shard."""
+        compressed = 0
+        for path in _all_paths():
+            if stop is not None and stop.is_set():
+                break
+            done = 0
+            with suppress(ShardFileMissing), _shard_connection(path) as conn:
+                codec = codec_for(path)
+                codec.refresh(conn)  # another process may have trained one already
+                if not codec.has_dictionary:
+                    codec.train(conn)
+                done = compress_backlog(conn, codec, MEMORY_REAPER_BATCH)
+            if done:
+                result_cache.bump(str(memory_segments.base_of(path) if is_segment(path) else path))
+            compressed += done
+        return compressed
+
+    def evict_once(self, stop: threading.Event | None = None) -> int:
+        evicted = 0
+        for path in _shard_paths():
+            if stop is not None and stop.is_set():
+                break
+            evicted += _enforce_quota(path)
+        return evicted
+
+    def trim_once(self, stop: threading.Event | None = None) -> int:
+        """Apply change-log retention to every shard."""
+        trimmed = 0
+        for path in _shard_paths():
+            if stop is not None and stop.is_set():
+                break
+            with shard_connections.connection(path, init=MemoryStore._ensure_schema) as conn:
+                trimmed += trim_changes(conn)
+        return trimmed
+
+    def _steps(self) -> list[tuple[str, Callable[[], Any]]]:
+        if MEMORY_DB_URL and asyncpg is not None:
+            store = MemoryStore()
+            return [("prune", lambda: store._run_async(store._prune_expired_pg())), ("trim", store.trim_changes)]
+        steps: list[tuple[str, Callable[[], Any]]] = [
+            ("reap", lambda: self.reap_once(stop=self._stop)),
+            ("merge", lambda: self.merge_once(stop=self._stop)),
+            ("trim", lambda: self.trim_once(stop=self._stop)),
+        ]
+        if memory_quotas.enabled():
+            steps.append(("evict", lambda: self.evict_once(stop=self._stop)))
+        if memory_compression.MEMORY_COMPRESSION:
+            steps.append(("compress", lambda: self.compress_once(stop=self._stop)))
+        if MEMORY_AUTO_COMPACT:
+            steps.append(("compact", lambda: self.compact_once(stop=self._stop)))
+        return steps
+
+    def run_once(self) -> int:
+        """One reaper pass; a failing step is logged and the pass goes on. Returns the steps that failed."""
+        failed = 0
+        for name, step in self._steps():
+            if self._stop.is_set():
+                break
+            try:
+                step()
+            except Exception:  # a locked or corrupt shard must not kill the reaper; retried next interval
+                failed += 1
+                logger.exception("memory reaper step %r failed", name)
+        return failed
+
+    def _run(self) -> None:
+        while not self._stop.wait(MEMORY_REAPER_INTERVAL):
+            self.run_once()
+
+
+_reaper = _ExpiryReaper()
+
+
+async def close_pg_pool() -> None:
+    """Close the asyncpg pool bound to the running event loop, if any."""
+    pool = _pg_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+class _EventLoopThread:
+    """One background event loop that runs the Postgres coroutines of every sync ``MemoryStore`` call.
+
+    The loop (and so its asyncpg pool) lives for the whole process instead of one loop per call,
+    and callers that already run inside another event loop block on a future instead of deadlocking.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._thread is None or not self._thread.is_alive():  # also after fork
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                thread = threading.Thread(target=self._run, args=(loop, ready), name="memory-event-loop", daemon=True)
+                thread.start()
+                ready.wait()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop, ready: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    def run(self, coro: Any) -> Any:
+        loop = self._ensure_loop()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("synchronous MemoryStore call from the memory event loop; use AsyncMemoryStore")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def stop(self) -> None:
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None or thread is None or not thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(close_pg_pool(), loop).result(timeout=5.0)
+        except Exception:
+            pass  # best effort; the server drops the connections when the process exits
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5.0)
+
+
+_loop_thread = _EventLoopThread()
+
+
+def reap_expired() -> int:
+    """Expire TTL rows in every SQLite shard now; returns the number of rows deleted."""
+    return _reaper.reap_once()
+
+
+def compact_shards(force: bool = False) -> dict[str, dict[str, Any]]:
+    """Compact fragmented SQLite shards now (every shard with ``force``); returns per-shard reports."""
+    return _reaper.compact_once(force=force)
+
+
+def telemetry_metrics() -> str:
+    """Memory telemetry in the Prometheus text format, for a ``/metrics`` endpoint."""
+    return memory_telemetry.telemetry.render()
+
+
+def enforce_quotas() -> int:
+    """Evict over-quota entries from every SQLite shard now; returns the number of rows evicted."""
+    return _reaper.evict_once()
+
+
+def quota_report() -> dict[str, dict[str, Any]]:
+    """Per-shard usage and quota headroom (per agent too) plus eviction counters, keyed by shard name."""
+    evictions = memory_quotas.eviction_stats.snapshot()
+    return {
+        path.stem: {**memory_quotas.headroom(_quota_usage(path)), **evictions.get(path.stem, {})}
+        for path in _shard_paths()
+    }
+
+
+def merge_fts_indexes() -> int:
+    """Run a round of incremental FTS merges on every SQLite shard now; returns the steps that did work."""
+    return _reaper.merge_once()
+
+
+def compression_report() -> dict[str, dict[str, Any]]:
+    """Compression ratio and decompression cost of every SQLite shard, keyed by shard name."""
+    report: dict[str, dict[str, Any]] = {}
+    for path in _all_paths():
+        with suppress(ShardFileMissing), _shard_connection(path) as conn:
+            report[_shard_name(path)] = compression_stats(conn, codec_for(path))
+    return report
+
+
+def flush_pending_writes() -> int:
+    """Flush every write-behind buffer; returns the number of rows committed."""
+    return _write_buffer.flush()
+
+
+def shutdown() -> None:
+    """Stop the reaper, flush buffered writes and close pooled connections (registered with ``atexit``)."""
+    _reaper.stop()
+    _write_buffer.close()
+    shard_connections.close_all()
+    result_cache.clear()
+    _mirrors.clear()
+    _loop_thread.stop()
+
+
+atexit.register(shutdown)
 
 
 class MemoryStore:
@@ -81,6 +1234,7 @@ class MemoryStore:
         BLOBS_DIR.mkdir(parents=True, exist_ok=True)
         MEMORY_PATH.mkdir(parents=True, exist_ok=True)
         self._lock = threading.Lock()
+        _reaper.start()
 
     # ---------- Shard helpers ----------
     def _db_path(self) -> Path:
@@ -106,122 +1260,357 @@ class MemoryStore:
         return vec.tolist() if hasattr(vec, "tolist") else list(vec)
 
     # ---------- SQLite schema ----------
-    def _connect(self) -> sqlite3.Connection:
-        path = self._db_path()
-        path.parent.mkdir(parents=True, exist_ok=True)
-        conn = sqlite3.connect(path)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA journal_mode=WAL;")
-        conn.execute("PRAGMA synchronous=NORMAL;")
-        self._ensure_schema(conn)
-        return conn
+    @contextmanager
+    def _connect(self, path: Path | None = None) -> Iterator[sqlite3.Connection]:
+        """Borrow this shard's (or one of its segments') pooled connection; the schema is migrated when it is first opened.
+
+        Buffered write-behind rows for the shard are flushed first so callers read their own writes.
+        A segment dropped since it was listed raises ``ShardFileMissing``; callers skip it.
+        """
+        path = path or self._db_path()
+        if _write_buffer.has_pending(path):
+            _write_buffer.flush(path)
+        with shard_connections.connection(path, init=self._ensure_schema, create=not is_segment(path)) as conn:
+            yield conn
+
+    def flush(self) -> int:
+        """Commit this shard's buffered write-behind rows now."""
+        return _write_buffer.flush(self._db_path())
+
+    @staticmethod
+    def connection_stats() -> dict[str, Any]:
+        return shard_connections.stats()
+
+    # ---------- Result cache ----------
+    def _cached(self, key: tuple[Any, ...], load: Callable[[], QueryResult], since: float | None = None) -> QueryResult:
+        """``load()`` served through the result cache (SQLite only, see ``core.memory_cache``).
+
+        ``since`` is the read's own ``since``: the stamp covers every file that read visits.
+        """
+        if not memory_cache.MEMORY_CACHE_ENABLED or (MEMORY_DB_URL and asyncpg is not None):
+            return load()
+        shard = str(self._db_path())
+        # Version first: a write that lands while loading leaves this stamp behind, never ahead.
+        # Segment files are stamped by name too, so a segment created elsewhere is a miss.
+        try:
+            stamp = (
+                result_cache.version(shard),
+                tuple(
+                    (path.name, shard_connections.data_version(path, init=self._ensure_schema, create=not is_segment(path)))
+                    for path, _ in self._read_paths(since)
+                ),
+            )
+        except ShardFileMissing:  # a segment is being dropped: read through
+            return load()
+        key = (shard, *key)
+        items = result_cache.get(shard, key, stamp)
+        if items is not None:
+            return QueryResult(items)
+        result = load()
+        if not result.timed_out:  # never serve a partial result later
+            result_cache.put(shard, key, stamp, result)
+        return result
+
+    @staticmethod
+    def _record_deadline(op: str, deadline: float | None, result: QueryResult) -> QueryResult:
+        if deadline is not None:
+            _deadline_stats.record(op, result.timed_out)
+        return result
+
+    @staticmethod
+    def deadline_stats() -> dict[str, dict[str, int]]:
+        """Per-operation counts of calls made with a deadline and of deadline hits."""
+        return _deadline_stats.snapshot()
+
+    def _invalidate(self) -> None:
+        result_cache.bump(str(self._db_path()))
+
+    @staticmethod
+    def cache_stats() -> dict[str, Any]:
+        """Hit rate, size in bytes and eviction counters of the result cache."""
+        return result_cache.stats()
+
+    # ---------- Mirrors ----------
+    @contextmanager
+    def _read_connection(self, path: Path) -> Iterator[sqlite3.Connection]:
+        """Like ``_connect`` for queries: served from the shard's RAM mirror when it has one."""
+        if not memory_mirrors.MEMORY_MIRRORS or is_segment(path):
+            with self._connect(path) as conn:
+                yield conn
+            return
+        if _write_buffer.has_pending(path):
+            _write_buffer.flush(path)
+        shard = str(path)
+        stamp = (result_cache.version(shard), shard_connections.data_version(path, init=self._ensure_schema))
+        with _mirrors.connection(path, stamp, lambda: shard_connections.connection(path, init=self._ensure_schema)) as conn:
+            yield conn
+
+    @staticmethod
+    def telemetry_stats() -> dict[str, Any]:
+        """Latency histograms and row counters by operation and shard class (``MEMORY_TELEMETRY``)."""
+        return memory_telemetry.telemetry.snapshot()
+
+    @staticmethod
+    def slow_queries() -> list[memory_telemetry.SlowQuery]:
+        """The newest queries slower than ``MEMORY_SLOW_QUERY_MS``, with their plans."""
+        return memory_telemetry.telemetry.slow_queries()
+
+    @staticmethod
+    def mirror_stats() -> dict[str, Any]:
+        """Mirror hit rate, memory use against ``MEMORY_MIRROR_MAX_BYTES`` and per-shard sizes."""
+        return _mirrors.stats()
+
+    # ---------- Quotas ----------
+    def _count_writes(self, count: int) -> None:
+        """Check this shard's quotas every ``MEMORY_QUOTA_CHECK_EVERY`` writes rather than on each one."""
+        if not memory_quotas.enabled():
+            return
+        key = str(self._db_path())
+        with _quota_writes_lock:
+            total = _quota_writes.get(key, 0) + count
+            due = total >= memory_quotas.MEMORY_QUOTA_CHECK_EVERY
+            _quota_writes[key] = 0 if due else total
+        if due:
+            _enforce_quota(self._db_path())
+
+    def enforce_quota(self) -> int:
+        """Evict over-quota entries from this shard now; returns the number of rows evicted."""
+        return _enforce_quota(self._db_path())
+
+    def quota_usage(self) -> dict[str, Any]:
+        """Rows, bytes and quota headroom of this shard and of each agent in it."""
+        return memory_quotas.headroom(_quota_usage(self._db_path()))
+
+    @staticmethod
+    def eviction_stats() -> dict[str, dict[str, int]]:
+        """Per-shard eviction runs, rows and bytes since the process started."""
+        return memory_quotas.eviction_stats.snapshot()
+
+    # ---------- Segments ----------
+    def segments(self) -> list[Segment]:
+        """This shard's segment files, newest first (see ``core.memory_segments``)."""
+        return list_segments(self._db_path())
+
+    def _write_path(self, entry: MemoryItem) -> Path:
+        """The file ``entry`` belongs in: its time bucket's segment if it expires and segments are on."""
+        span = memory_segments.segment_span()
+        if span and entry.expires_at is not None:
+            path = segment_for(self._db_path(), entry.created_at, span)
+            memory_segments.create(path)
+            return path
+        return self._db_path()
+
+    def _read_paths(self, since: float | None = None) -> list[tuple[Path, float | None]]:
+        """``(path, segment end)`` of the files a read must visit: the base file, then segments newest first."""
+        base = self._db_path()
+        return [(base, None), *((s.path, s.end) for s in overlapping(base, since))]
+
+    def _locate(self, entry_id: str) -> Path | None:
+        """The file holding ``entry_id`` (base file first), or None."""
+        paths = self._read_paths()
+        if len(paths) == 1:
+            return paths[0][0]
+        for path, _ in paths:
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                if conn.execute("SELECT 1 FROM memory_entries WHERE id = ?", (entry_id,)).fetchone():
+                    return path
+        return None
+
+    def _log_segment_changes(self, path: Path, changes: Sequence[tuple[str, str, str | None]]) -> None:
+        """Record writes to a segment in the base file's change log (segments keep none)."""
+        if path != self._db_path():
+            with self._connect() as conn:
+                log_changes(conn, changes)
+
+    def _query_files(
+        self,
+        sql: str,
+        args: Sequence[Any],
+        limit: int,
+        deadline: float | None,
+        since: float | None = None,
+        recent: bool = False,
+    ) -> QueryResult:
+        """Run ``sql`` on every file a read must visit and merge the rows into the top ``limit``.
+
+        ``recent`` orders by ``created_at`` (and stops at the first segment older than the
+        ``limit`` rows found so far); otherwise by ``score``.
+        """
+        paths = self._read_paths(since)
+        if len(paths) == 1:  # no segments: the base file's order is final
+            with self._read_connection(paths[0][0]) as conn:
+                rows, timed_out = _fetch(conn, sql, args, deadline)
+                return QueryResult((self._row_to_entry(r, conn=conn) for r in rows), timed_out)
+        key = (lambda e: e.created_at) if recent else (lambda e: (e.score or 0.0, e.created_at))
+        items: list[MemoryItem] = []
+        timed_out = False
+        for path, end in paths:
+            if recent and end is not None and len(items) >= limit and items[limit - 1].created_at >= end:
+                break
+            cut = False
+            with suppress(ShardFileMissing), self._read_connection(path) as conn:
+                rows, cut = _fetch(conn, sql, args, deadline)
+                items.extend(self._row_to_entry(r, path, conn) for r in rows)
+            items.sort(key=key, reverse=True)
+            timed_out = timed_out or cut
+        return QueryResult(items[:limit], timed_out)
 
     @staticmethod
     def _ensure_schema(conn: sqlite3.Connection) -> None:
-        conn.execute(
-            "CREATE TABLE IF NOT EXISTS memory_entries ("
-            "id TEXT PRIMARY KEY,"
-            "agent_id TEXT,"
-            "text TEXT,"
-            "tags TEXT,"
-            "importance REAL,"
-            "created_at REAL,"
-            "expires_at REAL,"
-            "source TEXT,"
-            "metadata TEXT,"
-            "blob_ref TEXT,"
-            "deleted INTEGER DEFAULT 0,"
-            "embedding TEXT"
-            ")"
-        )
-        conn.execute(
-            "CREATE VIRTUAL TABLE IF NOT EXISTS fts_entries USING fts5(text, content='memory_entries', content_rowid='rowid')"
-        )
-        conn.execute(
-            "CREATE TRIGGER IF NOT EXISTS memory_entries_ai AFTER INSERT ON memory_entries "
-            "BEGIN INSERT INTO fts_entries(rowid, text) VALUES (new.rowid, new.text); END;"
+        _register_math_functions(conn)
+        register_functions(conn)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migrate in enumerate(_MIGRATIONS, start=1):
+            if version < target:
+                migrate(conn)
+                conn.execute(f"PRAGMA user_version = {target}")
+        _rekey_decay(conn)
+        ensure_hot_columns(conn)
+        compressed = ensure_compression(conn)
+        ensure_change_triggers(
+            conn, enabled=False if is_segment(conn.execute("PRAGMA database_list").fetchone()[2]) else None, compressed=compressed
         )
-        # Ensure new columns exist on older DBs
-        for column in ("deleted", "embedding"):
-            try:
-                conn.execute(f"ALTER TABLE memory_entries ADD COLUMN {column} TEXT")
-            except Exception:
-                pass
+        memory_quotas.ensure_usage_tracking(conn)
         conn.commit()
 
-    def _purge_expired(self, conn: sqlite3.Connection) -> None:
-        now = time.time()
-        conn.execute("DELETE FROM memory_entries WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
-        conn.commit()
+    def _purge_expired(self, conn: sqlite3.Connection) -> list[sqlite3.Row]:
+        return _delete_expired(conn, time.time())
 
     # ---------- Postgres helpers ----------
     async def _pg_pool(self):
-        global _pg_pool
-        if _pg_pool is not None:
-            return _pg_pool
+        """The asyncpg pool of the running event loop, created (with the schema) on first use."""
         if asyncpg is None or not MEMORY_DB_URL:
             return None
-        async with _pg_lock:
-            if _pg_pool is None:
-                _pg_pool = await asyncpg.create_pool(MEMORY_DB_URL, min_size=1, max_size=5)
-                async with _pg_pool.acquire() as conn:
-                    await conn.execute(
-                        "CREATE TABLE IF NOT EXISTS memory_entries ("
-                        "id UUID PRIMARY KEY,"
-                        "agent_id TEXT,"
-                        "text TEXT,"
-                        "tags JSONB,"
-                        "importance DOUBLE PRECISION,"
-                        "created_at DOUBLE PRECISION,"
-                        "expires_at DOUBLE PRECISION,"
-                        "source TEXT,"
-                        "metadata JSONB,"
-                        "blob_ref TEXT,"
-                        "deleted BOOLEAN DEFAULT FALSE,"
-                        "embedding JSONB"
-                        ")"
-                    )
-                    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_agent ON memory_entries(agent_id)")
-                    await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_deleted ON memory_entries(deleted)")
-        return _pg_pool
+        loop = asyncio.get_running_loop()
+        pool = _pg_pools.get(loop)
+        if pool is not None:
+            return pool
+        with _pg_pool_locks_guard:
+            lock = _pg_pool_locks.setdefault(loop, asyncio.Lock())
+        async with lock:
+            pool = _pg_pools.get(loop)
+            if pool is None:
+                conn = await asyncpg.connect(MEMORY_DB_URL)
+                try:
+                    await migrate_pg(conn)
+                    await ensure_indexes_pg(conn)
+                    await self._ensure_decay_pg(conn)
+                    await ensure_change_log_pg(conn)
+                    await ensure_compression_pg(conn)
+                finally:
+                    await conn.close()
+                pool = await asyncpg.create_pool(
+                    MEMORY_DB_URL,
+                    min_size=MEMORY_PG_POOL_MIN,
+                    max_size=MEMORY_PG_POOL_MAX,
+                    init=init_pg_connection,
+                    statement_cache_size=MEMORY_PG_STATEMENT_CACHE,
+                )
+                _pg_pools[loop] = pool
+        return pool
+
+    @staticmethod
+    async def _ensure_decay_pg(conn: Any) -> None:
+        """Postgres counterpart of ``_migrate_v5`` + ``_rekey_decay``."""
+        await conn.execute("ALTER TABLE memory_entries ADD COLUMN IF NOT EXISTS importance_at DOUBLE PRECISION")
+        await conn.execute("ALTER TABLE memory_entries ADD COLUMN IF NOT EXISTS decay_key DOUBLE PRECISION")
+        await conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_decay ON memory_entries(decay_key)")
+        await conn.execute("CREATE TABLE IF NOT EXISTS memory_settings (key TEXT PRIMARY KEY, value DOUBLE PRECISION)")
+        rate = _decay_rate()
+        if await conn.fetchval("SELECT value FROM memory_settings WHERE key = 'decay_rate'") == rate:
+            return
+        async with conn.transaction():
+            await conn.execute(
+                "UPDATE memory_entries SET importance_at = COALESCE(importance_at, $1), decay_key = CASE "
+                "WHEN importance IS NULL THEN NULL WHEN importance <= 0 THEN $2 "
+                "ELSE ln(importance) + $3 * COALESCE(importance_at, $1) END",
+                time.time(),
+                _NO_IMPORTANCE_KEY,
+                rate,
+            )
+            await conn.execute(
+                "INSERT INTO memory_settings (key, value) VALUES ('decay_rate', $1) "
+                "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value",
+                rate,
+            )
 
     def _run_async(self, coro):
-        try:
-            loop = asyncio.get_running_loop()
-        except RuntimeError:
-            loop = None
-        if loop and loop.is_running():
-            return asyncio.run_coroutine_threadsafe(coro, loop).result()
-        return asyncio.run(coro)
+        """Run a Postgres coroutine on the shared background loop and wait for its result."""
+        return _loop_thread.run(coro)
 
     # ---------- Blob helpers ----------
+    @staticmethod
+    def _blobs() -> BlobStore:
+        return BlobStore(BLOBS_DIR)
+
     def write_blob(self, data: bytes) -> str:
-        blob_id = f"{uuid.uuid4()}.bin"
-        dest = BLOBS_DIR / blob_id
-        dest.write_bytes(data)
-        return str(dest)
+        return self._blobs().write(data)
+
+    def write_blob_stream(self, stream: BinaryIO | IO[bytes], chunk_size: int | None = None) -> str:
+        """Store a payload from a binary stream without loading it into memory; returns the blob ref."""
+        return self._blobs().write_stream(stream, chunk_size)
 
     def read_blob(self, blob_ref: str) -> bytes:
-        return Path(blob_ref).read_bytes()
+        return self._blobs().read(blob_ref)
 
-    def delete_blob(self, blob_ref: str) -> None:
-        try:
-            Path(blob_ref).unlink(missing_ok=True)
-        except Exception:
-            pass
-
-    def cleanup_orphan_blobs(self) -> None:
-        """Remove blobs not referenced by any memory entry."""
-        conn = self._connect()
-        cur = conn.execute("SELECT blob_ref FROM memory_entries WHERE blob_ref IS NOT NULL")
-        refs = {Path(r[0]).name for r in cur.fetchall() if r[0]}
-        conn.close()
-        for blob_path in BLOBS_DIR.glob("*.bin"):
-            if blob_path.name not in refs:
-                blob_path.unlink(missing_ok=True)
+    def open_blob(self, blob_ref: str, *, use_mmap: bool = False) -> Any:
+        """Open a blob as a binary file (or read-only mmap); use as a context manager."""
+        return self._blobs().open(blob_ref, use_mmap=use_mmap)
+
+    def delete_blob(self, blob_ref: str) -> bool:
+        """Give back a ref from ``write_blob``/``write_blob_stream`` that no entry was stored with.
+
+        Legacy ``<uuid>.bin`` refs are unlinked. Entries release their refs when they are deleted, so
+        refs this process did not write (or that an entry has taken over) are left alone and logged
+        (``reconcile_blobs`` recounts them). Returns whether a reference was released.
+        """
+        return self._blobs().release_written(blob_ref)
+
+    def reconcile_blobs(self) -> dict[str, int]:
+        """Recompute every blob's refcount from the rows that reference it; returns count per sha.
+
+        Counts the SQLite shards and, with ``MEMORY_DB_URL`` set, ``memory_entries`` on Postgres.
+        """
+        extra: list[tuple[str, int]] = []
+        if MEMORY_DB_URL and asyncpg is not None:
+            extra = self._run_async(self._blob_refs_pg())
+        return self._blobs().reconcile(_all_paths(), MemoryStore._ensure_schema, extra)
+
+    async def _blob_refs_pg(self) -> list[tuple[str, int]]:
+        pool = await self._pg_pool()
+        if pool is None:
+            return []
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT blob_ref, count(*) AS n FROM memory_entries WHERE blob_ref LIKE 'sha256:%' GROUP BY blob_ref"
+            )
+        return [(r["blob_ref"], r["n"]) for r in rows]
+
+    def cleanup_orphan_blobs(self, grace: float | None = None) -> int:
+        """Remove blobs no longer referenced by any shard; returns the number of files removed.
+
+        Content-addressed blobs are collected from the per-shard release queues and the
+        refcount index. Legacy ``<uuid>.bin`` files are checked against shard references.
+        """
+        shards = _all_paths()
+        removed = self._blobs().sweep(shards, MemoryStore._ensure_schema, grace)
+        legacy = list(BLOBS_DIR.glob("*.bin"))
+        if legacy:
+            refs: set[str] = set()
+            for path in shards:
+                with suppress(ShardFileMissing), _shard_connection(path) as conn:
+                    cur = conn.execute(
+                        "SELECT blob_ref FROM memory_entries WHERE blob_ref IS NOT NULL AND blob_ref NOT LIKE 'sha256:%'"
+                    )
+                    refs.update(Path(r[0]).name for r in cur)
+            for blob_path in legacy:
+                if blob_path.name not in refs:
+                    blob_path.unlink(missing_ok=True)
+                    removed += 1
+        return removed
 
     # ---------- Core operations ----------
-    def add(
+    def _new_entry(
         self,
         agent_id: str,
         text: str,
@@ -231,61 +1620,146 @@ class MemoryStore:
         ttl: float | None = None,
         source: str | None = None,
         metadata: dict[str, Any] | None = None,
-        blob: bytes | None = None,
+        blob: bytes | BinaryIO | None = None,
+        embedding: Sequence[float] | None = None,
     ) -> MemoryItem:
         entry_id = str(uuid.uuid4())
         expires_at = time.time() + ttl if ttl else (MEMORY_TTL_DEFAULT + time.time() if MEMORY_TTL_DEFAULT else None)
-        blob_ref = self.write_blob(blob) if blob is not None else None
-        embedding = self._embed(text)
-        entry = MemoryItem(
+        if blob is None:
+            blob_ref = None
+        elif isinstance(blob, (bytes, bytearray, memoryview)):
+            blob_ref = self.write_blob(bytes(blob))
+        else:
+            blob_ref = self.write_blob_stream(blob)
+        embedding = list(embedding) if embedding is not None else self._embed(text)
+        return MemoryItem(
             id=entry_id,
             agent_id=agent_id,
             text=text,
             tags=list(tags or []),
             importance=importance,
-            created_at=time.time(),
-            expires_at=expires_at,
+            created_at=time.time(),
+            expires_at=expires_at,
+            source=source,
+            metadata=metadata or {},
+            blob_ref=blob_ref,
+            deleted=False,
+            embedding=embedding,
+        )
+
+    def _codec(self, path: Path | None = None) -> memory_compression.ShardCodec:
+        return codec_for(path or self._db_path())
+
+    def _insert_params(
+        self, entry: MemoryItem, path: Path | None = None, conn: sqlite3.Connection | None = None
+    ) -> tuple[Any, ...]:
+        """``conn``: the connection the row is written through, if open; new dictionaries are picked up through it."""
+        codec = self._codec(path)
+        text, text_z = codec.encode_text(entry.text, conn)
+        metadata, metadata_z = codec.encode_metadata(entry.metadata, conn)
+        return (
+            entry.id,
+            entry.agent_id,
+            text,
+            json.dumps(entry.tags),
+            entry.importance,
+            entry.created_at,
+            entry.expires_at,
+            entry.source,
+            metadata,
+            entry.blob_ref,
+            pack_vector(entry.embedding) if entry.embedding is not None else None,
+            entry.created_at,
+            _decay_key(entry.importance, entry.created_at),
+            text_z,
+            metadata_z,
+        )
+
+    @timed("add")
+    def add(
+        self,
+        agent_id: str,
+        text: str,
+        *,
+        tags: Sequence[str] | None = None,
+        importance: float = 0.5,
+        ttl: float | None = None,
+        source: str | None = None,
+        metadata: dict[str, Any] | None = None,
+        blob: bytes | BinaryIO | None = None,
+        embedding: Sequence[float] | None = None,
+    ) -> MemoryItem:
+        """Store one memory.
+
+        ``blob`` may be bytes or a binary stream (copied in chunks). ``embedding`` may be supplied
+        precomputed; otherwise it is computed with the configured model when
+        ``MEMORY_EMBEDDINGS_ENABLED`` is set.
+
+        With ``MEMORY_WRITE_BEHIND`` enabled (SQLite only) the row is queued and committed with
+        others in the same shard; the returned item is final but becomes durable on the next flush.
+        """
+        entry = self._new_entry(
+            agent_id,
+            text,
+            tags=tags,
+            importance=importance,
+            ttl=ttl,
             source=source,
-            metadata=metadata or {},
-            blob_ref=blob_ref,
-            deleted=False,
+            metadata=metadata,
+            blob=blob,
             embedding=embedding,
         )
         if MEMORY_DB_URL and asyncpg is not None:
             self._run_async(self._add_pg(entry))
             return entry
-        with self._lock:
-            conn = self._connect()
-            self._purge_expired(conn)
-            conn.execute(
-                "INSERT INTO memory_entries (id, agent_id, text, tags, importance, created_at, expires_at, source, metadata, blob_ref, deleted, embedding) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)",
-                (
-                    entry.id,
-                    entry.agent_id,
-                    entry.text,
-                    json.dumps(entry.tags),
-                    entry.importance,
-                    entry.created_at,
-                    entry.expires_at,
-                    entry.source,
-                    json.dumps(entry.metadata),
-                    entry.blob_ref,
-                    json.dumps(entry.embedding) if entry.embedding is not None else None,
-                ),
-            )
+        path = self._write_path(entry)
+        if MEMORY_WRITE_BEHIND and path == self._db_path():
+            _write_buffer.enqueue(path, self._ensure_schema, self._insert_params(entry))
+            self._invalidate()  # cache misses read through _connect, which flushes the buffer
+            self._count_writes(1)
+            return entry
+        with self._connect(path) as conn:
+            conn.execute(_INSERT_SQL, self._insert_params(entry, path, conn))
+            adopt_written(conn, [entry.blob_ref])
             conn.commit()
-            conn.close()
+        self._log_segment_changes(path, [("insert", entry.id, entry.agent_id)])
+        self._invalidate()
+        self._count_writes(1)
         return entry
 
+    @timed("add_many")
+    def add_many(self, items: Iterable[dict[str, Any]]) -> List[MemoryItem]:
+        """Store many memories in a single transaction.
+
+        Each item takes the same keys as ``add`` (``agent_id``, ``text``, ``tags``, ``importance``,
+        ``ttl``, ``source``, ``metadata``, ``blob``, ``embedding``).
+        """
+        entries = [self._new_entry(**item) for item in items]
+        if not entries:
+            return []
+        if MEMORY_DB_URL and asyncpg is not None:
+            self._run_async(self._add_many_pg(entries))
+            return entries
+        by_path: dict[Path, list[MemoryItem]] = {}
+        for entry in entries:
+            by_path.setdefault(self._write_path(entry), []).append(entry)
+        for path, group in by_path.items():
+            with self._connect(path) as conn:
+                conn.executemany(_INSERT_SQL, [self._insert_params(e, path, conn) for e in group])
+                adopt_written(conn, (e.blob_ref for e in group))
+                conn.commit()
+            self._log_segment_changes(path, [("insert", e.id, e.agent_id) for e in group])
+        self._invalidate()
+        self._count_writes(len(entries))
+        return entries
+
     async def _add_pg(self, entry: MemoryItem) -> None:
         pool = await self._pg_pool()
         if pool is None:
             return
         async with pool.acquire() as conn:
             await conn.execute(
-                "INSERT INTO memory_entries (id, agent_id, text, tags, importance, created_at, expires_at, source, metadata, blob_ref, deleted, embedding) "
-                "VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12)",
+                _INSERT_SQL_PG,
                 entry.id,
                 entry.agent_id,
                 entry.text,
@@ -298,27 +1772,66 @@ class MemoryStore:
                 entry.blob_ref,
                 entry.deleted,
                 entry.embedding,
+                entry.created_at,
+                _decay_key(entry.importance, entry.created_at),
             )
+        adopt_written(None, [entry.blob_ref])
 
-    def _row_to_entry(self, row: sqlite3.Row) -> MemoryItem:
+    async def _add_many_pg(self, entries: Sequence[MemoryItem]) -> None:
+        pool = await self._pg_pool()
+        if pool is None:
+            return
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    _INSERT_SQL_PG,
+                    [
+                        (
+                            e.id,
+                            e.agent_id,
+                            e.text,
+                            e.tags,
+                            e.importance,
+                            e.created_at,
+                            e.expires_at,
+                            e.source,
+                            e.metadata,
+                            e.blob_ref,
+                            e.deleted,
+                            e.embedding,
+                            e.created_at,
+                            _decay_key(e.importance, e.created_at),
+                        )
+                        for e in entries
+                    ],
+                )
+        adopt_written(None, (e.blob_ref for e in entries))
+
+    def _row_to_entry(self, row: sqlite3.Row, path: Path | None = None, conn: sqlite3.Connection | None = None) -> MemoryItem:
+        """``conn``: the connection ``row`` was read from; compressed rows load new dictionaries through it."""
+        keys = row.keys()
+        text, metadata_json = row["text"], row["metadata"]
+        if "text_z" in keys and (row["text_z"] is not None or row["metadata_z"] is not None):
+            codec = self._codec(path)
+            text = codec.decode(text, row["text_z"], conn)
+            metadata_json = codec.decode(metadata_json, row["metadata_z"], conn)
         try:
             tags = json.loads(row["tags"]) if row["tags"] else []
         except Exception:
             tags = []
         try:
-            metadata = json.loads(row["metadata"]) if row["metadata"] else {}
+            metadata = json.loads(metadata_json) if metadata_json else {}
         except Exception:
             metadata = {}
-        try:
-            embedding = json.loads(row["embedding"]) if row["embedding"] else None
-        except Exception:
-            embedding = None
+        embedding = decode_embedding(row["embedding"])
         return MemoryItem(
             id=row["id"],
             agent_id=row["agent_id"],
-            text=row["text"],
+            text=text,
             tags=tags,
-            importance=row["importance"] or 0.0,
+            importance=_effective_importance(
+                row["importance"], row["importance_at"] if "importance_at" in keys else None, time.time()
+            ),
             created_at=row["created_at"] or time.time(),
             expires_at=row["expires_at"],
             source=row["source"],
@@ -326,6 +1839,7 @@ class MemoryStore:
             blob_ref=row["blob_ref"],
             deleted=bool(row["deleted"]),
             embedding=embedding,
+            score=row["score"] if "score" in keys else None,
         )
 
     async def _row_to_entry_pg(self, row: Any) -> MemoryItem:
@@ -334,7 +1848,9 @@ class MemoryStore:
             agent_id=row["agent_id"],
             text=row["text"],
             tags=list(row.get("tags") or []),
-            importance=float(row.get("importance") or 0.0),
+            importance=_effective_importance(
+                float(row.get("importance") or 0.0), row.get("importance_at"), time.time()
+            ),
             created_at=float(row.get("created_at") or time.time()),
             expires_at=float(row.get("expires_at")) if row.get("expires_at") is not None else None,
             source=row.get("source"),
@@ -342,37 +1858,144 @@ class MemoryStore:
             blob_ref=row.get("blob_ref"),
             deleted=bool(row.get("deleted", False)),
             embedding=list(row.get("embedding") or []) or None,
+            score=float(row["score"]) if "score" in row.keys() else None,
         )
 
-    def get(self, agent_id: str, limit: int | None = None, include_deleted: bool = False) -> List[MemoryItem]:
+    @timed("get")
+    def get(
+        self,
+        agent_id: str,
+        limit: int | None = None,
+        include_deleted: bool = False,
+        *,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        """Most recent live entries of ``agent_id``, optionally filtered by tags.
+
+        With ``deadline_ms`` (default ``MEMORY_QUERY_DEADLINE_MS``) the query is interrupted
+        when the deadline passes and the entries read so far are returned with ``timed_out`` set.
+        ``since`` keeps entries created at or after that timestamp (and skips older segments).
+        """
+        tag_filter = TagFilter.build(None, tags_any, tags_all, tags_none)
+        deadline = _deadline_at(deadline_ms)
         if MEMORY_DB_URL and asyncpg is not None:
-            return self._run_async(self._get_pg(agent_id, limit, include_deleted))
-        limit = limit or MEMORY_MAX_RESULTS
-        conn = self._connect()
-        self._purge_expired(conn)
-        where = "agent_id = ?" + ("" if include_deleted else " AND deleted = 0")
-        cur = conn.execute(
-            f"SELECT * FROM memory_entries WHERE {where} ORDER BY created_at DESC LIMIT ?",
-            (agent_id, limit),
+            result = self._run_async(self._get_pg(agent_id, limit, include_deleted, tag_filter, deadline, since))
+        else:
+            limit = limit or MEMORY_MAX_RESULTS
+            result = self._cached(
+                ("get", agent_id, limit, include_deleted, tag_filter, since),
+                lambda: self._get(agent_id, limit, include_deleted, tag_filter, deadline, since),  # type: ignore[arg-type]
+                since,
+            )
+        return self._record_deadline("get", deadline, result)
+
+    def _get(
+        self,
+        agent_id: str,
+        limit: int,
+        include_deleted: bool,
+        tag_filter: TagFilter | None,
+        deadline: float | None,
+        since: float | None = None,
+    ) -> QueryResult:
+        clauses = ["e.agent_id = ?", "(e.expires_at IS NULL OR e.expires_at > ?)"]
+        params: list[Any] = [agent_id, time.time()]
+        if not include_deleted:
+            clauses.append("e.deleted = 0")
+        if since is not None:
+            clauses.append("e.created_at >= ?")
+            params.append(since)
+        if tag_filter is not None:
+            tag_clauses, tag_params = tag_filter.sql()
+            clauses += tag_clauses
+            params += tag_params
+        return self._query_files(
+            f"SELECT e.* FROM memory_entries e WHERE {' AND '.join(clauses)} ORDER BY e.created_at DESC LIMIT ?",
+            (*params, limit),
+            limit,
+            deadline,
+            since,
+            recent=True,
         )
-        rows = cur.fetchall()
-        conn.close()
-        return [self._row_to_entry(r) for r in rows]
 
-    async def _get_pg(self, agent_id: str, limit: int | None, include_deleted: bool) -> List[MemoryItem]:
+    async def _get_pg(
+        self,
+        agent_id: str,
+        limit: int | None,
+        include_deleted: bool,
+        tags: TagFilter | None = None,
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
         pool = await self._pg_pool()
         if pool is None:
-            return []
+            return QueryResult()
         limit = limit or MEMORY_MAX_RESULTS
-        deleted_clause = "" if include_deleted else "AND deleted = FALSE"
+        args = _PgArgs()
+        clauses = [f"agent_id = {args.add(agent_id)}", f"(expires_at IS NULL OR expires_at > {args.add(time.time())})"]
+        if not include_deleted:
+            clauses.append("deleted = FALSE")
+        if since is not None:
+            clauses.append(f"created_at >= {args.add(since)}")
+        if tags is not None:
+            clauses += tags.sql_pg(args)
+        sql = f"SELECT * FROM memory_entries WHERE {' AND '.join(clauses)} ORDER BY created_at DESC LIMIT {args.add(limit)}"
         async with pool.acquire() as conn:
-            rows = await conn.fetch(
-                f"SELECT * FROM memory_entries WHERE agent_id = $1 {deleted_clause} ORDER BY created_at DESC LIMIT $2",
-                agent_id,
-                limit,
-            )
-        return [await self._row_to_entry_pg(r) for r in rows]
+            rows, timed_out = await _fetch_pg(conn, sql, args, deadline)
+        return QueryResult([await self._row_to_entry_pg(r) for r in rows], timed_out)
+
+    @staticmethod
+    def _filters(
+        agent_id: str | None,
+        tags: TagFilter | None,
+        metadata_filter: dict[str, Any] | None,
+        since: float | None = None,
+    ) -> tuple[str, list[Any]]:
+        """WHERE clause over ``memory_entries e`` for live rows of ``agent_id`` (any agent if None) plus optional filters."""
+        clauses = ["e.deleted = 0", "(e.expires_at IS NULL OR e.expires_at > ?)"]
+        params: list[Any] = [time.time()]
+        if agent_id is not None:
+            clauses.insert(0, "e.agent_id = ?")
+            params.insert(0, agent_id)
+        if since is not None:
+            clauses.append("e.created_at >= ?")
+            params.append(since)
+        if tags is not None:
+            tag_clauses, tag_params = tags.sql()
+            clauses += tag_clauses
+            params += tag_params
+        if metadata_filter:
+            meta_clauses, meta_params = metadata_clauses(metadata_filter)
+            clauses += meta_clauses
+            params += meta_params
+        return " AND ".join(clauses), params
+
+    @staticmethod
+    def _filters_pg(
+        args: _PgArgs,
+        agent_id: str | None,
+        tags: TagFilter | None,
+        metadata_filter: dict[str, Any] | None = None,
+        since: float | None = None,
+    ) -> str:
+        clauses = [
+            f"agent_id = {args.add(agent_id)}" if agent_id is not None else "TRUE",
+            "deleted = FALSE",
+            f"(expires_at IS NULL OR expires_at > {args.add(time.time())})",
+        ]
+        if since is not None:
+            clauses.append(f"created_at >= {args.add(since)}")
+        if tags is not None:
+            clauses += tags.sql_pg(args)
+        if metadata_filter:
+            clauses += metadata_clauses_pg(metadata_filter, args.add)
+        return " AND ".join(clauses)
 
+    @timed("search")
     def search(
         self,
         agent_id: str,
@@ -380,68 +2003,62 @@ class MemoryStore:
         limit: int | None = None,
         tags: Sequence[str] | None = None,
         metadata_filter: dict[str, Any] | None = None,
-    ) -> List[MemoryItem]:
+        *,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        """FTS search; ``tags_any``/``tags_all``/``tags_none`` filter through the tag index.
+
+        A query still running at ``deadline_ms`` is interrupted and returns ``timed_out`` results.
+        ``since`` keeps entries created at or after that timestamp.
+        """
+        tag_filter = TagFilter.build(tags, tags_any, tags_all, tags_none)
+        deadline = _deadline_at(deadline_ms)
         if MEMORY_DB_URL and asyncpg is not None:
-            return self._run_async(self._search_pg(agent_id, query, limit, tags, metadata_filter))
+            result = self._run_async(self._search_pg(agent_id, query, limit, tag_filter, metadata_filter, deadline, since))
+            return self._record_deadline("search", deadline, result)
         limit = limit or MEMORY_MAX_RESULTS
-        conn = self._connect()
-        self._purge_expired(conn)
-        clauses = ["agent_id = ?", "deleted = 0"]
-        params: list[Any] = [agent_id]
-        if tags and MEMORY_QUERY_STRICT:
-            clauses.append("tags = ?")
-            params.append(json.dumps(list(tags)))
-        if metadata_filter:
-            for key, val in metadata_filter.items():
-                clauses.append("metadata LIKE ?")
-                params.append(f"%"{key}"%{val}%")
-        where = " AND ".join(clauses)
-        cur = conn.execute(
-            f"SELECT e.*, bm25(fts_entries) as bm25_score FROM fts_entries JOIN memory_entries e ON fts_entries.rowid = e.rowid "
-            f"WHERE fts_entries MATCH ? AND {where} ORDER BY bm25_score ASC, created_at DESC LIMIT ?",
+        where, params = self._filters(agent_id, tag_filter, metadata_filter, since)
+        result = self._query_files(
+            f"SELECT e.*, {_BM25_NORM_SQL} AS score FROM fts_entries JOIN memory_entries e ON fts_entries.rowid = e.rowid "
+            f"WHERE fts_entries MATCH ? AND {where} ORDER BY bm25(fts_entries) ASC, e.created_at DESC LIMIT ?",
             (query, *params, limit),
+            limit,
+            deadline,
+            since,
         )
-        rows = cur.fetchall()
-        conn.close()
-        return [self._row_to_entry(r) for r in rows]
+        return self._record_deadline("search", deadline, result)
 
     async def _search_pg(
         self,
         agent_id: str,
         query: str,
         limit: int | None,
-        tags: Sequence[str] | None,
+        tags: TagFilter | None,
         metadata_filter: dict[str, Any] | None,
-    ) -> List[MemoryItem]:
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
         pool = await self._pg_pool()
         if pool is None:
-            return []
+            return QueryResult()
         limit = limit or MEMORY_MAX_RESULTS
-        clauses = ["agent_id = $1", "deleted = FALSE"]
-        params: list[Any] = [agent_id]
-        if tags and MEMORY_QUERY_STRICT:
-            clauses.append("tags = $2")
-            params.append(list(tags))
-        where = " AND ".join(clauses)
-        query_sql = (
-            f"SELECT *, ts_rank_cd(to_tsvector('english', text), plainto_tsquery('english', ${{len(params)+1}})) as rank "
-            f"FROM memory_entries WHERE {where} AND to_tsvector('english', text) @@ plainto_tsquery('english', ${{len(params)+1}}) "
-            f"ORDER BY rank DESC, created_at DESC LIMIT ${{len(params)+2}}"
+        args = _PgArgs()
+        where = self._filters_pg(args, agent_id, tags, metadata_filter, since)
+        tsquery = TSQUERY.format(args.add(query))  # plainto_tsquery accepts any input, so no ILIKE fallback
+        sql = (
+            f"SELECT *, ts_rank_cd(text_tsv, {tsquery}, 32) AS score "
+            f"FROM memory_entries WHERE {where} AND text_tsv @@ {tsquery} "
+            f"ORDER BY score DESC, created_at DESC LIMIT {args.add(limit)}"
         )
-        params.append(query)
-        params.append(limit)
         async with pool.acquire() as conn:
-            try:
-                rows = await conn.fetch(query_sql, *params)
-            except Exception:
-                rows = await conn.fetch(
-                    f"SELECT * FROM memory_entries WHERE {where} AND text ILIKE ${{len(params)+1}} ORDER BY created_at DESC LIMIT ${{len(params)+2}}",
-                    *params[:-2],
-                    f"%{query}%",
-                    limit,
-                )
-        return [await self._row_to_entry_pg(r) for r in rows]
+            rows, timed_out = await _fetch_pg(conn, sql, args, deadline)
+        return QueryResult([await self._row_to_entry_pg(r) for r in rows], timed_out)
 
+    @timed("get_relevant")
     def get_relevant(
         self,
         agent_id: str,
@@ -449,21 +2066,125 @@ class MemoryStore:
         *,
         tags: Sequence[str] | None = None,
         limit: int | None = None,
-    ) -> List[MemoryItem]:
+        semantic: bool = False,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        """Top ``limit`` live entries ranked by the hybrid score, computed and sorted in SQL.
+
+        score = MEMORY_WEIGHT_BM25 * normalized BM25 (only when ``query`` is given)
+              + MEMORY_WEIGHT_RECENCY / (1 + age / MEMORY_RECENCY_SCALE)
+              + MEMORY_WEIGHT_IMPORTANCE * importance
+
+        With ``semantic=True`` the hybrid ranking is fused with ``semantic_search`` results using
+        reciprocal rank fusion; ``score`` is then the fused score.
+
+        ``deadline_ms`` bounds the SQL work (not embedding the query); see ``get``. ``since``
+        keeps entries created at or after that timestamp.
+        """
         limit = limit or MEMORY_MAX_RESULTS
-        candidates = self.search(agent_id, query, limit=limit * 3, tags=tags) if query else self.get(agent_id, limit=limit * 3)
-        now = time.time()
-        scored: list[tuple[float, MemoryItem]] = []
-        for entry in candidates:
-            if entry.deleted:
-                continue
-            recency = 1.0 / (1.0 + (now - entry.created_at) / 3600.0)
-            importance = entry.importance or 0.0
-            bm25_score = 1.0
-            scored.append((bm25_score * 0.5 + recency * 0.3 + importance * 0.2, entry))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [e for _, e in scored[:limit]]
+        tag_filter = TagFilter.build(tags, tags_any, tags_all, tags_none)
+        deadline = _deadline_at(deadline_ms)
+        if semantic and query:
+            result = self._cached(
+                ("get_relevant", agent_id, query, tag_filter, limit, True, since),
+                lambda: self._fuse_semantic(agent_id, query, tag_filter, limit, deadline, since),
+                since,
+            )
+        else:
+            result = self._cached(
+                ("get_relevant", agent_id, query, tag_filter, limit, False, since),
+                lambda: self._ranked(agent_id, query, tag_filter, limit, deadline, since),
+                since,
+            )
+        return self._record_deadline("get_relevant", deadline, result)
+
+    def _ranked(
+        self,
+        agent_id: str,
+        query: str,
+        tags: TagFilter | None,
+        limit: int,
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._get_relevant_pg(agent_id, query, tags, limit, deadline, since))
+        where, params = self._filters(agent_id, tags, None, since)
+        score_sql, score_params = _hybrid_score_sql(text_match=bool(query))
+        if query:
+            sql = (
+                f"SELECT e.*, {score_sql} AS score FROM fts_entries JOIN memory_entries e ON fts_entries.rowid = e.rowid "
+                f"WHERE fts_entries MATCH ? AND {where} ORDER BY score DESC, e.created_at DESC LIMIT ?"
+            )
+            args: tuple[Any, ...] = (*score_params, query, *params, limit)
+        else:
+            sql = f"SELECT e.*, {score_sql} AS score FROM memory_entries e WHERE {where} ORDER BY score DESC, e.created_at DESC LIMIT ?"
+            args = (*score_params, *params, limit)
+        return self._query_files(sql, args, limit, deadline, since)
+
+    def _fuse_semantic(
+        self,
+        agent_id: str,
+        query: str,
+        tags: TagFilter | None,
+        limit: int,
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        ranked = self._ranked(agent_id, query, tags, limit * 2, deadline, since)
+        similar = self._semantic(agent_id, query, limit * 2, tags, deadline, since)
+        fused: dict[str, float] = {}
+        items: dict[str, MemoryItem] = {}
+        for results in (ranked, similar):
+            for rank, item in enumerate(results):
+                fused[item.id] = fused.get(item.id, 0.0) + 1.0 / (MEMORY_RRF_K + rank + 1)
+                items.setdefault(item.id, item)
+        best = sorted(fused, key=fused.__getitem__, reverse=True)[:limit]
+        for entry_id in best:
+            items[entry_id].score = fused[entry_id]
+        return QueryResult((items[entry_id] for entry_id in best), ranked.timed_out or similar.timed_out)
+
+    @staticmethod
+    def _importance_pg(args: _PgArgs, alias: str = "") -> str:
+        rate = _decay_rate()
+        if not rate:
+            return f"COALESCE({alias}importance, 0.0)"
+        # GREATEST keeps exp() from underflowing, which Postgres reports as an error.
+        return f"COALESCE(exp(GREATEST({alias}decay_key - {args.add(rate * time.time())}, -700.0)), 0.0)"
+
+    async def _get_relevant_pg(
+        self,
+        agent_id: str,
+        query: str,
+        tags: TagFilter | None,
+        limit: int,
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        pool = await self._pg_pool()
+        if pool is None:
+            return QueryResult()
+        args = _PgArgs()
+        where = self._filters_pg(args, agent_id, tags, since=since)
+        score = (
+            f"{args.add(MEMORY_WEIGHT_RECENCY)} / (1.0 + ({args.add(time.time())} - created_at) / {args.add(MEMORY_RECENCY_SCALE)})"
+            f" + {args.add(MEMORY_WEIGHT_IMPORTANCE)} * {self._importance_pg(args)}"
+        )
+        if query:
+            tsquery = TSQUERY.format(args.add(query))
+            # normalization flag 32 maps ts_rank_cd onto rank / (rank + 1), matching the SQLite BM25 scaling
+            score = f"{args.add(MEMORY_WEIGHT_BM25)} * ts_rank_cd(text_tsv, {tsquery}, 32) + {score}"
+            where += f" AND text_tsv @@ {tsquery}"
+        sql = f"SELECT *, {score} AS score FROM memory_entries WHERE {where} ORDER BY score DESC, created_at DESC LIMIT {args.add(limit)}"
+        async with pool.acquire() as conn:
+            rows, timed_out = await _fetch_pg(conn, sql, args, deadline)
+        return QueryResult([await self._row_to_entry_pg(r) for r in rows], timed_out)
 
+    @timed("update")
     def update(
         self,
         entry_id: str,
@@ -476,37 +2197,59 @@ class MemoryStore:
     ) -> None:
         if MEMORY_DB_URL and asyncpg is not None:
             return self._run_async(self._update_pg(entry_id, text, tags, ttl, metadata, importance))
-        conn = self._connect()
-        self._purge_expired(conn)
-        cur = conn.execute("SELECT * FROM memory_entries WHERE id = ?", (entry_id,))
-        row = cur.fetchone()
-        if not row:
-            conn.close()
+        path = self._locate(entry_id)
+        if path is None:
             return
-        entry = self._row_to_entry(row)
-        if text is not None:
-            entry.text = text
-        if tags is not None:
-            entry.tags = list(tags)
-        if ttl is not None:
-            entry.expires_at = time.time() + ttl
-        if metadata is not None:
-            entry.metadata = metadata
-        if importance is not None:
-            entry.importance = importance
-        conn.execute(
-            "UPDATE memory_entries SET text = ?, tags = ?, importance = ?, expires_at = ?, metadata = ? WHERE id = ?",
-            (
-                entry.text,
-                json.dumps(entry.tags),
-                entry.importance,
-                entry.expires_at,
-                json.dumps(entry.metadata),
-                entry.id,
-            ),
-        )
-        conn.commit()
-        conn.close()
+        entry = None
+        with suppress(ShardFileMissing), self._connect(path) as conn:  # a dropped segment took the entry with it
+            cur = conn.execute("SELECT rowid, * FROM memory_entries WHERE id = ?", (entry_id,))
+            row = cur.fetchone()
+            if not row:
+                return
+            entry = self._row_to_entry(row, path, conn)
+            reembedded = False
+            if text is not None:
+                entry.text = text
+                # Only rows that had an embedding get a new one; without a model the stored vector is kept.
+                vec = self._embed(text) if entry.embedding is not None else None
+                if vec is not None:
+                    entry.embedding, reembedded = vec, True
+            if tags is not None:
+                entry.tags = list(tags)
+            if ttl is not None:
+                entry.expires_at = time.time() + ttl
+            if metadata is not None:
+                entry.metadata = metadata
+            if importance is not None:
+                entry.importance = importance
+            now = time.time()  # entry.importance is the effective value, so it is re-based at now
+            codec = self._codec(path)
+            stored_text, text_z = codec.encode_text(entry.text, conn)
+            stored_metadata, metadata_z = codec.encode_metadata(entry.metadata, conn)
+            conn.execute(
+                "UPDATE memory_entries SET text = ?, text_z = ?, tags = ?, importance = ?, expires_at = ?, metadata = ?, "
+                "metadata_z = ?, embedding = ?, importance_at = ?, decay_key = ? WHERE id = ?",
+                (
+                    stored_text,
+                    text_z,
+                    json.dumps(entry.tags),
+                    entry.importance,
+                    entry.expires_at,
+                    stored_metadata,
+                    metadata_z,
+                    pack_vector(entry.embedding) if entry.embedding is not None else None,
+                    now,
+                    _decay_key(entry.importance, now),
+                    entry.id,
+                ),
+            )
+            conn.commit()
+            if reembedded and has_vector_index(path):
+                vector_index(path).note_deleted(conn, [row["vec_seq"]])
+        if entry is None:
+            return
+        self._log_segment_changes(path, [("update", entry.id, entry.agent_id)])
+        self._invalidate()
 
     async def _update_pg(
         self,
@@ -527,6 +2270,9 @@ class MemoryStore:
             entry = await self._row_to_entry_pg(row)
             if text is not None:
                 entry.text = text
+                vec = self._embed(text) if entry.embedding is not None else None  # as in update()
+                if vec is not None:
+                    entry.embedding = vec
             if tags is not None:
                 entry.tags = list(tags)
             if ttl is not None:
@@ -535,23 +2281,227 @@ class MemoryStore:
                 entry.metadata = metadata
             if importance is not None:
                 entry.importance = importance
+            now = time.time()
             await conn.execute(
-                "UPDATE memory_entries SET text = $1, tags = $2, importance = $3, expires_at = $4, metadata = $5 WHERE id = $6",
+                "UPDATE memory_entries SET text = $1, tags = $2, importance = $3, expires_at = $4, metadata = $5, "
+                "embedding = $6, importance_at = $7, decay_key = $8 WHERE id = $9",
                 entry.text,
                 entry.tags,
                 entry.importance,
                 entry.expires_at,
                 entry.metadata,
+                entry.embedding,
+                now,
+                _decay_key(entry.importance, now),
                 entry.id,
             )
 
+    @staticmethod
+    def _check_changes(changes: dict[str, Any]) -> None:
+        unknown = sorted(set(changes) - set(_UPDATE_FIELDS))
+        if unknown:
+            raise ValueError(f"unknown update fields: {', '.join(unknown)}")
+        for a, b in _UPDATE_CONFLICTS:
+            if a in changes and b in changes:
+                raise ValueError(f"{a} and {b} cannot be combined")
+        for field, value in changes.items():
+            # update() reads None as "leave as is"; here a field is left alone by omitting it.
+            if value is None:
+                raise ValueError(f"{field} cannot be None; leave it out to keep the stored value")
+            if field == "text" and not isinstance(value, str):
+                raise ValueError(f"text must be a str, not {type(value).__name__}")
+            if field == "tags" and (isinstance(value, (str, bytes)) or not isinstance(value, Iterable)):
+                raise ValueError(f"tags must be a list of str, not {type(value).__name__}")
+            if field == "metadata" and not isinstance(value, dict):
+                raise ValueError(f"metadata must be a dict, not {type(value).__name__}")
+            if field in _UPDATE_NUMBERS and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f"{field} must be a number, not {type(value).__name__}")
+
+    def _assignments(
+        self, changes: dict[str, Any], now: float, path: Path, vector: list[float] | None, conn: sqlite3.Connection
+    ) -> tuple[str, list[Any]]:
+        """``UPDATE memory_entries SET ... WHERE id = ?`` and its parameters (without the id) for one change."""
+        codec = self._codec(path)
+        sets: list[str] = []
+        params: list[Any] = []
+        if "text" in changes:
+            text, text_z = codec.encode_text(changes["text"], conn)
+            # Like update(): only rows that had an embedding get a new one, and only if one was computed.
+            sets += ["text = ?", "text_z = ?", "embedding = CASE WHEN embedding IS NULL THEN NULL ELSE COALESCE(?, embedding) END"]
+            params += [text, text_z, pack_vector(vector) if vector is not None else None]
+        if "tags" in changes:
+            sets.append("tags = ?")
+            params.append(json.dumps(list(changes["tags"])))
+        if "metadata" in changes:
+            metadata, metadata_z = codec.encode_metadata(changes["metadata"], conn)
+            sets += ["metadata = ?", "metadata_z = ?"]
+            params += [metadata, metadata_z]
+        if "importance" in changes:
+            value = changes["importance"]
+            sets += ["importance = ?", "importance_at = ?", "decay_key = ?"]
+            params += [value, now, _decay_key(value, now)]
+        if "importance_delta" in changes:
+            # SET expressions see the old row, so the bump applies to the effective importance as of now.
+            effective, effective_params = _importance_sql(now, alias="")
+            bumped, bumped_params = f"({effective} + ?)", [*effective_params, changes["importance_delta"]]
+            sets += [
+                f"importance = {bumped}",
+                "importance_at = ?",
+                f"decay_key = CASE WHEN {bumped} <= 0 THEN ? ELSE ln({bumped}) + ? END",
+            ]
+            params += [*bumped_params, now, *bumped_params, _NO_IMPORTANCE_KEY, *bumped_params, _decay_rate() * now]
+        if "ttl" in changes:
+            sets.append("expires_at = ?")
+            params.append(now + changes["ttl"])
+        if "extend_ttl" in changes:
+            sets.append("expires_at = expires_at + ?")  # entries that never expire stay that way
+            params.append(changes["extend_ttl"])
+        return f"UPDATE memory_entries SET {', '.join(sets)} WHERE id = ?", params
+
+    @timed("update_many")
+    def update_many(self, updates: Iterable[tuple[str, dict[str, Any]]]) -> int:
+        """Apply partial changes to many entries in one transaction, without reading them first.
+
+        ``updates`` holds ``(entry_id, changes)`` pairs; ``changes`` may set ``text``, ``tags``,
+        ``metadata`` (replaced whole), ``importance`` or ``ttl`` (seconds from now), add
+        ``importance_delta`` to the current effective importance, or push an existing expiry
+        later by ``extend_ttl`` seconds. Only the named columns are written; changes with the
+        same fields share one prepared statement. Returns the number of entries updated.
+
+        Unlike ``update()``, a field set to None is an error (``ValueError``), as are values of
+        the wrong type (e.g. ``tags`` given as a single str); leave a field out to keep it.
+        """
+        updates = [(entry_id, dict(changes)) for entry_id, changes in updates if changes]
+        for _, changes in updates:
+            self._check_changes(changes)
+        if not updates:
+            return 0
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._update_many_pg(updates))
+        now = time.time()
+        vectors = {entry_id: self._embed(c["text"]) for entry_id, c in updates if "text" in c}
+        paths = self._read_paths()
+        pending = updates
+        updated = 0
+        for path, _ in paths:
+            if not pending:
+                break
+            done: list[str] = []
+            missed: list[tuple[str, dict[str, Any]]] = pending  # all of them if the file was dropped meanwhile
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                missed = []
+                replaced: list[int] = []
+                retexted = json.dumps([entry_id for entry_id, c in pending if "text" in c])
+                if has_vector_index(path) and retexted != "[]":  # re-embedded rows give up their vec_seq
+                    sql = "SELECT vec_seq FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))"
+                    replaced = [r[0] for r in conn.execute(sql, (retexted,))]
+                statements = [
+                    (*self._assignments(c, now, path, vectors.get(entry_id), conn), entry_id) for entry_id, c in pending
+                ]
+                if len(paths) == 1:
+                    groups: dict[str, list[tuple[Any, ...]]] = {}
+                    for sql, params, entry_id in statements:
+                        groups.setdefault(sql, []).append((*params, entry_id))
+                    for sql, rows in groups.items():
+                        updated += conn.executemany(sql, rows).rowcount
+                else:  # entries may live in a segment: find out which ones this file had
+                    for (sql, params, entry_id), item in zip(statements, pending):
+                        if conn.execute(sql, (*params, entry_id)).rowcount:
+                            done.append(entry_id)
+                        else:
+                            missed.append(item)
+                    updated += len(done)
+                conn.commit()
+                if replaced:
+                    vector_index(path).note_deleted(conn, replaced)
+                if done and path != self._db_path():
+                    agents = conn.execute(
+                        "SELECT id, agent_id FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(done),)
+                    ).fetchall()
+            if done and path != self._db_path():
+                self._log_segment_changes(path, [("update", r[0], r[1]) for r in agents])
+            pending = missed
+        self._invalidate()
+        self._count_writes(updated)
+        return updated
+
+    async def _update_many_pg(self, updates: Sequence[tuple[str, dict[str, Any]]]) -> int:
+        pool = await self._pg_pool()
+        if pool is None:
+            return 0
+        now = time.time()
+        groups: dict[tuple[str, ...], list[tuple[str, dict[str, Any]]]] = {}
+        for entry_id, changes in updates:
+            groups.setdefault(tuple(f for f in _UPDATE_FIELDS if f in changes), []).append((entry_id, changes))
+        casts = {
+            "text": "text", "tags": "jsonb", "metadata": "jsonb", "importance": "float8",
+            "importance_delta": "float8", "ttl": "float8", "extend_ttl": "float8",
+        }  # fmt: skip
+        updated = 0
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                for fields, items in groups.items():
+                    args = _PgArgs()
+                    rows = []
+                    for entry_id, changes in items:
+                        values = [f"{args.add(entry_id)}::uuid"]
+                        for field in fields:
+                            value = changes[field]
+                            if field == "tags":
+                                value = list(value)
+                            elif field == "metadata":
+                                value = dict(value)
+                            values.append(f"{args.add(value)}::{casts[field]}")
+                        rows.append(f"({', '.join(values)})")
+                    sets = []
+                    if "text" in fields:
+                        sets.append("text = v.text")
+                    if "tags" in fields:
+                        sets.append("tags = v.tags")
+                    if "metadata" in fields:
+                        sets.append("metadata = v.metadata")
+                    at = args.add(now)
+                    if "importance" in fields:
+                        sets += [
+                            "importance = v.importance",
+                            f"importance_at = {at}",
+                            f"decay_key = CASE WHEN v.importance IS NULL THEN NULL WHEN v.importance <= 0 "
+                            f"THEN {args.add(_NO_IMPORTANCE_KEY)} ELSE ln(v.importance) + {args.add(_decay_rate() * now)} END",
+                        ]
+                    if "importance_delta" in fields:
+                        bumped = f"({self._importance_pg(args, 'm.')} + v.importance_delta)"
+                        sets += [
+                            f"importance = {bumped}",
+                            f"importance_at = {at}",
+                            f"decay_key = CASE WHEN {bumped} <= 0 THEN {args.add(_NO_IMPORTANCE_KEY)} "
+                            f"ELSE ln({bumped}) + {args.add(_decay_rate() * now)} END",
+                        ]
+                    if "ttl" in fields:
+                        sets.append(f"expires_at = {at} + v.ttl")
+                    if "extend_ttl" in fields:
+                        sets.append("expires_at = m.expires_at + v.extend_ttl")
+                    status = await conn.execute(
+                        f"UPDATE memory_entries AS m SET {', '.join(sets)} "
+                        f"FROM (VALUES {', '.join(rows)}) AS v(id, {', '.join(fields)}) WHERE m.id = v.id",
+                        *args,
+                    )
+                    updated += int(status.split()[-1])
+        return updated
+
+    @timed("soft_delete")
     def soft_delete(self, entry_id: str) -> None:
         if MEMORY_DB_URL and asyncpg is not None:
             return self._run_async(self._soft_delete_pg(entry_id))
-        conn = self._connect()
-        conn.execute("UPDATE memory_entries SET deleted = 1 WHERE id = ?", (entry_id,))
-        conn.commit()
-        conn.close()
+        path = self._locate(entry_id)
+        if path is None:
+            return
+        agents = []
+        with suppress(ShardFileMissing), self._connect(path) as conn:  # a dropped segment took the entry with it
+            agents = [r[0] for r in conn.execute("SELECT agent_id FROM memory_entries WHERE id = ? AND deleted = 0", (entry_id,))]
+            conn.execute("UPDATE memory_entries SET deleted = 1 WHERE id = ?", (entry_id,))
+            conn.commit()
+        self._log_segment_changes(path, [("soft_delete", entry_id, a) for a in agents])
+        self._invalidate()
 
     async def _soft_delete_pg(self, entry_id: str) -> None:
         pool = await self._pg_pool()
@@ -560,29 +2510,51 @@ class MemoryStore:
         async with pool.acquire() as conn:
             await conn.execute("UPDATE memory_entries SET deleted = TRUE WHERE id = $1", entry_id)
 
+    @timed("delete")
     def delete(self, entry_id: str) -> None:
         if MEMORY_DB_URL and asyncpg is not None:
             return self._run_async(self._delete_pg(entry_id))
-        conn = self._connect()
-        conn.execute("DELETE FROM memory_entries WHERE id = ?", (entry_id,))
-        conn.commit()
-        conn.close()
+        path = self._locate(entry_id)
+        if path is None:
+            return
+        rows = []
+        with suppress(ShardFileMissing), self._connect(path) as conn:  # a dropped segment took the entry with it
+            rows = conn.execute("SELECT vec_seq, agent_id FROM memory_entries WHERE id = ?", (entry_id,)).fetchall()
+            conn.execute("DELETE FROM memory_entries WHERE id = ?", (entry_id,))
+            conn.commit()
+            self._note_deleted(conn, [r[0] for r in rows], path)
+        self._log_segment_changes(path, [("delete", entry_id, r[1]) for r in rows])
+        self._invalidate()
 
     async def _delete_pg(self, entry_id: str) -> None:
         pool = await self._pg_pool()
         if pool is None:
             return
         async with pool.acquire() as conn:
-            await conn.execute("DELETE FROM memory_entries WHERE id = $1", entry_id)
+            rows = await conn.fetch("DELETE FROM memory_entries WHERE id = $1 RETURNING blob_ref", entry_id)
+        self._release_pg_blobs(rows)
 
+    def _release_pg_blobs(self, rows: Sequence[Any]) -> None:
+        """Give back the blob references of Postgres rows just deleted (``RETURNING blob_ref``).
+
+        Postgres has no trigger queues; the rows' references were adopted from the writes in
+        ``_add_pg``/``_add_many_pg`` or acquired by ``_import_batch_pg``.
+        """
+        refs = [r["blob_ref"] for r in rows if r["blob_ref"]]
+        if refs:
+            self._blobs().release(refs)
+
+    @timed("prune_expired")
     def prune_expired(self) -> None:
         if MEMORY_DB_URL and asyncpg is not None:
             self._run_async(self._prune_expired_pg())
             return
-        conn = self._connect()
-        self._purge_expired(conn)
-        conn.execute("VACUUM")
-        conn.close()
+        with self._connect() as conn:
+            self._note_deleted(conn, [r["vec_seq"] for r in self._purge_expired(conn)])
+            while _incremental_vacuum(conn):  # returns free pages without rewriting the file like VACUUM
+                pass
+        _drop_expired_segments(self._db_path(), time.time())
+        self._invalidate()
 
     async def _prune_expired_pg(self) -> None:
         pool = await self._pg_pool()
@@ -590,55 +2562,264 @@ class MemoryStore:
             return
         now = time.time()
         async with pool.acquire() as conn:
-            await conn.execute("DELETE FROM memory_entries WHERE expires_at IS NOT NULL AND expires_at < $1", now)
+            while True:
+                rows = await conn.fetch(
+                    "DELETE FROM memory_entries WHERE id IN ("
+                    "SELECT id FROM memory_entries WHERE expires_at IS NOT NULL AND expires_at < $1 LIMIT $2) RETURNING blob_ref",
+                    now,
+                    MEMORY_REAPER_BATCH,
+                )
+                self._release_pg_blobs(rows)
+                if len(rows) < MEMORY_REAPER_BATCH:
+                    break
+
+    @staticmethod
+    def _importance_below(threshold: float, placeholder: str = "?") -> tuple[str, Any]:
+        """WHERE clause (binding ``placeholder``) and its parameter selecting rows whose effective importance is below ``threshold``."""
+        if threshold <= 0:
+            return f"importance < {placeholder}", threshold
+        return f"decay_key < {placeholder}", math.log(threshold) + _decay_rate() * time.time()  # idx_memory_decay range scan
 
+    @timed("prune_importance")
     def prune_importance(self, threshold: float = 0.2) -> None:
+        """Delete entries whose (decayed) importance is below ``threshold``."""
         if MEMORY_DB_URL and asyncpg is not None:
             return self._run_async(self._prune_importance_pg(threshold))
-        conn = self._connect()
-        conn.execute("DELETE FROM memory_entries WHERE importance < ?", (threshold,))
-        conn.commit()
-        conn.close()
+        where, bound = self._importance_below(threshold)
+        for path, _ in self._read_paths():
+            rows = []
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                rows = conn.execute(f"SELECT vec_seq, id, agent_id FROM memory_entries WHERE {where}", (bound,)).fetchall()
+                conn.execute(f"DELETE FROM memory_entries WHERE {where}", (bound,))
+                conn.commit()
+                self._note_deleted(conn, [r[0] for r in rows], path)
+            self._log_segment_changes(path, [("delete", r[1], r[2]) for r in rows])
+        self._invalidate()
 
     async def _prune_importance_pg(self, threshold: float) -> None:
         pool = await self._pg_pool()
         if pool is None:
             return
+        where, bound = self._importance_below(threshold, "$1")
         async with pool.acquire() as conn:
-            await conn.execute("DELETE FROM memory_entries WHERE importance < $1", threshold)
+            rows = await conn.fetch(f"DELETE FROM memory_entries WHERE {where} RETURNING blob_ref", bound)
+        self._release_pg_blobs(rows)
 
     def apply_importance_decay(self) -> None:
-        if not MEMORY_IMPORTANCE_DECAY:
-            return
+        """No-op, kept for existing schedulers.
+
+        Decay is applied lazily: the effective importance is computed from the stored importance and
+        its ``importance_at`` timestamp whenever it is read, ranked or pruned, so there is nothing to
+        rewrite. Tune it with ``MEMORY_DECAY_FACTOR`` per ``MEMORY_DECAY_PERIOD``.
+        """
+
+    # ---------- Compaction ----------
+    def fragmentation(self) -> dict[str, Any]:
+        """Free-page ratio and dead-row counts for this shard and its segments; ``needs_compaction`` applies the MEMORY_COMPACT_* thresholds."""
+        files = []
+        for path, _ in self._read_paths():
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                files.append(_fragmentation(conn))
+        return _total_fragmentation(files)
+
+    def compact(
+        self,
+        *,
+        batch: int | None = None,
+        vacuum_pages: int | None = None,
+        stop: threading.Event | None = None,
+    ) -> dict[str, Any]:
+        """Hard-delete soft-deleted and expired rows in batches, then release free pages with incremental vacuum.
+
+        Covers the base file and every segment file. Each batch and vacuum step is a short
+        transaction on a briefly borrowed connection, so normal traffic interleaves with compaction.
+        Setting ``stop`` interrupts it between steps; running it again continues where it stopped.
+        """
+        batch = batch or MEMORY_REAPER_BATCH
         if MEMORY_DB_URL and asyncpg is not None:
-            return self._run_async(self._decay_pg())
-        conn = self._connect()
-        conn.execute("UPDATE memory_entries SET importance = importance * ?", (MEMORY_DECAY_FACTOR,))
-        conn.commit()
-        conn.close()
+            return self._run_async(self._compact_pg(batch))
+        report: dict[str, Any] = {"deleted": 0, "expired": 0, "pages_freed": 0, "interrupted": False}
+        stopped = lambda: stop is not None and stop.is_set()  # noqa: E731
+        for path, _ in self._read_paths():
+            for key, where, params in (("deleted", _SOFT_DELETED_WHERE, ()), ("expired", _EXPIRED_WHERE, (time.time(),))):
+                while not stopped():
+                    rows = []
+                    with suppress(ShardFileMissing), self._connect(path) as conn:
+                        rows = _delete_batch(conn, where, params, batch)
+                        self._note_deleted(conn, [r["vec_seq"] for r in rows], path)
+                    if rows:
+                        self._log_segment_changes(path, [("delete", r[1], r[2]) for r in rows])
+                        self._invalidate()
+                    report[key] += len(rows)
+                    if len(rows) < batch:
+                        break
+            while not stopped():
+                freed = 0
+                with suppress(ShardFileMissing), self._connect(path) as conn:
+                    freed = _incremental_vacuum(conn, vacuum_pages)
+                report["pages_freed"] += freed
+                if not freed:
+                    break
+        report["interrupted"] = stopped()
+        return report
 
-    async def _decay_pg(self) -> None:
+    async def _compact_pg(self, batch: int) -> dict[str, Any]:
         pool = await self._pg_pool()
+        report: dict[str, Any] = {"deleted": 0, "expired": 0, "pages_freed": 0, "interrupted": False}
         if pool is None:
-            return
+            return report
+        # Postgres reclaims space itself (autovacuum); only the batched hard deletes are needed.
+        for key, where in (("deleted", "deleted = TRUE"), ("expired", "expires_at IS NOT NULL AND expires_at < $2")):
+            params: list[Any] = [batch] + ([time.time()] if key == "expired" else [])
+            async with pool.acquire() as conn:
+                while True:
+                    rows = await conn.fetch(
+                        f"DELETE FROM memory_entries WHERE id IN (SELECT id FROM memory_entries WHERE {where} LIMIT $1) "
+                        "RETURNING blob_ref",
+                        *params,
+                    )
+                    self._release_pg_blobs(rows)
+                    count = len(rows)
+                    report[key] += count
+                    if count < batch:
+                        break
+        return report
+
+    def enable_incremental_vacuum(self) -> None:
+        """Switch a shard created before incremental auto-vacuum over; runs one full VACUUM (blocks writers)."""
+        with self._connect() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("VACUUM")
+
+    def rebuild_fts(self) -> None:
+        """Rebuild the FTS index of this shard and each of its segment files, merging each into a single FTS segment."""
+        for path, _ in self._read_paths():
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                # Not 'rebuild': that reads the text column as stored, and compressed rows keep theirs in text_z.
+                conn.execute("INSERT INTO fts_entries(fts_entries) VALUES ('delete-all')")
+                conn.execute(f"INSERT INTO fts_entries(rowid, text) SELECT rowid, {unz_sql('text')} FROM memory_entries")
+                conn.execute("INSERT INTO fts_entries(fts_entries) VALUES ('optimize')")
+                conn.commit()
+
+    # ---------- Compression ----------
+    def compression_stats(self) -> dict[str, Any]:
+        """Compression ratio of this shard and the decompression time its reads have cost so far."""
+        with self._connect() as conn:
+            return compression_stats(conn, self._codec())
+
+    def train_compression_dictionary(self, samples: int | None = None) -> int | None:
+        """Train a new dictionary for this shard's small entries; returns its id, None if the shard is too small.
+
+        Later writes use it; older plain rows are picked up by ``compress_existing``.
+        """
+        with self._connect() as conn:
+            return self._codec().train(conn, samples)
+
+    def compress_existing(self, batch: int | None = None) -> int:
+        """Compress plain rows written before compression (or the current dictionary) was enabled.
+
+        Each call handles one batch; returns the number of rows compressed, 0 when done.
+        """
+        with self._connect() as conn:
+            done = compress_backlog(conn, self._codec(), batch or MEMORY_REAPER_BATCH)
+        if done:
+            self._invalidate()
+        return done
+
+    def merge_fts(self, steps: int | None = None) -> int:
+        """Run up to ``steps`` incremental FTS merge steps on this shard and on each of its segment files.
+
+        Returns the steps that did work; the reaper does this in the background.
+        """
+        merged = 0
+        for path, _ in self._read_paths():
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                merged += _merge_fts(conn, steps)
+        return merged
+
+    # ---------- Change feed ----------
+    def changes_since(self, seq: int = 0, *, limit: int = 1000, agent_id: str | None = None) -> ChangeBatch:
+        """Up to ``limit`` changes after cursor ``seq``, oldest first (see ``core.memory_changes``).
+
+        Pass ``batch.next_seq`` as the cursor of the next call. ``batch.truncated`` means
+        retention already removed changes after ``seq``; resync from a full read, then continue
+        from ``latest_change_seq()`` taken before that read.
+        """
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._changes_since_pg(seq, limit, agent_id))
+        with self._connect() as conn:
+            return _changes_since(conn, seq, limit, agent_id)
+
+    async def _changes_since_pg(self, seq: int, limit: int, agent_id: str | None) -> ChangeBatch:
+        pool = await self._pg_pool()
+        if pool is None:
+            return ChangeBatch(next_seq=seq)
+        async with pool.acquire() as conn:
+            return await changes_since_pg(conn, seq, limit, agent_id)
+
+    def latest_change_seq(self) -> int:
+        """Current end of the change log; a cursor for "changes from now on"."""
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._latest_change_seq_pg())
+        with self._connect() as conn:
+            return latest_seq(conn)
+
+    async def _latest_change_seq_pg(self) -> int:
+        pool = await self._pg_pool()
+        if pool is None:
+            return 0
+        async with pool.acquire() as conn:
+            return int(await conn.fetchval("SELECT COALESCE(max(seq), 0) FROM memory_changes"))
+
+    def trim_changes(self, retention: int | None = None, max_age: float | None = None) -> int:
+        """Apply change-log retention now (the reaper does this every pass); returns rows removed."""
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._trim_changes_pg(retention, max_age))
+        with self._connect() as conn:
+            return trim_changes(conn, retention, max_age)
+
+    async def _trim_changes_pg(self, retention: int | None, max_age: float | None) -> int:
+        pool = await self._pg_pool()
+        if pool is None:
+            return 0
+        async with pool.acquire() as conn:
+            return await trim_changes_pg(conn, retention, max_age)
+
+    def compact_changes(self) -> int:
+        """Keep only the newest change per entry in this shard's log; returns rows removed."""
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._compact_changes_pg())
+        with self._connect() as conn:
+            return compact_changes(conn)
+
+    async def _compact_changes_pg(self) -> int:
+        pool = await self._pg_pool()
+        if pool is None:
+            return 0
         async with pool.acquire() as conn:
-            await conn.execute("UPDATE memory_entries SET importance = importance * $1", MEMORY_DECAY_FACTOR)
+            status = await conn.execute(
+                "DELETE FROM memory_changes c WHERE EXISTS "
+                "(SELECT 1 FROM memory_changes n WHERE n.entry_id = c.entry_id AND n.seq > c.seq)"
+            )
+        return int(status.split()[-1])
 
     def integrity_check(self) -> bool:
-        conn = self._connect()
-        cur = conn.execute("PRAGMA integrity_check")
-        rows = cur.fetchall()
-        conn.close()
+        with self._connect() as conn:
+            cur = conn.execute("PRAGMA integrity_check")
+            rows = cur.fetchall()
         return all(r[0] == "ok" for r in rows)
 
     def dump_all(self) -> List[dict[str, Any]]:
+        """Every row of this shard as a list; use ``export_stream`` for large shards."""
         if MEMORY_DB_URL and asyncpg is not None:
             return self._run_async(self._dump_pg())
-        conn = self._connect()
-        cur = conn.execute("SELECT * FROM memory_entries")
-        rows = cur.fetchall()
-        conn.close()
-        return [asdict(self._row_to_entry(r)) for r in rows]
+        out: list[dict[str, Any]] = []
+        for path, _ in self._read_paths():
+            with suppress(ShardFileMissing), self._connect(path) as conn:
+                rows = conn.execute("SELECT * FROM memory_entries").fetchall()
+                out.extend(asdict(self._row_to_entry(r, path, conn)) for r in rows)
+        return out
 
     async def _dump_pg(self) -> List[dict[str, Any]]:
         pool = await self._pg_pool()
@@ -651,70 +2832,326 @@ class MemoryStore:
             out.append(asdict(await self._row_to_entry_pg(r)))
         return out
 
+    @staticmethod
+    def _export_row(entry: MemoryItem) -> dict[str, Any]:
+        row = asdict(entry)
+        del row["score"]
+        return row
+
+    def _export_batches(self, batch_size: int) -> Iterator[List[dict[str, Any]]]:
+        # Keyset pages by rowid, file by file; the pooled connection is released between batches.
+        for path, _ in self._read_paths():
+            last = 0
+            while True:
+                batch = []
+                with suppress(ShardFileMissing), self._connect(path) as conn:
+                    rows = conn.execute(
+                        "SELECT rowid AS _rowid, * FROM memory_entries WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                        (last, batch_size),
+                    ).fetchall()
+                    batch = [self._export_row(self._row_to_entry(r, path, conn)) for r in rows]
+                if not batch:
+                    break
+                last = rows[-1]["_rowid"]
+                yield batch
+
+    @timed("export_stream")
+    def export_stream(
+        self,
+        dest: Target,
+        *,
+        format: str = "ndjson",
+        batch_size: int | None = None,
+        progress: Progress | None = None,
+    ) -> dict[str, Any]:
+        """Write every row of this shard to ``dest`` (path or binary stream) as NDJSON or Arrow IPC.
+
+        Rows are read and written ``batch_size`` at a time, so memory use does not grow with the
+        shard. ``progress`` is called with the running row count after each batch. Returns a report
+        with rows, batches, seconds and rows_per_sec.
+        """
+        batch_size = batch_size or MEMORY_EXPORT_BATCH
+        transfer = Transfer("export", format, progress)
+        with open_writer(dest, format) as write:
+            if MEMORY_DB_URL and asyncpg is not None:
+                self._run_async(self._export_pg(write, batch_size, transfer))
+            else:
+                for batch in self._export_batches(batch_size):
+                    write(batch)
+                    transfer.add(len(batch))
+        return transfer.report()
+
+    async def _export_pg(self, write: Callable[[List[dict[str, Any]]], None], batch_size: int, transfer: Transfer) -> None:
+        pool = await self._pg_pool()
+        if pool is None:
+            return
+        async with pool.acquire() as conn:
+            async with conn.transaction():  # server-side cursors live inside a transaction
+                batch: list[dict[str, Any]] = []
+                async for row in conn.cursor("SELECT * FROM memory_entries", prefetch=batch_size):
+                    batch.append(self._export_row(await self._row_to_entry_pg(row)))
+                    if len(batch) >= batch_size:
+                        write(batch)
+                        transfer.add(len(batch))
+                        batch = []
+                if batch:
+                    write(batch)
+                    transfer.add(len(batch))
+
+    @timed("import_stream")
+    def import_stream(
+        self,
+        src: Target,
+        *,
+        format: str = "ndjson",
+        batch_size: int | None = None,
+        progress: Progress | None = None,
+    ) -> dict[str, Any]:
+        """Load a dump written by ``export_stream`` (or any NDJSON of ``dump_all`` rows) into this shard.
+
+        Each batch is one transaction: ``executemany`` on SQLite, ``COPY`` plus an upsert on
+        Postgres. Rows replace existing entries with the same id. Returns the same report as
+        ``export_stream``.
+        """
+        transfer = Transfer("import", format, progress)
+        for batch in read_batches(src, format, batch_size):
+            self._import_batch(batch)
+            transfer.add(len(batch))
+        return transfer.report()
+
     def load_dump(self, items: Iterable[dict[str, Any]]) -> None:
+        """Insert or replace ``items`` (rows from ``dump_all``), committing every ``MEMORY_EXPORT_BATCH`` rows."""
+        for batch in batched(items, MEMORY_EXPORT_BATCH):
+            self._import_batch(batch)
+
+    @staticmethod
+    def _load_params(item: dict[str, Any], now: float) -> tuple[Any, ...]:
+        return (
+            item.get("id", str(uuid.uuid4())),
+            item.get("agent_id", "global"),
+            item.get("text", ""),
+            json.dumps(item.get("tags") or []),
+            item.get("importance", 0.0),
+            item.get("created_at", now),
+            item.get("expires_at"),
+            item.get("source"),
+            json.dumps(item.get("metadata") or {}),
+            item.get("blob_ref"),
+            int(item.get("deleted", False)),
+            pack_vector(item["embedding"]) if item.get("embedding") is not None else None,
+            now,  # dumped importances are effective values as of the dump
+            _decay_key(item.get("importance", 0.0), now),
+        )
+
+    def _compressed_load_params(
+        self, item: dict[str, Any], now: float, path: Path | None = None, conn: sqlite3.Connection | None = None
+    ) -> tuple[Any, ...]:
+        params = list(self._load_params(item, now))
+        codec = self._codec(path)
+        params[2], text_z = codec.encode_text(params[2], conn)
+        params[8], metadata_z = codec.encode_metadata(item.get("metadata") or {}, conn)
+        return (*params, text_z, metadata_z)
+
+    def _import_batch(self, batch: Sequence[dict[str, Any]]) -> None:
         if MEMORY_DB_URL and asyncpg is not None:
-            return self._run_async(self._load_pg(items))
-        conn = self._connect()
-        self._purge_expired(conn)
-        for item in items:
-            conn.execute(
-                "INSERT OR REPLACE INTO memory_entries (id, agent_id, text, tags, importance, created_at, expires_at, source, metadata, blob_ref, deleted, embedding) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    item.get("id", str(uuid.uuid4())),
-                    item.get("agent_id", "global"),
-                    item.get("text", ""),
-                    json.dumps(item.get("tags") or []),
-                    item.get("importance", 0.0),
-                    item.get("created_at", time.time()),
-                    item.get("expires_at"),
-                    item.get("source"),
-                    json.dumps(item.get("metadata") or {}),
-                    item.get("blob_ref"),
-                    int(item.get("deleted", False)),
-                    json.dumps(item.get("embedding")) if item.get("embedding") is not None else None,
-                ),
-            )
-        conn.commit()
-        conn.close()
+            return self._run_async(self._import_batch_pg(batch))
+        now = time.time()
+        span = memory_segments.segment_span()
+        by_path: dict[Path, list[dict[str, Any]]] = {}
+        for item in batch:
+            if span and item.get("expires_at") is not None:
+                path = segment_for(self._db_path(), item.get("created_at", now), span)
+            else:
+                path = self._db_path()
+            by_path.setdefault(path, []).append(item)
+        for path, items in by_path.items():
+            if path != self._db_path():
+                memory_segments.create(path)
+            with self._connect(path) as conn:
+                replaced: list[int] = []
+                if has_vector_index(path):  # upserts that change a vector give up the row's old vec_seq
+                    ids = json.dumps([item["id"] for item in items if item.get("id")])
+                    replaced = [
+                        r[0]
+                        for r in conn.execute("SELECT vec_seq FROM memory_entries WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+                    ]
+                # The blob triggers queue each imported ref and each ref an upsert replaces in this
+                # transaction; applying the acquisitions right away keeps the index current.
+                conn.executemany(_LOAD_SQL, [self._compressed_load_params(item, now, path, conn) for item in items])
+                conn.commit()
+                if any(item.get("blob_ref") for item in items):
+                    self._blobs().drain_acquires(conn)
+                if replaced:
+                    vector_index(path).note_deleted(conn, replaced)
+            self._log_segment_changes(path, [("insert", i["id"], i.get("agent_id", "global")) for i in items if i.get("id")])
+        self._invalidate()
+        self._count_writes(len(batch))
 
     async def _load_pg(self, items: Iterable[dict[str, Any]]) -> None:
+        for batch in batched(items, MEMORY_EXPORT_BATCH):
+            await self._import_batch_pg(batch)
+
+    async def _import_batch_pg(self, batch: Sequence[dict[str, Any]]) -> None:
         pool = await self._pg_pool()
         if pool is None:
             return
+        now = time.time()
+        records = []
+        for item in batch:
+            params = list(self._load_params(item, now))
+            params[10] = bool(params[10])
+            params[3] = list(item.get("tags") or [])  # the pool's jsonb / vector codecs take Python objects
+            params[8] = dict(item.get("metadata") or {})
+            params[11] = item.get("embedding")
+            records.append(tuple(params))
         async with pool.acquire() as conn:
             async with conn.transaction():
-                for item in items:
-                    await conn.execute(
-                        "INSERT INTO memory_entries (id, agent_id, text, tags, importance, created_at, expires_at, source, metadata, blob_ref, deleted, embedding) "
-                        "VALUES ($1,$2,$3,$4,$5,$6,$7,$8,$9,$10,$11,$12) "
-                        "ON CONFLICT (id) DO UPDATE SET text=EXCLUDED.text, tags=EXCLUDED.tags, importance=EXCLUDED.importance,"
-                        " created_at=EXCLUDED.created_at, expires_at=EXCLUDED.expires_at, source=EXCLUDED.source, metadata=EXCLUDED.metadata,"
-                        " blob_ref=EXCLUDED.blob_ref, deleted=EXCLUDED.deleted, embedding=EXCLUDED.embedding",
-                        item.get("id", str(uuid.uuid4())),
-                        item.get("agent_id", "global"),
-                        item.get("text", ""),
-                        item.get("tags") or [],
-                        item.get("importance", 0.0),
-                        item.get("created_at", time.time()),
-                        item.get("expires_at"),
-                        item.get("source"),
-                        item.get("metadata") or {},
-                        item.get("blob_ref"),
-                        bool(item.get("deleted", False)),
-                        item.get("embedding"),
-                    )
+                await conn.execute(
+                    "CREATE TEMP TABLE IF NOT EXISTS memory_import (LIKE memory_entries INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                )
+                await conn.copy_records_to_table("memory_import", records=records, columns=_LOAD_COLUMNS)
+                # The refs upserted rows had before and after, for the blob store (the SQLite triggers' job).
+                moved = await conn.fetch(
+                    "SELECT old_ref, new_ref FROM (SELECT DISTINCT ON (i.id) e.blob_ref AS old_ref, i.blob_ref AS new_ref "
+                    "FROM memory_import i LEFT JOIN memory_entries e ON e.id = i.id ORDER BY i.id, i.ctid DESC) m "
+                    "WHERE old_ref IS DISTINCT FROM new_ref"
+                )
+                await conn.execute(
+                    f"INSERT INTO memory_entries ({', '.join(_LOAD_COLUMNS)}) "
+                    f"SELECT DISTINCT ON (id) {', '.join(_LOAD_COLUMNS)} FROM memory_import ORDER BY id, ctid DESC "
+                    "ON CONFLICT (id) DO UPDATE SET "
+                    + ", ".join(f"{c} = EXCLUDED.{c}" for c in _LOAD_COLUMNS if c not in ("id", "agent_id"))
+                )
+        blobs = self._blobs()
+        blobs.acquire(r["new_ref"] for r in moved if r["new_ref"])  # acquisitions first, so a moved ref never drops to zero
+        self._release_pg_blobs([{"blob_ref": r["old_ref"]} for r in moved])
 
-    # ---------- Embedding hooks (semantic search placeholder) ----------
+    # ---------- Embeddings / semantic search ----------
     def embed_text(self, text: str) -> list[float]:
         vec = self._embed(text)
         if vec is None:
             raise NotImplementedError("Embeddings disabled or backend not available")
         return vec
 
-    def semantic_search(self, agent_id: str, query: str, limit: int = 5) -> List[MemoryItem]:
-        # Placeholder: implement with pgvector/FAISS; returning empty for now
-        return []
+    def _note_deleted(self, conn: sqlite3.Connection, seqs: Sequence[int | None], path: Path | None = None) -> None:
+        path = path or self._db_path()
+        if seqs and has_vector_index(path):
+            vector_index(path).note_deleted(conn, seqs)
+
+    @timed("semantic_search")
+    def semantic_search(
+        self,
+        agent_id: str,
+        query: str | Sequence[float],
+        limit: int = 5,
+        *,
+        tags_any: Sequence[str] | None = None,
+        tags_all: Sequence[str] | None = None,
+        tags_none: Sequence[str] | None = None,
+        deadline_ms: float | None = None,
+    ) -> QueryResult:
+        """Nearest live entries of ``agent_id`` by cosine similarity to ``query`` (text or vector).
+
+        Returns ``[]`` when no embedding can be computed for a text query. ``deadline_ms`` bounds
+        the SQL candidate lookups; see ``get``.
+        """
+        deadline = _deadline_at(deadline_ms)
+        result = self._semantic(agent_id, query, limit, TagFilter.build(None, tags_any, tags_all, tags_none), deadline)
+        return self._record_deadline("semantic_search", deadline, result)
+
+    def _semantic(
+        self,
+        agent_id: str,
+        query: str | Sequence[float],
+        limit: int,
+        tags: TagFilter | None,
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        vec = self._embed(query) if isinstance(query, str) else list(query)
+        if not vec:
+            return QueryResult()
+        if MEMORY_DB_URL and asyncpg is not None:
+            return self._run_async(self._semantic_pg(agent_id, vec, limit, tags, deadline, since))
+        where, params = self._filters(agent_id, tags, None, since)
+        items: list[MemoryItem] = []
+        timed_out = False
+        for path, _ in self._read_paths(since):
+            with suppress(ShardFileMissing):
+                found = self._semantic_file(path, vec, limit, where, params, deadline)
+                items.extend(found)
+                timed_out = timed_out or found.timed_out
+        items.sort(key=lambda e: e.score or 0.0, reverse=True)
+        return QueryResult(items[:limit], timed_out)
+
+    def _semantic_file(
+        self, path: Path, vec: Sequence[float], limit: int, where: str, params: Sequence[Any], deadline: float | None
+    ) -> QueryResult:
+        k = limit * 4
+        with self._connect(path) as conn:
+            index = vector_index(path)  # after the file is known to exist, so a dropped segment gets no index
+            index.sync(conn)
+            while True:
+                hits = dict(index.search(vec, k))
+                if not hits:
+                    return QueryResult()
+                marks = ",".join("?" * len(hits))
+                rows, timed_out = _fetch(
+                    conn,
+                    f"SELECT e.* FROM memory_entries e WHERE e.vec_seq IN ({marks}) AND {where}",
+                    (*hits, *params),
+                    deadline,
+                )
+                # Candidates may belong to other agents or be deleted/expired; widen until enough survive.
+                if timed_out or len(rows) >= limit or len(hits) < k:
+                    break
+                k *= 4
+            items = []
+            for row in rows:
+                item = self._row_to_entry(row, path, conn)
+                item.score = hits[row["vec_seq"]]
+                items.append(item)
+        items.sort(key=lambda e: e.score or 0.0, reverse=True)
+        return QueryResult(items[:limit], timed_out)
+
+    async def _semantic_pg(
+        self,
+        agent_id: str | None,
+        vec: Sequence[float],
+        limit: int,
+        tags: TagFilter | None,
+        deadline: float | None = None,
+        since: float | None = None,
+    ) -> QueryResult:
+        """Nearest neighbours through the HNSW index; ``score`` is cosine similarity."""
+        pool = await self._pg_pool()
+        if pool is None:
+            return QueryResult()
+        args = _PgArgs()
+        where = self._filters_pg(args, agent_id, tags, since=since)
+        target = f"{args.add(list(vec))}::vector"
+        sql = (
+            f"SELECT *, 1 - (embedding <=> {target}) AS score FROM memory_entries "
+            f"WHERE {where} AND embedding IS NOT NULL ORDER BY embedding <=> {target} LIMIT {args.add(limit)}"
+        )
+        async with pool.acquire() as conn:
+            rows, timed_out = await _fetch_pg(conn, sql, args, deadline)
+        return QueryResult([await self._row_to_entry_pg(r) for r in rows], timed_out)
 
 
-__all__ = ["MemoryStore", "MemoryItem"]
+__all__ = [
+    "MemoryStore",
+    "MemoryItem",
+    "QueryResult",
+    "TagFilter",
+    "close_pg_pool",
+    "compact_shards",
+    "compression_report",
+    "enforce_quotas",
+    "flush_pending_writes",
+    "merge_fts_indexes",
+    "quota_report",
+    "reap_expired",
+    "shutdown",
+    "telemetry_metrics",
+]
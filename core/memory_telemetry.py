@@ -0,0 +1,278 @@
+"""Query telemetry for ``MemoryStore``: latency histograms, row counters and a slow-query log.
+
+Off by default; with ``MEMORY_TELEMETRY=true`` the store records:
+
+- ``memory_operation_seconds``: latency of each public call (``get``, ``search``, ``add``, ...)
+  labelled by operation and shard class (``agent``, ``business``, ``global``)
+- ``memory_query_seconds``: latency of each SQL query those calls run, same labels
+- ``memory_query_rows_returned_total`` and ``memory_query_scan_steps_total``: rows returned and
+  the work done to find them. SQLite does not report rows scanned per statement, so the scan
+  counter is the number of virtual-machine steps, sampled every ``MEMORY_TELEMETRY_STEPS`` by
+  the progress handler; a query that walks an index instead of the table shows up as far fewer
+  steps per row returned.
+- a slow-query log: queries slower than ``MEMORY_SLOW_QUERY_MS`` are kept (the newest
+  ``MEMORY_SLOW_QUERY_LOG_SIZE``) with their SQL, the shape of their parameters (types and
+  sizes, never values), the shard and ``EXPLAIN QUERY PLAN`` (``EXPLAIN`` on Postgres), and
+  logged on the ``core.memory_telemetry`` logger.
+
+``render()`` returns the metrics in the Prometheus text format; ``register_prometheus()`` adds
+them to a ``prometheus_client`` registry so an existing ``/metrics`` endpoint serves them.
+When disabled each call pays one flag check.
+"""
+
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Sequence, TypeVar
+
+try:  # optional exporter integration
+    from prometheus_client.core import CounterMetricFamily, HistogramMetricFamily  # type: ignore
+except Exception:  # pragma: no cover
+    CounterMetricFamily = HistogramMetricFamily = None  # type: ignore
+
+MEMORY_TELEMETRY = os.getenv("MEMORY_TELEMETRY", "false").lower() == "true"
+MEMORY_SLOW_QUERY_MS = float(os.getenv("MEMORY_SLOW_QUERY_MS", "100"))
+MEMORY_SLOW_QUERY_LOG_SIZE = int(os.getenv("MEMORY_SLOW_QUERY_LOG_SIZE", "200"))
+MEMORY_TELEMETRY_STEPS = int(os.getenv("MEMORY_TELEMETRY_STEPS", "100"))  # VM steps per scan-counter sample
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def shard_class(shard: str | None) -> str:
+    """``agent``, ``business`` or ``global`` for a shard name (``agent_<id>``, ``business_<id>``, None)."""
+    if shard and shard.startswith("agent_"):
+        return "agent"
+    if shard and shard.startswith("business_"):
+        return "business"
+    return "global"
+
+
+@dataclass(frozen=True)
+class _Scope:
+    op: str
+    shard: str
+    shard_class: str
+
+
+# The public call a query belongs to; queries outside one are labelled "query".
+_scope: contextvars.ContextVar[_Scope | None] = contextvars.ContextVar("memory_telemetry_scope", default=None)
+
+
+def current_scope() -> _Scope:
+    return _scope.get() or _Scope("query", "", "global")
+
+
+@dataclass(frozen=True)
+class SlowQuery:
+    at: float
+    op: str
+    shard: str
+    seconds: float
+    rows: int
+    sql: str
+    params: tuple[str, ...]  # shape only, e.g. ("str[5]", "float", "int")
+    plan: tuple[str, ...]
+
+
+def params_shape(params: Iterable[Any]) -> tuple[str, ...]:
+    shape = []
+    for value in params:
+        kind = type(value).__name__
+        shape.append(f"{kind}[{len(value)}]" if isinstance(value, (str, bytes, list, tuple)) else kind)
+    return tuple(shape)
+
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Telemetry:
+    """Thread-safe in-process metric store; cheap enough to record on every call."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.operations: dict[tuple[str, str], _Histogram] = {}
+        self.queries: dict[tuple[str, str], _Histogram] = {}
+        self.rows_returned: dict[tuple[str, str], int] = {}
+        self.scan_steps: dict[tuple[str, str], int] = {}
+        self.slow: deque[SlowQuery] = deque(maxlen=MEMORY_SLOW_QUERY_LOG_SIZE)
+
+    def observe_operation(self, scope: _Scope, seconds: float) -> None:
+        with self._lock:
+            self.operations.setdefault((scope.op, scope.shard_class), _Histogram()).observe(seconds)
+
+    def observe_query(self, scope: _Scope, seconds: float, rows: int, steps: int) -> None:
+        key = (scope.op, scope.shard_class)
+        with self._lock:
+            self.queries.setdefault(key, _Histogram()).observe(seconds)
+            self.rows_returned[key] = self.rows_returned.get(key, 0) + rows
+            self.scan_steps[key] = self.scan_steps.get(key, 0) + steps
+
+    def log_slow(self, entry: SlowQuery) -> None:
+        with self._lock:
+            self.slow.append(entry)
+        logger.warning(
+            "slow memory query: %s on %s took %.1f ms (%d rows) plan=%s sql=%s params=%s",
+            entry.op, entry.shard, entry.seconds * 1000.0, entry.rows, " | ".join(entry.plan), entry.sql, entry.params,
+        )  # fmt: skip
+
+    def slow_queries(self) -> list[SlowQuery]:
+        with self._lock:
+            return list(self.slow)
+
+    def snapshot(self) -> dict[str, Any]:
+        def hist(h: _Histogram) -> dict[str, Any]:
+            return {"count": h.count, "sum": round(h.total, 6), "buckets": dict(zip((*BUCKETS, float("inf")), h.counts))}
+
+        with self._lock:
+            return {
+                "operations": {f"{op}/{cls}": hist(h) for (op, cls), h in self.operations.items()},
+                "queries": {f"{op}/{cls}": hist(h) for (op, cls), h in self.queries.items()},
+                "rows_returned": {f"{op}/{cls}": n for (op, cls), n in self.rows_returned.items()},
+                "scan_steps": {f"{op}/{cls}": n for (op, cls), n in self.scan_steps.items()},
+                "slow_queries": len(self.slow),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.operations.clear()
+            self.queries.clear()
+            self.rows_returned.clear()
+            self.scan_steps.clear()
+            self.slow.clear()
+
+    # ---------- export ----------
+    def _families(self) -> list[tuple[str, str, str, dict[tuple[str, str], Any]]]:
+        with self._lock:
+            return [
+                ("memory_operation_seconds", "histogram", "Latency of MemoryStore calls", dict(self.operations)),
+                ("memory_query_seconds", "histogram", "Latency of memory SQL queries", dict(self.queries)),
+                ("memory_query_rows_returned_total", "counter", "Rows returned by memory queries", dict(self.rows_returned)),
+                ("memory_query_scan_steps_total", "counter", "SQLite VM steps spent in memory queries", dict(self.scan_steps)),
+            ]
+
+    def render(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        for name, kind, doc, series in self._families():
+            lines += [f"# HELP {name} {doc}", f"# TYPE {name} {kind}"]
+            for (op, cls), value in sorted(series.items()):
+                labels = f'op="{op}",shard_class="{cls}"'
+                if kind == "counter":
+                    lines.append(f"{name}{{{labels}}} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip((*BUCKETS, float("inf")), value.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{labels}}} {value.total}")
+                lines.append(f"{name}_count{{{labels}}} {value.count}")
+        return "\n".join(lines) + "\n"
+
+    def collect(self) -> Iterable[Any]:
+        """``prometheus_client`` collector protocol."""
+        for name, kind, doc, series in self._families():
+            if kind == "counter":
+                family = CounterMetricFamily(name.removesuffix("_total"), doc, labels=["op", "shard_class"])
+                for (op, cls), value in series.items():
+                    family.add_metric([op, cls], value)
+            else:
+                family = HistogramMetricFamily(name, doc, labels=["op", "shard_class"])
+                for (op, cls), h in series.items():
+                    cumulative, buckets = 0, []
+                    for bound, count in zip((*BUCKETS, float("inf")), h.counts):
+                        cumulative += count
+                        buckets.append(("+Inf" if bound == float("inf") else repr(bound), cumulative))
+                    family.add_metric([op, cls], buckets, h.total)
+            yield family
+
+
+telemetry = Telemetry()
+
+
+def register_prometheus(registry: Any = None) -> None:
+    """Serve these metrics from a ``prometheus_client`` registry (the default one if None)."""
+    if CounterMetricFamily is None:
+        raise RuntimeError("install prometheus_client to register memory telemetry, or serve render() yourself")
+    if registry is None:
+        from prometheus_client import REGISTRY as registry  # type: ignore
+    registry.register(telemetry)
+
+
+def timed(op: str) -> Callable[[F], F]:
+    """Record a ``MemoryStore`` method's latency under ``op`` and label the queries it runs."""
+
+    def decorate(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+            if not MEMORY_TELEMETRY:
+                return fn(self, *args, **kwargs)
+            scope = _Scope(op, self.shard or "global", shard_class(self.shard))
+            token = _scope.set(scope)
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                telemetry.observe_operation(scope, time.perf_counter() - start)
+                _scope.reset(token)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def record_query(
+    sql: str, params: Sequence[Any], seconds: float, rows: int, steps: int, explain: Callable[[], list[str]]
+) -> None:
+    """Account one finished query; ``explain()`` is only called for slow ones."""
+    scope = current_scope()
+    telemetry.observe_query(scope, seconds, rows, steps)
+    if seconds * 1000.0 >= MEMORY_SLOW_QUERY_MS:
+        try:
+            plan = tuple(explain())
+        except Exception as exc:  # the plan is best effort
+            plan = (f"unavailable: {exc}",)
+        telemetry.log_slow(
+            SlowQuery(time.time(), scope.op, scope.shard, seconds, rows, " ".join(sql.split()), params_shape(params), plan)
+        )
+
+
+__all__ = [
+    "BUCKETS",
+    "MEMORY_SLOW_QUERY_LOG_SIZE",
+    "MEMORY_SLOW_QUERY_MS",
+    "MEMORY_TELEMETRY",
+    "MEMORY_TELEMETRY_STEPS",
+    "SlowQuery",
+    "Telemetry",
+    "current_scope",
+    "params_shape",
+    "record_query",
+    "register_prometheus",
+    "shard_class",
+    "telemetry",
+    "timed",
+]
@@ -0,0 +1,389 @@
+"""Per-shard float32 vector index backing ``MemoryStore.semantic_search``.
+
+Embeddings are stored in ``memory_entries.embedding`` as packed little-endian float32 BLOBs
+(``pack_vector``/``unpack_vector``). For search, each shard also keeps an append-only sidecar
+matrix next to its DB file:
+
+- ``<shard>.vec``   unit-normalized float32 rows, memory-mapped for search
+- ``<shard>.ids``   int64 ``vec_seq`` of each matrix row
+- ``<shard>.vmeta`` JSON: dimension, watermark (highest vec_seq indexed), row count and dead row positions
+- ``<shard>.vlock`` lock file: writers hold it exclusively, searches and up-to-date syncs shared
+
+Index rows are keyed by ``memory_entries.vec_seq`` rather than rowid: triggers give a row the
+next number whenever it gains or changes its embedding, and numbers are never handed out
+twice, so an index row can never be read back as another vector. ``sync`` appends rows numbered
+above the watermark (covering every insert path, including write-behind and dump loads),
+``note_deleted`` marks the positions of numbers no row holds any more dead, and the files are
+rebuilt once more than ``MEMORY_VECTOR_REBUILD_RATIO`` of the rows are dead. Several processes
+may share a shard; each re-reads ``.vmeta`` whenever it has been replaced. Search is a vectorized
+cosine top-k with ``argpartition`` when numpy is installed, FAISS (``IndexFlatIP``) when
+``MEMORY_VECTOR_BACKEND=faiss`` and faiss is available, and a pure-Python scan otherwise.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Sequence
+
+try:  # cross-process locking of the sidecar files
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore
+
+try:  # optional vectorized search
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover
+    np = None  # type: ignore
+
+try:  # optional ANN backend
+    import faiss  # type: ignore
+except Exception:  # pragma: no cover
+    faiss = None  # type: ignore
+
+MEMORY_VECTOR_BACKEND = os.getenv("MEMORY_VECTOR_BACKEND", "numpy").lower()  # numpy | faiss
+MEMORY_VECTOR_REBUILD_RATIO = float(os.getenv("MEMORY_VECTOR_REBUILD_RATIO", "0.25"))
+
+_BIG_ENDIAN = sys.byteorder == "big"
+
+
+def pack_vector(vec: Iterable[float]) -> bytes:
+    arr = array("f", vec)
+    if _BIG_ENDIAN:
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def unpack_vector(blob: bytes) -> list[float]:
+    arr = array("f")
+    arr.frombytes(blob)
+    if _BIG_ENDIAN:
+        arr.byteswap()
+    return arr.tolist()
+
+
+def decode_embedding(value: Any) -> list[float] | None:
+    """Embedding column value (float32 BLOB, or legacy JSON text) to a list."""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, memoryview)):
+        return unpack_vector(bytes(value)) or None
+    try:
+        return list(json.loads(value)) or None
+    except Exception:
+        return None
+
+
+def _normalized(vec: Sequence[float]) -> list[float] | None:
+    norm = math.sqrt(sum(v * v for v in vec))
+    if not norm or math.isnan(norm):
+        return None
+    return [v / norm for v in vec]
+
+
+class VectorIndex:
+    def __init__(self, db_path: Path) -> None:
+        base = db_path.with_suffix("")
+        self.db_path = db_path
+        self._vec_path = base.with_suffix(".vec")
+        self._ids_path = base.with_suffix(".ids")
+        self._meta_path = base.with_suffix(".vmeta")
+        self._lock_path = base.with_suffix(".vlock")
+        # Lock order is file lock, then _lock; _lock only guards this object's state, so threads scan concurrently.
+        self._lock = threading.RLock()
+        self._held = threading.local()  # file lock depth of the current thread; a write holding it may rebuild
+        self._meta_stamp: tuple[int, int, int] | None = None  # .vmeta (inode, mtime, size) as last read or written
+        self.dim: int | None = None
+        self.watermark = 0
+        self.count = 0
+        self.dead: set[int] = set()
+        self._matrix: Any = None
+        self._ids: Any = None
+        self._faiss: Any = None
+
+    # ---------- persistence ----------
+    @contextmanager
+    def _file_lock(self, exclusive: bool) -> Iterator[None]:
+        """Serialize index writers across processes and threads; readers share the lock so a rebuild never runs under them."""
+        depth = getattr(self._held, "depth", 0)
+        if fcntl is None or depth:  # no advisory locks on this platform, or already held by this thread
+            self._held.depth = depth + 1
+            try:
+                yield
+            finally:
+                self._held.depth = depth
+            return
+        with open(self._lock_path, "a+b") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._held.depth = 1
+            try:
+                yield
+            finally:
+                self._held.depth = 0
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _stamp(self) -> tuple[int, int, int] | None:
+        try:
+            st = self._meta_path.stat()
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self) -> None:
+        """(Re)read ``.vmeta`` when another process or index object has rewritten it since we last did."""
+        stamp = self._stamp()
+        if stamp == self._meta_stamp:
+            return
+        self._meta_stamp = stamp
+        self._invalidate()
+        self.dim, self.watermark, self.count, self.dead = None, 0, 0, set()
+        if stamp is None:
+            return
+        try:
+            meta = json.loads(self._meta_path.read_text())
+        except Exception:
+            self._reset_files()
+            return
+        if meta.get("key") != "vec_seq":  # keyed by rowid, before shards numbered their vectors
+            self._reset_files()
+            return
+        self.dim = meta.get("dim")
+        self.watermark = int(meta.get("watermark", 0))
+        self.dead = set(meta.get("dead", []))
+        self.count = int(meta.get("rows", 0))
+
+    def _save_meta(self) -> None:
+        tmp = self._meta_path.with_suffix(".vmeta.tmp")
+        tmp.write_text(
+            json.dumps({"key": "vec_seq", "dim": self.dim, "watermark": self.watermark, "dead": sorted(self.dead), "rows": self.count})
+        )
+        tmp.replace(self._meta_path)
+        self._meta_stamp = self._stamp()
+
+    def _reset_files(self) -> None:
+        for path in (self._vec_path, self._ids_path, self._meta_path):
+            path.unlink(missing_ok=True)
+        self._meta_stamp = None
+        self.dim = None
+        self.watermark = 0
+        self.count = 0
+        self.dead = set()
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        self._matrix = None
+        self._ids = None
+        self._faiss = None
+
+    def _append(self, rows: list[tuple[int, list[float]]]) -> None:
+        if not rows:
+            return
+        vecs = array("f")
+        ids = array("q")
+        for seq, vec in rows:
+            vecs.extend(vec)
+            ids.append(seq)
+        if _BIG_ENDIAN:
+            vecs.byteswap()
+            ids.byteswap()
+        # Rows past the recorded count are a torn append by a writer that died before saving .vmeta.
+        for path, size, data in (
+            (self._vec_path, self.count * 4 * (self.dim or 0), vecs.tobytes()),
+            (self._ids_path, self.count * 8, ids.tobytes()),
+        ):
+            with open(path, "ab") as f:
+                if f.tell() > size:
+                    f.truncate(size)
+                f.write(data)
+        self.count += len(rows)
+        self._invalidate()
+
+    def _seqs(self) -> Any:
+        if self._ids is None:
+            if np is not None:
+                self._ids = np.fromfile(self._ids_path, dtype="<i8", count=self.count) if self.count else np.empty(0, "<i8")
+            else:
+                arr = array("q")
+                if self.count:
+                    with open(self._ids_path, "rb") as f:
+                        arr.frombytes(f.read(self.count * 8))
+                    if _BIG_ENDIAN:
+                        arr.byteswap()
+                self._ids = arr
+        return self._ids
+
+    def _positions(self, seqs: set[int]) -> list[int]:
+        ids = self._seqs()
+        if np is not None:
+            return np.nonzero(np.isin(ids, list(seqs)))[0].tolist()
+        return [pos for pos, seq in enumerate(ids) if seq in seqs]
+
+    # ---------- maintenance ----------
+    def sync(self, conn: sqlite3.Connection) -> int:
+        """Index rows numbered since the watermark; returns the number of vectors appended."""
+        # Numbers are taken under SQLite's write lock, so a snapshot holding one holds every lower one too.
+        top = conn.execute("SELECT max(vec_seq) FROM memory_entries").fetchone()[0] or 0
+        with self._file_lock(exclusive=False), self._lock:
+            self._load()
+            if top <= self.watermark:
+                return 0
+        with self._file_lock(exclusive=True), self._lock:
+            self._load()  # another writer may have got here first
+            if top <= self.watermark:
+                return 0
+            rows: list[tuple[int, list[float]]] = []
+            cur = conn.execute(
+                "SELECT vec_seq, embedding FROM memory_entries WHERE vec_seq > ? AND vec_seq <= ? ORDER BY vec_seq",
+                (self.watermark, top),
+            )
+            for seq, value in cur:
+                vec = decode_embedding(value)
+                if not vec:
+                    continue
+                if self.dim is None:
+                    self.dim = len(vec)
+                if len(vec) != self.dim:
+                    continue
+                unit = _normalized(vec)
+                if unit is not None:
+                    rows.append((seq, unit))
+            self._append(rows)
+            self.watermark = top
+            self._save_meta()
+            return len(rows)
+
+    def note_deleted(self, conn: sqlite3.Connection, seqs: Iterable[int | None]) -> None:
+        """Mark the index rows of ``seqs`` dead once no row holds them (deleted, or re-embedded under a new number)."""
+        wanted = {seq for seq in seqs if seq is not None}
+        if not wanted:
+            return
+        with self._file_lock(exclusive=True), self._lock:
+            self._load()
+            if not self._meta_path.exists():
+                return
+            ordered = sorted(wanted)
+            for start in range(0, len(ordered), 500):
+                chunk = ordered[start:start + 500]
+                held = conn.execute(f"SELECT vec_seq FROM memory_entries WHERE vec_seq IN ({','.join('?' * len(chunk))})", chunk)
+                wanted.difference_update(seq for (seq,) in held)
+            positions = self._positions(wanted) if wanted else []
+            if not positions:
+                return
+            self.dead.update(positions)
+            self._faiss = None
+            self._save_meta()
+            if len(self.dead) / self.count > MEMORY_VECTOR_REBUILD_RATIO:
+                self.rebuild(conn)
+
+    def rebuild(self, conn: sqlite3.Connection) -> int:
+        with self._file_lock(exclusive=True), self._lock:
+            self._reset_files()
+            return self.sync(conn)
+
+    # ---------- search ----------
+    def search(self, query: Sequence[float], k: int) -> list[tuple[int, float]]:
+        """Top ``k`` (vec_seq, cosine) pairs among live index rows, best first."""
+        unit = _normalized(query)
+        if unit is None or k <= 0:
+            return []
+        with self._file_lock(exclusive=False):
+            with self._lock:
+                self._load()
+                if not self.count or len(unit) != self.dim:
+                    return []
+                if np is not None and MEMORY_VECTOR_BACKEND == "faiss" and faiss is not None:
+                    return self._search_faiss(unit, k)
+                # Scan outside _lock: appends and rebuilds replace these objects rather than change them.
+                matrix = self._matrix_view() if np is not None else None
+                ids, dead, count, dim = self._seqs(), list(self.dead), self.count, self.dim
+            if matrix is None:
+                return self._search_python(unit, k, ids, dead, count, dim)
+            return self._search_numpy(unit, k, matrix, ids, dead)
+
+    def _matrix_view(self) -> Any:
+        if self._matrix is None:
+            self._matrix = np.memmap(self._vec_path, dtype="<f4", mode="r", shape=(self.count, self.dim))
+        return self._matrix
+
+    @staticmethod
+    def _search_numpy(unit: list[float], k: int, matrix: Any, ids: Any, dead: list[int]) -> list[tuple[int, float]]:
+        scores = matrix @ np.asarray(unit, dtype=np.float32)
+        if dead:
+            scores[dead] = -np.inf
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def _search_faiss(self, unit: list[float], k: int) -> list[tuple[int, float]]:
+        if self._faiss is None:
+            index = faiss.IndexFlatIP(self.dim)
+            index.add(np.ascontiguousarray(self._matrix_view()))
+            self._faiss = index
+        scores, positions = self._faiss.search(np.asarray([unit], dtype=np.float32), min(self.count, k + len(self.dead)))
+        ids = self._seqs()
+        hits = [(int(ids[p]), float(s)) for s, p in zip(scores[0], positions[0]) if p >= 0 and p not in self.dead]
+        return hits[:k]
+
+    def _search_python(
+        self, unit: list[float], k: int, ids: Any, dead: list[int], count: int, dim: int
+    ) -> list[tuple[int, float]]:
+        data = array("f")
+        with open(self._vec_path, "rb") as f:
+            data.frombytes(f.read(count * dim * 4))
+        if _BIG_ENDIAN:
+            data.byteswap()
+        skip = set(dead)
+        scored = (
+            (sum(a * b for a, b in zip(unit, data[pos * dim:(pos + 1) * dim])), ids[pos])
+            for pos in range(count)
+            if pos not in skip
+        )
+        return [(seq, score) for score, seq in heapq.nlargest(k, scored)]
+
+    def stats(self) -> dict[str, Any]:
+        with self._file_lock(exclusive=False), self._lock:
+            self._load()
+            return {"rows": self.count, "dead": len(self.dead), "dim": self.dim, "watermark": self.watermark}
+
+
+_indexes: dict[Path, VectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def vector_index(db_path: Path) -> VectorIndex:
+    """Process-wide ``VectorIndex`` for a shard DB file."""
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = _indexes[db_path] = VectorIndex(db_path)
+        return index
+
+
+def has_vector_index(db_path: Path) -> bool:
+    return db_path in _indexes or db_path.with_suffix(".vmeta").exists()
+
+
+def forget_vector_index(db_path: Path) -> None:
+    """Drop the cached index of a shard file that is being removed (its files are the caller's)."""
+    with _indexes_lock:
+        _indexes.pop(db_path, None)
+
+
+__all__ = [
+    "VectorIndex",
+    "vector_index",
+    "has_vector_index",
+    "forget_vector_index",
+    "pack_vector",
+    "unpack_vector",
+    "decode_embedding",
+]
@@ -0,0 +1,929 @@
+import io
+import time
+
+import pytest
+
+import core.memory_store as memory_store
+from core.memory_shards import ShardConnectionManager
+from core.memory_store import MemoryStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_PATH", tmp_path)
+    monkeypatch.setattr(memory_store, "SHARDS_DIR", tmp_path / "shards")
+    monkeypatch.setattr(memory_store, "BLOBS_DIR", tmp_path / "blobs")
+    monkeypatch.setattr(memory_store, "GLOBAL_DB", tmp_path / "global.db")
+    monkeypatch.setattr(memory_store, "MEMORY_DB_URL", None)
+    yield MemoryStore().for_agent("a1")
+    memory_store.shutdown()
+
+
+def test_add_get_and_search(store):
+    store.add("a1", "hello world", tags=["greeting"], importance=0.9)
+    store.add("a1", "goodbye moon")
+    assert [e.text for e in store.get("a1")] == ["goodbye moon", "hello world"]
+    results = store.search("a1", "hello")
+    assert len(results) == 1 and results[0].tags == ["greeting"]
+
+
+def test_connections_are_reused_and_schema_runs_once(store):
+    before = store.connection_stats()
+    for i in range(5):
+        store.add("a1", f"note {i}")
+        store.get("a1")
+    after = store.connection_stats()
+    assert after["misses"] - before["misses"] <= 1
+    assert after["hits"] - before["hits"] >= 9
+    assert after["schema_inits"] - before["schema_inits"] <= 1
+
+
+def test_add_many_inserts_in_one_batch(store):
+    items = store.add_many({"agent_id": "a1", "text": f"bulk {i}", "tags": ["bulk"]} for i in range(20))
+    assert len(items) == 20
+    assert len(store.get("a1", limit=50)) == 20
+    assert store.add_many([]) == []
+
+
+def test_write_behind_buffers_until_flush(store, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_WRITE_BEHIND", True)
+    monkeypatch.setattr(memory_store, "MEMORY_WRITE_BATCH_SIZE", 1000)
+    monkeypatch.setattr(memory_store, "MEMORY_WRITE_FLUSH_INTERVAL", 60)
+    item = store.add("a1", "buffered note")
+    assert item.text == "buffered note"
+    assert memory_store._write_buffer.has_pending(store._db_path())
+    assert store.flush() == 1
+    assert [e.id for e in store.get("a1")] == [item.id]
+
+
+def test_reads_see_buffered_writes(store, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_WRITE_BEHIND", True)
+    monkeypatch.setattr(memory_store, "MEMORY_WRITE_FLUSH_INTERVAL", 60)
+    store.add("a1", "read your writes")
+    assert store.search("a1", "writes")
+
+
+def test_connection_manager_evicts_least_recently_used(tmp_path):
+    manager = ShardConnectionManager(max_open=2)
+    for name in ("a", "b", "a", "c"):
+        with manager.connection(tmp_path / f"{name}.db") as conn:
+            conn.execute("SELECT 1")
+    stats = manager.stats()
+    assert stats["open"] == 2
+    assert stats["evictions"] == 1
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+    with manager.connection(tmp_path / "a.db"):
+        pass
+    assert manager.stats()["hits"] == 2  # "b" was evicted, not "a"
+    manager.close_all()
+    assert manager.stats()["open"] == 0
+
+
+def test_expired_rows_are_hidden_without_purging(store):
+    store.add("a1", "short lived", ttl=0.01)
+    store.add("a1", "long lived")
+    time.sleep(0.02)
+    assert [e.text for e in store.get("a1")] == ["long lived"]
+    assert [e.text for e in store.search("a1", "lived")] == ["long lived"]
+    assert len(store.dump_all()) == 2  # still on disk until the reaper runs
+
+
+def test_reaper_expires_rows_across_shards_in_batches(store, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_REAPER_BATCH", 3)
+    other = MemoryStore().for_agent("a2")
+    store.add_many({"agent_id": "a1", "text": f"old {i}", "ttl": 0.01} for i in range(7))
+    other.add("a2", "old too", ttl=0.01)
+    other.add("a2", "keep me")
+    time.sleep(0.02)
+    assert memory_store.reap_expired() == 8
+    assert store.dump_all() == []
+    assert [e["text"] for e in other.dump_all()] == ["keep me"]
+
+
+def test_reaper_logs_a_failing_step_and_runs_the_rest(store, monkeypatch, caplog):
+    reaper = memory_store._reaper
+    ran = []
+
+    def broken(stop=None):
+        raise OSError("disk I/O error")
+
+    monkeypatch.setattr(reaper, "reap_once", broken)
+    monkeypatch.setattr(reaper, "merge_once", lambda stop=None: ran.append("merge"))
+    assert reaper.run_once() == 1
+    assert ran == ["merge"] and "reaper step 'reap' failed" in caplog.text
+
+
+def test_get_relevant_ranks_in_sql_and_returns_limit(store):
+    store.add("a1", "kpi report for march", importance=0.1)
+    store.add("a1", "kpi kpi kpi dashboard", importance=0.9)
+    store.add("a1", "unrelated grocery list", importance=1.0)
+    ranked = store.get_relevant("a1", "kpi", limit=2)
+    assert [e.text for e in ranked] == ["kpi kpi kpi dashboard", "kpi report for march"]
+    assert ranked[0].score > ranked[1].score
+    assert [e.text for e in store.get_relevant("a1", "", limit=1)] == ["unrelated grocery list"]
+
+
+def test_semantic_search_uses_vector_index(store):
+    north = store.add("a1", "points north", embedding=[1.0, 0.0, 0.0])
+    store.add("a1", "points east", embedding=[0.0, 1.0, 0.0])
+    store.add("a2", "other agent, also north", embedding=[1.0, 0.0, 0.0])
+    hits = store.semantic_search("a1", [0.9, 0.1, 0.0], limit=1)
+    assert [h.id for h in hits] == [north.id]
+    assert hits[0].score == pytest.approx(0.9 / (0.82 ** 0.5), rel=1e-4)
+    assert store.get("a1", limit=1)[0].embedding == pytest.approx([0.0, 1.0, 0.0])
+
+    store.delete(north.id)
+    later = store.add("a1", "points north again", embedding=[1.0, 0.0, 0.0])
+    assert [h.id for h in store.semantic_search("a1", [1.0, 0.0, 0.0], limit=1)] == [later.id]
+
+
+def test_semantic_search_follows_deletes_and_rowid_reuse_elsewhere(store, monkeypatch):
+    from core import memory_vectors
+
+    store.add("a1", "plus-y", embedding=[0.0, 1.0])
+    plus_x = store.add("a1", "plus-x", embedding=[1.0, 0.0])
+    assert [h.text for h in store.semantic_search("a1", [-1.0, 0.0], limit=1)] == ["plus-y"]
+    ours = memory_vectors._indexes
+
+    monkeypatch.setattr(memory_vectors, "_indexes", {})  # another process, with its own index state
+    store.delete(plus_x.id)
+    store.add("a1", "minus-x", embedding=[-1.0, 0.0])  # takes the deleted row's rowid
+    monkeypatch.setattr(memory_vectors, "_indexes", ours)
+    hits = store.semantic_search("a1", [-1.0, 0.0], limit=1)
+    assert [h.text for h in hits] == ["minus-x"] and hits[0].score == pytest.approx(1.0, rel=1e-4)
+
+    with store._connect() as conn:  # a connection that never tells the index
+        conn.execute("DELETE FROM memory_entries WHERE text = 'minus-x'")
+        conn.commit()
+    store.add("a1", "plus-x again", embedding=[1.0, 0.0])
+    hits = store.semantic_search("a1", [1.0, 0.0], limit=1)
+    assert [h.text for h in hits] == ["plus-x again"] and hits[0].score == pytest.approx(1.0, rel=1e-4)
+    assert [h.text for h in store.semantic_search("a1", [-1.0, 0.0], limit=2)] == ["plus-y", "plus-x again"]
+    with store._connect() as conn:  # the reused rowids got new vector numbers
+        seqs = [r[0] for r in conn.execute("SELECT vec_seq FROM memory_entries ORDER BY rowid")]
+    assert seqs == [1, 4]
+
+
+def test_update_keeps_supplied_embedding_without_a_model(store, monkeypatch):
+    monkeypatch.setattr(store, "_embed", lambda text: None)
+    north = store.add("a1", "points north", embedding=[1.0, 0.0, 0.0])
+    store.add("a1", "points east", embedding=[0.0, 1.0, 0.0])
+    store.update(north.id, text="still points north")
+    hits = store.semantic_search("a1", [1.0, 0.0, 0.0], limit=1)
+    assert [(h.id, h.text) for h in hits] == [(north.id, "still points north")]
+    store.update_many([(north.id, {"text": "north, again"})])
+    hits = store.semantic_search("a1", [1.0, 0.0, 0.0], limit=1)
+    assert [(h.id, h.text) for h in hits] == [(north.id, "north, again")]
+
+
+def test_get_relevant_can_fuse_semantic_results(store, monkeypatch):
+    keyword = store.add("a1", "quarterly revenue numbers", embedding=[0.0, 1.0])
+    similar = store.add("a1", "sales went up", embedding=[1.0, 0.0])
+    monkeypatch.setattr(store, "_embed", lambda text: [1.0, 0.0])
+    fused = store.get_relevant("a1", "revenue", limit=2, semantic=True)
+    assert {e.id for e in fused} == {keyword.id, similar.id}
+
+
+def test_blobs_are_deduplicated_and_collected_across_shards(store):
+    other = MemoryStore().for_agent("a2")
+    first = store.add("a1", "report", blob=b"payload")
+    second = other.add("a2", "same report", blob=io.BytesIO(b"payload"))
+    assert first.blob_ref == second.blob_ref and first.blob_ref.startswith("sha256:")
+    assert store.read_blob(first.blob_ref) == b"payload"
+    with store.open_blob(first.blob_ref, use_mmap=True) as view:
+        assert view[:3] == b"pay"
+
+    path = store._blobs().path_for(first.blob_ref)
+    store.delete(first.id)
+    assert store.cleanup_orphan_blobs(grace=0) == 0  # still referenced by the other shard
+    other.delete(second.id)
+    assert store.cleanup_orphan_blobs(grace=0) == 1
+    assert not path.exists()
+
+
+def test_blob_refs_gained_by_updates_are_counted(store):
+    kept = store.add("a1", "kept", blob=b"old")
+    new_ref = store.write_blob(b"new")
+    store.delete_blob(new_ref)  # only the row below references it now
+    assert store.cleanup_orphan_blobs(grace=60) == 0
+    assert store._blobs().stats()["references"] == 1  # the add's write reference is not counted twice
+    for owned_by_rows in (new_ref, kept.blob_ref):
+        assert store.delete_blob(owned_by_rows) is False
+    assert store._blobs().stats()["references"] == 1
+
+    with store._connect() as conn:
+        conn.execute("UPDATE memory_entries SET blob_ref = ? WHERE id = ?", (new_ref, kept.id))
+        conn.commit()
+    assert store.cleanup_orphan_blobs(grace=0) == 1  # the replaced "old" blob
+    assert store.read_blob(new_ref) == b"new"
+    assert store._blobs().stats()["references"] == 1
+
+
+def test_multi_shard_query_merges_top_k(store):
+    from core.memory_multishard import MultiShardQuery
+
+    store.add("a1", "kpi from the agent", importance=0.2)
+    MemoryStore().for_business("b1").add("b1", "kpi from the business", importance=0.9)
+    MemoryStore().add("g", "kpi from global", importance=0.5)
+    MemoryStore().for_agent("zzz").add("zzz", "kpi elsewhere", importance=1.0)
+
+    query = MultiShardQuery.for_agent("a1", business_id="b1", per_shard_limit=1)
+    hits = query.get_relevant(None, "kpi", limit=2)
+    assert [h.text for h in hits] == ["kpi from the business", "kpi from global"]
+    assert set(hits.latency_ms) == {"agent_a1", "business_b1", "global"} and not hits.errors
+
+    assert MultiShardQuery(pattern="agent_*").shards == ["agent_a1", "agent_zzz"]
+    assert len(MultiShardQuery(pattern="*").search(None, "kpi", limit=10)) == 4
+
+
+def test_async_store_and_sync_facade_share_one_loop(store):
+    import asyncio
+
+    from core.memory_async import AsyncMemoryStore
+
+    async def loop_id():
+        return id(asyncio.get_running_loop())
+
+    async def main():
+        astore = AsyncMemoryStore().for_agent("a1")
+        item = await astore.add("a1", "async note", tags=["x"])
+        assert [e.id for e in await astore.search("a1", "async")] == [item.id]
+        # sync calls made from inside a running loop go to the background loop instead of deadlocking
+        return [store._run_async(loop_id()) for _ in range(2)]
+
+    first, second = asyncio.run(main())
+    assert first == second
+    assert [e.text for e in store.get("a1")] == ["async note"]
+
+
+def test_importance_decays_lazily(store, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_IMPORTANCE_DECAY", True)
+    monkeypatch.setattr(memory_store, "MEMORY_DECAY_FACTOR", 0.5)
+    monkeypatch.setattr(memory_store, "MEMORY_DECAY_PERIOD", 10.0)
+    old = store.add("a1", "old news", importance=0.8)
+    fresh = store.add("a1", "fresh news", importance=0.6)
+    with store._connect() as conn:  # age "old news" by one decay period
+        conn.execute(
+            "UPDATE memory_entries SET importance_at = importance_at - 10, decay_key = decay_key - ? WHERE id = ?",
+            (memory_store._decay_rate() * 10, old.id),
+        )
+        conn.commit()
+    assert {e.id: round(e.importance, 2) for e in store.get("a1")} == {old.id: 0.4, fresh.id: 0.6}
+    assert [e.id for e in store.get_relevant("a1", "news", limit=2)] == [fresh.id, old.id]
+    store.prune_importance(0.5)
+    assert [e.id for e in store.get("a1")] == [fresh.id]
+
+
+def test_export_and_import_stream_in_batches(store):
+    store.add_many({"agent_id": "a1", "text": f"row {i}", "tags": ["t"], "metadata": {"i": i}} for i in range(7))
+    buf = io.BytesIO()
+    seen = []
+    report = store.export_stream(buf, batch_size=3, progress=seen.append)
+    assert (report["rows"], report["batches"], seen) == (7, 3, [3, 6, 7])
+
+    target = MemoryStore().for_agent("copy")
+    buf.seek(0)
+    assert target.import_stream(buf, batch_size=5)["rows"] == 7
+    copied = sorted(target.dump_all(), key=lambda r: r["metadata"]["i"])
+    assert [r["text"] for r in copied] == [f"row {i}" for i in range(7)]
+    assert copied[0]["tags"] == ["t"]
+
+
+def test_delete_blob_unlinks_legacy_refs_and_skips_refs_written_elsewhere(store, monkeypatch):
+    from core import memory_blobs
+
+    legacy = memory_store.BLOBS_DIR / "0f4e.bin"
+    legacy.parent.mkdir(parents=True, exist_ok=True)
+    legacy.write_bytes(b"old style")
+    assert store.delete_blob(str(legacy)) is True and not legacy.exists()
+
+    ref = store.write_blob(b"written before a restart")
+    monkeypatch.setattr(memory_blobs, "_unadopted", {})  # what a fresh process knows
+    assert store.delete_blob(ref) is False
+    assert store._blobs().stats()["references"] == 1 and store.read_blob(ref) == b"written before a restart"
+
+def test_reconcile_keeps_blobs_referenced_outside_the_shards(store, monkeypatch):
+    on_pg = store.write_blob(b"held by a postgres row")
+    gone = store.write_blob(b"held by nothing")
+    monkeypatch.setattr(store, "_blob_refs_pg", lambda: None)
+    monkeypatch.setattr(store, "_run_async", lambda coro: [(on_pg, 2)])
+    monkeypatch.setattr(memory_store, "MEMORY_DB_URL", "postgresql://unused")
+    monkeypatch.setattr(memory_store, "asyncpg", object())
+    counts = store.reconcile_blobs()
+    assert counts == {on_pg.split(":", 1)[1]: 2}
+    monkeypatch.setattr(memory_store, "MEMORY_DB_URL", None)
+    assert store.cleanup_orphan_blobs(grace=0) == 1
+    assert store.read_blob(on_pg) == b"held by a postgres row"
+    with pytest.raises(FileNotFoundError):
+        store.read_blob(gone)
+
+
+def test_postgres_rows_give_back_their_blob_refs(store, monkeypatch):
+    """Runs against a disposable database given by MEMORY_TEST_PG_URL (needs pgvector); drops its tables."""
+    import os
+
+    url = os.getenv("MEMORY_TEST_PG_URL")
+    if not url or memory_store.asyncpg is None:
+        pytest.skip("set MEMORY_TEST_PG_URL (and install asyncpg) to run against Postgres")
+
+    async def drop() -> None:
+        conn = await memory_store.asyncpg.connect(url)
+        await conn.execute("DROP TABLE IF EXISTS memory_entries, memory_settings")
+        await conn.close()
+
+    memory_store._loop_thread.run(drop())
+    monkeypatch.setattr(memory_store, "MEMORY_DB_URL", url)
+    try:
+        kept = store.add("a1", "kept", blob=b"kept payload")
+        deleted = store.add("a1", "deleted", blob=b"deleted payload")
+        expiring = store.add("a1", "expiring", blob=b"expiring payload", ttl=-1)
+        store.delete(deleted.id)
+        store.prune_expired()
+        assert store.cleanup_orphan_blobs(grace=0) == 2
+        assert store._blobs().stats()["references"] == 1
+
+        store.load_dump([{**store.dump_all()[0], "id": "copy"}])  # imported refs are counted
+        assert store._blobs().stats()["references"] == 2
+        assert store.reconcile_blobs() == {kept.blob_ref.split(":", 1)[1]: 2}
+        assert store.cleanup_orphan_blobs(grace=0) == 0 and store.read_blob(kept.blob_ref) == b"kept payload"
+        assert expiring.blob_ref != kept.blob_ref
+    finally:
+        memory_store.shutdown()
+        memory_store._loop_thread.run(drop())
+        memory_store.shutdown()
+
+def test_imported_blob_refs_survive_the_source_being_deleted(store):
+    source = store.add("a1", "report", blob=b"payload")
+    target = MemoryStore().for_agent("copy")
+    target.load_dump([{**store.dump_all()[0], "id": "copied"}])
+    store.delete(source.id)
+    assert store.cleanup_orphan_blobs(grace=0) == 0
+    assert target.read_blob(target.dump_all()[0]["blob_ref"]) == b"payload"
+
+    other = store.write_blob(b"other")
+    target.load_dump([{**target.dump_all()[0], "blob_ref": other}])  # the upsert releases "payload"
+    store.delete_blob(other)
+    assert store.cleanup_orphan_blobs(grace=0) == 1
+    assert target.read_blob(other) == b"other"
+
+
+def test_tag_filters_use_the_tag_index(store):
+    kpi = store.add("a1", "weekly kpi review", tags=["kpi", "weekly"])
+    both = store.add("a1", "kpi budget review", tags=["kpi", "finance"])
+    store.add("a1", "team lunch review", tags=["social"])
+    assert {e.id for e in store.get("a1", limit=10, tags_any=["kpi"])} == {kpi.id, both.id}
+    assert [e.id for e in store.search("a1", "review", tags_all=["kpi", "finance"])] == [both.id]
+    assert [e.id for e in store.get_relevant("a1", "kpi", tags_none=["finance"])] == [kpi.id]
+
+    store.update(both.id, tags=["finance"])
+    assert [e.id for e in store.get("a1", tags_any=["kpi"])] == [kpi.id]
+    store.delete(kpi.id)
+    with store._connect() as conn:
+        assert conn.execute("SELECT count(*) FROM memory_tags WHERE tag = 'kpi'").fetchone()[0] == 0
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT entry_rowid FROM memory_tags WHERE tag IN ('kpi')"
+        ))
+    assert "USING PRIMARY KEY" in plan or "USING COVERING INDEX" in plan
+
+
+def test_metadata_filters_are_typed_and_use_hot_key_index(store, monkeypatch):
+    from core import memory_metadata
+
+    monkeypatch.setattr(memory_metadata, "MEMORY_METADATA_INDEX_KEYS", ("priority",))
+    low = store.add("a1", "ticket one", metadata={"priority": 1, "status": "open"})
+    high = store.add("a1", "ticket two", metadata={"priority": 5, "status": "open", "owner": "kim"})
+    store.add("a1", "ticket three", metadata={"priority": "5", "status": "closed"})
+
+    def ids(flt):
+        return {e.id for e in store.search("a1", "ticket", limit=10, metadata_filter=flt)}
+
+    assert ids({"priority": 5}) == {high.id}  # the string "5" does not match
+    assert ids({"priority": {">=": 1, "<": 5}}) == {low.id}
+    assert ids({"status": "open", "owner": None}) == {low.id}
+    assert ids({"status": {"in": ["open", "pending"]}}) == {low.id, high.id}
+    with store._connect() as conn:
+        plan = " ".join(r[3] for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM memory_entries e WHERE " + memory_metadata.metadata_clauses({"priority": 5})[0][0],
+            (5,),
+        ))
+    assert "idx_memory_meta_priority" in plan
+
+
+def test_fts_follows_updates_and_deletes(store):
+    item = store.add("a1", "alpha bravo")
+    gone = store.add("a1", "alpha charlie")
+    store.update(item.id, text="delta echo")
+    store.delete(gone.id)
+    store.load_dump([{"id": item.id, "agent_id": "a1", "text": "foxtrot"}])
+    assert store.search("a1", "alpha") == []
+    assert store.search("a1", "delta") == []
+    assert [e.id for e in store.search("a1", "foxtrot")] == [item.id]
+    with store._connect() as conn:
+        conn.execute("INSERT INTO fts_entries(fts_entries) VALUES ('integrity-check')")
+    store.merge_fts()
+    store.rebuild_fts()
+    assert [e.id for e in store.search("a1", "foxtrot")] == [item.id]
+
+
+def test_compaction_purges_dead_rows_and_releases_pages(store, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_COMPACT_DEAD_ROWS", 10)
+    items = store.add_many({"agent_id": "a1", "text": "x" * 2000} for _ in range(60))
+    for item in items[:50]:
+        store.soft_delete(item.id)
+    frag = store.fragmentation()
+    assert frag["incremental_vacuum"] and frag["soft_deleted"] == 50 and frag["needs_compaction"]
+
+    import threading
+
+    stop = threading.Event()
+    stop.set()
+    assert store.compact(stop=stop)["interrupted"]
+    report = store.compact(batch=7)
+    assert report["deleted"] == 50 and report["pages_freed"] > 0 and not report["interrupted"]
+    after = store.fragmentation()
+    assert (after["soft_deleted"], after["free_pages"], after["needs_compaction"]) == (0, 0, False)
+    assert len(store.get("a1", limit=100)) == 10
+
+
+def test_postgres_vector_and_tsvector_path(store, monkeypatch):
+    """Runs against a disposable database given by MEMORY_TEST_PG_URL (needs pgvector); drops its tables."""
+    import os
+
+    url = os.getenv("MEMORY_TEST_PG_URL")
+    if not url or memory_store.asyncpg is None:
+        pytest.skip("set MEMORY_TEST_PG_URL (and install asyncpg) to run against Postgres")
+    import core.memory_pg as memory_pg
+
+    async def drop() -> None:
+        conn = await memory_store.asyncpg.connect(url)
+        await conn.execute("DROP TABLE IF EXISTS memory_entries, memory_settings")
+        await conn.close()
+
+    memory_store._loop_thread.run(drop())
+    monkeypatch.setattr(memory_pg, "MEMORY_PG_VECTOR_DIM", 3)
+    monkeypatch.setattr(memory_store, "MEMORY_DB_URL", url)
+    try:
+        store.add("a1", "apples and pears", embedding=[1.0, 0.0, 0.0], tags=["fruit"])
+        store.add("a1", "engine maintenance", embedding=[0.0, 1.0, 0.0], metadata={"priority": 2})
+        hits = store.semantic_search("a1", [0.9, 0.1, 0.0], limit=1)
+        assert [h.text for h in hits] == ["apples and pears"] and hits[0].score > 0.9
+        assert hits[0].embedding == [1.0, 0.0, 0.0] and hits[0].tags == ["fruit"]
+        assert [h.text for h in store.search("a1", "engines")] == ["engine maintenance"]
+        assert [h.text for h in store.search("a1", "engine", metadata_filter={"priority": {">=": 2}})] == ["engine maintenance"]
+        assert [h.text for h in store.get_relevant("a1", "pear", tags_any=["fruit"])] == ["apples and pears"]
+    finally:
+        memory_store.shutdown()
+        memory_store._loop_thread.run(drop())
+        memory_store.shutdown()
+
+
+def test_result_cache_hits_and_invalidates_on_writes(store, monkeypatch):
+    import sqlite3
+
+    from core.memory_cache import ResultCache
+
+    item = store.add("a1", "cached note", tags=["t"])
+    first = store.get_relevant("a1", "cached")
+    first[0].score = -1.0  # callers get copies
+    first[0].tags.append("mutated")
+    first[0].metadata["k"] = "v"
+    before = store.cache_stats()
+    assert [e.text for e in store.get_relevant("a1", "cached")] == ["cached note"]
+    hit = store.get_relevant("a1", "cached")[0]
+    assert hit.score != -1.0 and hit.tags == ["t"] and hit.metadata == {}
+    assert store.cache_stats()["hits"] - before["hits"] == 2
+
+    store.update(item.id, text="cached and edited")
+    assert [e.text for e in store.get_relevant("a1", "cached")] == ["cached and edited"]
+    store.get("a1")
+    store.soft_delete(item.id)
+    assert store.get("a1") == []
+
+    store.add("a1", "from this process")
+    assert len(store.get("a1")) == 1
+    other = sqlite3.connect(store._db_path())  # another process/connection committing to the shard
+    other.execute("UPDATE memory_entries SET text = 'changed elsewhere' WHERE deleted = 0")
+    other.commit()
+    other.close()
+    assert [e.text for e in store.get("a1")] == ["changed elsewhere"]
+
+    from core import memory_segments
+
+    monkeypatch.setattr(memory_segments, "MEMORY_SEGMENTS", "hourly")
+    expiring = store.add("a1", "in a segment", ttl=600)
+    assert len(store.get("a1")) == 2
+    other = sqlite3.connect(store.segments()[0].path)  # another process writing to a segment file
+    other.execute("UPDATE memory_entries SET text = 'segment changed elsewhere' WHERE id = ?", (expiring.id,))
+    other.commit()
+    other.close()
+    assert "segment changed elsewhere" in [e.text for e in store.get("a1")]
+
+    small = ResultCache(max_bytes=2000, ttl=60)
+    for i in range(10):
+        small.put("s", ("k", i), 0, store.get("a1"))
+    assert small.stats()["bytes"] <= 2000 and small.stats()["evictions"] > 0
+    assert small.get("s", ("k", 9), 0) is not None and small.get("s", ("k", 9), 1) is None
+
+
+def test_change_feed_cursor_retention_and_subscription(store):
+    import asyncio
+
+    from core.memory_async import AsyncMemoryStore
+
+    a = store.add("a1", "first")
+    b = store.add("a2", "second")
+    store.update(a.id, text="first, edited")
+    store.soft_delete(b.id)
+    store.delete(a.id)
+    batch = store.changes_since(0)
+    assert [(c.op, c.entry_id) for c in batch] == [
+        ("insert", a.id), ("insert", b.id), ("update", a.id), ("soft_delete", b.id), ("delete", a.id)
+    ]
+    assert batch.next_seq == store.latest_change_seq() and not batch.truncated
+    assert [c.entry_id for c in store.changes_since(0, agent_id="a2")] == [b.id, b.id]
+    assert store.changes_since(batch.next_seq) == []
+
+    assert store.compact_changes() == 3  # only the newest change per entry is kept
+    assert [c.op for c in store.changes_since(0)] == ["soft_delete", "delete"]
+    store.add("a1", "third")
+    assert store.trim_changes(retention=1) == 2
+    assert store.changes_since(0).truncated and not store.changes_since(batch.next_seq).truncated
+
+    async def main():
+        astore = AsyncMemoryStore().for_agent("a1")
+        feed = astore.subscribe(poll_interval=0.01)
+        pending = asyncio.ensure_future(feed.__anext__())
+        await asyncio.sleep(0.05)
+        item = await astore.add("a1", "live")
+        received = await asyncio.wait_for(pending, timeout=5)
+        await feed.aclose()
+        return item, received
+
+    item, received = asyncio.run(main())
+    assert [(c.op, c.entry_id) for c in received] == [("insert", item.id)]
+
+
+def test_deadline_interrupts_queries_and_is_counted(store, monkeypatch):
+    monkeypatch.setattr(memory_store, "MEMORY_PROGRESS_STEPS", 10)
+    store.add_many({"agent_id": "a1", "text": f"deadline row {i}"} for i in range(500))
+    before = store.deadline_stats().get("get", {"queries": 0, "timed_out": 0})
+
+    cut = store.get("a1", limit=500, deadline_ms=1e-6)
+    assert cut.timed_out and len(cut) < 500
+    assert store.search("a1", "deadline", limit=500, deadline_ms=1e-6).timed_out
+    full = store.get("a1", limit=500, deadline_ms=10_000)
+    assert not full.timed_out and len(full) == 500  # the partial result was not cached
+
+    after = store.deadline_stats()["get"]
+    assert (after["queries"] - before["queries"], after["timed_out"] - before["timed_out"]) == (2, 1)
+    assert store.deadline_stats()["search"]["timed_out"] >= 1
+    assert not store.get_relevant("a1", "deadline").timed_out
+
+
+def test_compression_is_transparent_to_reads_fts_and_filters(store, monkeypatch):
+    from core import memory_compression
+
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION", True)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_MIN_BYTES", 32)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_MIN_SAMPLES", 20)
+    report = "mission report: " + "the supplier shipped the parts on time. " * 40
+    big = store.add("a1", report, metadata={"owner": "kim", "notes": "n" * 1000})
+    with store._connect() as conn:
+        row = conn.execute("SELECT text, text_z, metadata_z FROM memory_entries WHERE id = ?", (big.id,)).fetchone()
+    assert row[0] is None and len(row[1]) < len(report) // 4 and row[2] is not None
+    assert store.get("a1")[0].text == report and store.get("a1")[0].metadata["owner"] == "kim"
+    assert [e.id for e in store.search("a1", "supplier", metadata_filter={"owner": "kim"})] == [big.id]
+
+    store.update(big.id, text=report.replace("supplier", "vendor"))
+    assert store.search("a1", "supplier") == [] and [e.id for e in store.search("a1", "vendor")] == [big.id]
+
+    store.add_many({"agent_id": "a1", "text": f"standup {i}: blockers none, progress steady, demo friday"} for i in range(30))
+    assert store.train_compression_dictionary() is not None
+    small = store.add("a1", "standup 99: blockers none, progress steady, demo friday")
+    seq = store.latest_change_seq()
+    assert store.compress_existing() == 30  # rows written before the dictionary
+    assert store.latest_change_seq() == seq  # compressing in place is not a change
+    assert [e.text for e in store.search("a1", "standup", limit=50)].count(small.text) == 1
+    stats = store.compression_stats()
+    assert stats["compressed_rows"] == 32 and stats["ratio"] > 2 and stats["decompressions"] > 0
+
+    store.delete(big.id)
+    store.rebuild_fts()
+    assert store.search("a1", "vendor") == [] and len(store.search("a1", "demo", limit=50)) == 31
+    assert memory_store.compression_report()["agent_a1"]["dictionaries"] == 1
+
+
+def test_compression_dictionaries_trained_elsewhere_load_through_the_reader(store, monkeypatch):
+    from core import memory_compression
+
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION", True)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_MIN_BYTES", 32)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_MIN_SAMPLES", 20)
+    store.add_many({"agent_id": "a1", "text": f"standup {i}: blockers none, progress steady, demo friday"} for i in range(30))
+    dict_id = store.train_compression_dictionary()
+    small = store.add("a1", "standup 99: blockers none, progress steady, demo friday")
+    with store._connect() as conn:
+        packed = conn.execute("SELECT text_z FROM memory_entries WHERE id = ?", (small.id,)).fetchone()[0]
+
+    codec = memory_compression.codec_for(store._db_path())
+    codec._dicts.clear()  # as if another process had trained it
+    assert [e.text for e in store.get("a1", limit=50)].count(small.text) == 1
+    codec._dicts.clear()
+    with store._connect() as conn:  # memory_unz() inside a query on the pooled connection
+        assert conn.execute("SELECT memory_unz(text_z) FROM memory_entries WHERE id = ?", (small.id,)).fetchone()[0] == small.text
+    with pytest.raises(LookupError, match=f"dictionary {dict_id} "):
+        memory_compression.ShardCodec("elsewhere.db").decompress(packed)
+
+
+def test_compression_codecs_are_shared_across_relative_paths_and_restarts(tmp_path, monkeypatch):
+    import sqlite3
+    from pathlib import Path
+
+    from core import memory_compression
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory_store, "MEMORY_PATH", Path("memory"))
+    monkeypatch.setattr(memory_store, "SHARDS_DIR", Path("memory/shards"))
+    monkeypatch.setattr(memory_store, "BLOBS_DIR", Path("memory/blobs"))
+    monkeypatch.setattr(memory_store, "GLOBAL_DB", Path("memory/global.db"))
+    monkeypatch.setattr(memory_store, "MEMORY_DB_URL", None)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION", True)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_MIN_BYTES", 32)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_MIN_SAMPLES", 20)
+    monkeypatch.setattr(memory_compression, "MEMORY_COMPRESSION_DICT_RECHECK", 0)
+    line = "standup {}: blockers none, progress steady, demo friday"
+
+    def dict_id_of(store, entry_id):
+        with store._connect() as conn:
+            packed = conn.execute("SELECT text_z FROM memory_entries WHERE id = ?", (entry_id,)).fetchone()[0]
+        return memory_compression._HEADER.unpack_from(packed)[1]
+
+    try:
+        first = MemoryStore().for_agent("a1")
+        first.add_many({"agent_id": "a1", "text": line.format(i)} for i in range(30))
+        trained = first.train_compression_dictionary()
+        memory_store.shutdown()
+        monkeypatch.setattr(memory_compression, "_codecs", {})  # a fresh process
+        monkeypatch.setattr(memory_compression, "_codec_keys", {})
+
+        second = MemoryStore().for_agent("a1")
+        assert dict_id_of(second, second.add("a1", line.format(99)).id) == trained
+        memory_store._reaper.compress_once()
+        assert second.compression_stats()["dictionaries"] == 1  # the reaper did not train another
+        assert memory_compression.codec_for(second._db_path()) is memory_compression.codec_for(second._db_path().resolve())
+
+        with sqlite3.connect(second._db_path()) as conn:  # another process trains a newer one
+            memory_compression.register_functions(conn)
+            newer = memory_compression.ShardCodec("elsewhere").train(conn)
+        assert dict_id_of(second, second.add("a1", line.format(100)).id) == newer
+    finally:
+        memory_store.shutdown()
+
+def test_segments_route_expiring_rows_and_drop_whole_files(store, monkeypatch):
+    from core import memory_segments
+
+    monkeypatch.setattr(memory_segments, "MEMORY_SEGMENTS", "hourly")
+    now = time.time()
+    store.load_dump(
+        [
+            {"id": "old-1", "agent_id": "a1", "text": "stale report", "created_at": now - 3 * 3600, "expires_at": now - 10},
+            {"id": "old-2", "agent_id": "a1", "text": "stale notes", "created_at": now - 3 * 3600, "expires_at": now - 5},
+            {"id": "mid", "agent_id": "a1", "text": "recent report", "created_at": now - 2 * 3600, "expires_at": now + 600},
+        ]
+    )
+    fresh = store.add("a1", "fresh report", ttl=600)
+    kept = store.add("a1", "permanent report")
+    assert len(store.segments()) == 3
+    with store._connect() as conn:
+        assert conn.execute("SELECT count(*) FROM memory_entries").fetchone()[0] == 1  # only the row without expiry
+
+    assert [e.id for e in store.get("a1")] == [kept.id, fresh.id, "mid"]
+    assert [e.id for e in store.get("a1", since=now - 60)] == [kept.id, fresh.id]
+    assert {e.id for e in store.search("a1", "report")} == {kept.id, fresh.id, "mid"}
+    store.update("mid", text="recent summary")
+    assert [e.id for e in store.search("a1", "summary")] == ["mid"]
+    with store._connect(store.segments()[0].path) as conn:
+        conn.execute("INSERT INTO fts_entries(fts_entries) VALUES ('delete-all')")
+        conn.commit()
+    store.rebuild_fts()  # every file's index, not just the base file's
+    store.merge_fts()
+    assert {e.id for e in store.search("a1", "report")} == {kept.id, fresh.id}
+
+    seq = store.latest_change_seq()
+    old = store.segments()[-1]
+    assert memory_store.reap_expired() >= 2
+    assert not old.path.exists() and len(store.segments()) == 2
+    assert {(c.op, c.entry_id) for c in store.changes_since(seq)} == {("delete", "old-1"), ("delete", "old-2")}
+    store.delete(fresh.id)
+    assert [e.id for e in store.get("a1")] == [kept.id, "mid"]
+
+    store.soft_delete("mid")  # reclaimed from its segment file, not just the base file
+    assert store.fragmentation()["soft_deleted"] == 1 and store.fragmentation()["files"] == 3
+    seq = store.latest_change_seq()
+    assert store.compact()["deleted"] == 1
+    assert store.fragmentation()["soft_deleted"] == 0
+    assert [(c.op, c.entry_id) for c in store.changes_since(seq)] == [("delete", "mid")]
+
+
+def test_segment_listing_does_not_trust_coarse_directory_times(store, monkeypatch):
+    import os
+
+    from core import memory_segments
+
+    monkeypatch.setattr(memory_segments, "MEMORY_SEGMENTS", "hourly")
+    now = time.time()
+    store.add("a1", "first", ttl=600)
+    directory = memory_segments.segments_dir(store._db_path())
+    stale = os.stat(directory).st_mtime_ns - 10_000_000_000
+    os.utime(directory, ns=(stale, stale))  # the listing is now old enough to be trusted
+    assert len(store.segments()) == 1
+
+    # Created in this process: visible even though the directory time did not move.
+    memory_segments.create(memory_segments.segment_for(store._db_path(), now - 3600, 3600))
+    os.utime(directory, ns=(stale, stale))
+    assert len(store.segments()) == 2
+
+    # Created by another process within the same timestamp tick as a fresh listing.
+    os.utime(directory, ns=(time.time_ns(),) * 2)
+    assert len(store.segments()) == 2
+    tick = os.stat(directory).st_mtime_ns
+    memory_segments.segment_for(store._db_path(), now - 7200, 3600).touch()
+    os.utime(directory, ns=(tick, tick))
+    assert len(store.segments()) == 3
+
+
+def test_reads_skip_segments_dropped_while_they_run(store, monkeypatch):
+    import threading
+
+    from core import memory_segments
+
+    monkeypatch.setattr(memory_segments, "MEMORY_SEGMENTS", "hourly")
+    now = time.time()
+    fresh = store.add("a1", "fresh report", ttl=600)
+    stale = lambda i: {"id": f"old-{i}", "agent_id": "a1", "text": "stale report", "created_at": now - (i + 2) * 3600, "expires_at": now - 1}  # noqa: E731
+
+    # A read that listed the segments before the drop skips the vanished file instead of recreating it.
+    store.load_dump([stale(0)])
+    listed = store._read_paths()
+    old = store.segments()[-1]
+    memory_store.reap_expired()
+    store._read_paths = lambda since=None: listed
+    try:
+        assert [e.id for e in store.get("a1")] == [fresh.id]
+        assert store.update("old-0", text="gone") is None
+    finally:
+        del store._read_paths
+    assert not old.path.exists()
+
+    errors: list[BaseException] = []
+    stop = threading.Event()
+
+    def read() -> None:
+        while not stop.is_set():
+            try:
+                assert [e.id for e in store.get("a1")] == [fresh.id]
+                assert [e.id for e in store.search("a1", "report")] == [fresh.id]
+            except BaseException as exc:  # noqa: BLE001
+                errors.append(exc)
+                return
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(1, 30):
+            store.load_dump([stale(i)])
+            memory_store.reap_expired()
+    finally:
+        stop.set()
+        for reader in readers:
+            reader.join()
+    assert errors == []
+    assert [s.path for s in store.segments()] == [memory_segments.segment_for(store._db_path(), now, 3600)]
+
+
+def test_quotas_evict_least_important_entries_in_batches(store, monkeypatch):
+    from core import memory_quotas
+
+    monkeypatch.setattr(memory_quotas, "MEMORY_QUOTA_ROWS", 20)
+    monkeypatch.setattr(memory_quotas, "MEMORY_AGENT_QUOTA_ROWS", 10)
+    monkeypatch.setattr(memory_quotas, "MEMORY_QUOTA_CHECK_EVERY", 5)
+    monkeypatch.setattr(memory_quotas, "MEMORY_EVICTION_BATCH", 2)
+    keep = store.add("a1", "keep me", importance=0.99)
+    store.add_many({"agent_id": "a1", "text": f"chatter {i}", "importance": 0.1} for i in range(8))
+    store.add_many({"agent_id": "a2", "text": f"other {i}", "importance": 0.5} for i in range(4))
+    before = store.eviction_stats().get("agent_a1", {}).get("evicted_rows", 0)
+    store.add_many({"agent_id": "a1", "text": f"late {i}", "importance": 0.1} for i in range(4))
+
+    usage = store.quota_usage()
+    assert usage["agents"]["a1"]["rows"] == 9 and usage["agents"]["a1"]["row_headroom"] == 1  # evicted to 90%
+    assert usage["agents"]["a2"]["rows"] == 4 and usage["row_headroom"] == 7
+    texts = [e.text for e in store.get("a1", limit=50)]
+    assert keep.text in texts and "chatter 0" not in texts and "late 3" in texts  # lowest importance, oldest first
+    assert store.eviction_stats()["agent_a1"]["evicted_rows"] - before == 4
+    assert memory_store.quota_report()["agent_a1"]["agents"]["a1"]["rows"] == 9
+
+
+def test_hot_shards_are_mirrored_in_memory_and_follow_writes(store, monkeypatch):
+    from core import memory_cache, memory_mirrors
+
+    monkeypatch.setattr(memory_cache, "MEMORY_CACHE_ENABLED", False)
+    monkeypatch.setattr(memory_mirrors, "MEMORY_MIRRORS", 1)
+    monkeypatch.setattr(memory_mirrors, "MEMORY_MIRROR_MIN_READS", 3)
+    monkeypatch.setattr(memory_mirrors, "MEMORY_MIRROR_MIN_FREE_BYTES", 0)
+    first = store.add("a1", "alpha note", tags=["x"])
+    for _ in range(5):  # read counts decay, so the third read lands just short of 3
+        assert [e.id for e in store.get("a1")] == [first.id]
+    stats = store.mirror_stats()
+    assert stats["mirrors"] == 1 and stats["hits"] >= 2 and stats["shards"]["agent_a1"]["bytes"] > 0
+
+    second = store.add("a1", "beta note")
+    store.update(first.id, text="gamma note")
+    assert [e.id for e in store.get("a1")] == [second.id, first.id]
+    assert [e.id for e in store.search("a1", "gamma")] == [first.id] and store.search("a1", "alpha") == []
+    assert [e.id for e in store.get("a1", tags_any=["x"])] == [first.id]
+    store.delete(second.id)
+    assert [e.id for e in store.get("a1")] == [first.id]
+    stats = store.mirror_stats()
+    assert stats["incremental_syncs"] >= 2 and stats["full_copies"] == 1 and stats["hit_rate"] > 0.5
+
+    monkeypatch.setattr(memory_mirrors, "MEMORY_MIRROR_MAX_BYTES", 1)  # over budget: dropped on the next sync
+    store.add("a1", "delta note")
+    assert len(store.get("a1")) == 2 and store.mirror_stats()["mirrors"] == 0
+
+
+def test_mirrors_are_dropped_only_when_available_memory_runs_low(store, monkeypatch):
+    from types import SimpleNamespace
+
+    from core import memory_cache, memory_mirrors
+
+    available = SimpleNamespace(available=1 << 40)
+    monkeypatch.setattr(memory_mirrors, "psutil", SimpleNamespace(virtual_memory=lambda: available))
+    monkeypatch.setattr(memory_cache, "MEMORY_CACHE_ENABLED", False)
+    monkeypatch.setattr(memory_mirrors, "MEMORY_MIRRORS", 1)
+    monkeypatch.setattr(memory_mirrors, "MEMORY_MIRROR_MIN_READS", 3)
+    store.add("a1", "alpha note")
+    for _ in range(8):
+        store.get("a1")
+    assert store.mirror_stats()["mirrors"] == 1
+    available.available = 0
+    store.get("a1")
+    assert store.mirror_stats()["mirrors"] == 0
+
+def test_update_many_writes_only_the_changed_fields(store):
+    a = store.add("a1", "draft plan", tags=["todo"], importance=0.4)
+    b = store.add("a1", "old fact", importance=0.5, ttl=60)
+    c = store.add("a1", "keep as is", metadata={"k": 1})
+    updated = store.update_many(
+        [
+            (a.id, {"text": "final plan", "tags": ["done"], "importance_delta": 0.3}),
+            (b.id, {"extend_ttl": 3600, "metadata": {"source": "chat"}}),
+            (c.id, {"importance_delta": 0.1}),
+            ("missing", {"importance": 1.0}),
+        ]
+    )
+    assert updated == 3
+    items = {e.id: e for e in store.get("a1", limit=10)}
+    assert items[a.id].text == "final plan" and items[a.id].tags == ["done"]
+    assert items[a.id].importance == pytest.approx(0.7) and items[c.id].importance == pytest.approx(0.6)
+    assert items[b.id].expires_at == pytest.approx(b.expires_at + 3600) and items[b.id].metadata == {"source": "chat"}
+    assert items[c.id].text == "keep as is" and items[c.id].metadata == {"k": 1} and items[c.id].expires_at is None
+    assert [e.id for e in store.search("a1", "final")] == [a.id] and store.search("a1", "draft") == []
+    assert [e.id for e in store.get("a1", tags_any=["done"])] == [a.id]
+    with pytest.raises(ValueError):
+        store.update_many([(a.id, {"ttl": 5, "extend_ttl": 5})])
+    for bad in ({"ttl": None}, {"text": None}, {"importance": None}, {"importance_delta": None}, {"extend_ttl": None}):
+        with pytest.raises(ValueError, match="cannot be None"):
+            store.update_many([(a.id, bad)])
+    for bad in ({"tags": "abc"}, {"importance": "high"}, {"metadata": ["k"]}):
+        with pytest.raises(ValueError):
+            store.update_many([(a.id, bad)])
+    again = {e.id: e for e in store.get("a1", limit=10)}[a.id]
+    assert again.text == "final plan" and again.tags == ["done"] and again.importance == pytest.approx(0.7)
+
+
+def test_telemetry_histograms_slow_log_and_exporter(store, monkeypatch):
+    from core import memory_telemetry
+
+    memory_telemetry.telemetry.reset()
+    store.add("a1", "untracked")
+    store.get("a1")
+    assert memory_telemetry.telemetry.snapshot()["operations"] == {}  # off by default
+
+    monkeypatch.setattr(memory_telemetry, "MEMORY_TELEMETRY", True)
+    monkeypatch.setattr(memory_telemetry, "MEMORY_SLOW_QUERY_MS", 0)  # log every query
+    store.add_many({"agent_id": "a1", "text": f"telemetry row {i}"} for i in range(50))
+    assert len(store.get("a1", limit=10)) == 10
+    memory_store.MemoryStore().search("a1", "telemetry", limit=3)
+    stats = store.telemetry_stats()
+    assert stats["operations"]["get/agent"]["count"] == 1 and stats["operations"]["add_many/agent"]["count"] == 1
+    assert stats["operations"]["search/global"]["count"] == 1
+    assert stats["rows_returned"]["get/agent"] == 10 and stats["scan_steps"]["get/agent"] > 0
+
+    slow = store.slow_queries()[0]
+    assert slow.op == "get" and slow.shard == "agent_a1" and slow.rows == 10
+    assert "'a1'" not in slow.sql and slow.params[0] == "str[2]" and any("idx_memory" in step for step in slow.plan)
+
+    text = memory_store.telemetry_metrics()
+    assert 'memory_operation_seconds_bucket{op="get",shard_class="agent",le="+Inf"} 1' in text
+    assert 'memory_query_rows_returned_total{op="get",shard_class="agent"} 10' in text
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for core.memory_store, run offline against throwaway SQLite shards in a temp
+directory; results are printed (or written) as JSON.
+
+Ingest (default): entries/sec for each write path.
+    single        one add() per entry (insert + commit each time)
+    many          add_many() in batches of --batch entries
+    write_behind  add() with MEMORY_WRITE_BEHIND buffering and group commit
+
+Suite (--suite): for every combination of --sizes and --shards, generates synthetic agents
+and memories from --seed (same seed, same data) and measures
+    add               add_many() batches (ops = rows)
+    get               most recent entries of an agent
+    search            FTS keyword search
+    get_relevant      hybrid-ranked retrieval with a keyword query
+    get_tags          get() with tags_any
+    relevant_tags     get_relevant() with tags_all
+    search_metadata   search() with a typed metadata range filter (``priority`` is a hot key)
+    ttl_purge         prune_expired() on every shard (ops = rows purged)
+    dump / load       export_stream() / import_stream() of every shard as NDJSON (ops = rows)
+reporting count, ops/sec and p50/p95/p99 latency (ms) per operation. The result cache is off
+unless --cache is given, so repeated queries measure SQLite. Save a run with --output and
+compare a later commit against it with --compare; operations slower than --threshold are
+listed and the exit status is 1.
+
+Usage:
+    python tools/memory_benchmark.py
+    python tools/memory_benchmark.py --entries 20000 --batch 500
+    python tools/memory_benchmark.py --suite --sizes 10000 100000 --shards 1 8 --output base.json
+    python tools/memory_benchmark.py --suite --sizes 10000 100000 --shards 1 8 --compare base.json
+    python tools/memory_benchmark.py --suite --sizes 1000000 --shards 16   # takes a while
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core import memory_cache, memory_metadata, memory_store  # noqa: E402
+
+
+def _use_dir(root: Path) -> None:
+    memory_store.shutdown()
+    memory_store.MEMORY_PATH = root
+    memory_store.SHARDS_DIR = root / "shards"
+    memory_store.BLOBS_DIR = root / "blobs"
+    memory_store.GLOBAL_DB = root / "global.db"
+    memory_store.MEMORY_DB_URL = None
+    memory_store.MEMORY_REAPER_INTERVAL = 0  # a reaper pass would land in the timings
+
+
+def bench_single(store: memory_store.MemoryStore, entries: int, batch: int) -> None:
+    for i in range(entries):
+        store.add("bench", f"benchmark memory number {i}", tags=["bench"])
+
+
+def bench_many(store: memory_store.MemoryStore, entries: int, batch: int) -> None:
+    for start in range(0, entries, batch):
+        store.add_many(
+            {"agent_id": "bench", "text": f"benchmark memory number {i}", "tags": ["bench"]}
+            for i in range(start, min(start + batch, entries))
+        )
+
+
+def bench_write_behind(store: memory_store.MemoryStore, entries: int, batch: int) -> None:
+    previous = memory_store.MEMORY_WRITE_BEHIND, memory_store.MEMORY_WRITE_BATCH_SIZE
+    memory_store.MEMORY_WRITE_BEHIND, memory_store.MEMORY_WRITE_BATCH_SIZE = True, batch
+    try:
+        bench_single(store, entries, batch)
+        store.flush()
+    finally:
+        memory_store.MEMORY_WRITE_BEHIND, memory_store.MEMORY_WRITE_BATCH_SIZE = previous
+
+
+BENCHMARKS: Dict[str, Callable[[memory_store.MemoryStore, int, int], None]] = {
+    "single": bench_single,
+    "many": bench_many,
+    "write_behind": bench_write_behind,
+}
+
+
+def run(name: str, entries: int, batch: int) -> dict:
+    with tempfile.TemporaryDirectory(prefix="memory-bench-") as tmp:
+        _use_dir(Path(tmp))
+        store = memory_store.MemoryStore().for_agent("bench")
+        start = time.perf_counter()
+        BENCHMARKS[name](store, entries, batch)
+        elapsed = time.perf_counter() - start
+        stored = len(store.get("bench", limit=entries))
+        memory_store.shutdown()
+    return {
+        "path": name,
+        "entries": entries,
+        "stored": stored,
+        "seconds": round(elapsed, 4),
+        "entries_per_sec": round(entries / elapsed, 1) if elapsed else None,
+    }
+
+
+# ---------- suite ----------
+
+WORDS = (
+    "account agent budget campaign client contract customer deadline delivery design email engine "
+    "feature forecast invoice launch lead margin meeting metric order partner payment pipeline plan "
+    "pricing product quarter refund release report revenue review risk roadmap sales schedule server "
+    "shipment signup sprint supplier support survey target task team ticket traffic trial upgrade vendor"
+).split()
+TAGS = ("ops", "sales", "support", "finance", "research", "urgent", "todo", "meeting")
+EXPIRED_FRACTION = 0.05  # share of generated entries written with an already elapsed TTL
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000.0  # noqa: E731
+    return {"p50_ms": round(pick(0.50), 4), "p95_ms": round(pick(0.95), 4), "p99_ms": round(pick(0.99), 4)}
+
+
+def _report(samples: List[float], ops: int | None = None, seconds: float | None = None) -> Dict[str, Any]:
+    """Latency percentiles of ``samples`` (seconds per call); ``ops`` defaults to one per sample."""
+    seconds = sum(samples) if seconds is None else seconds
+    ops = len(samples) if ops is None else ops
+    out: Dict[str, Any] = {"count": ops, "seconds": round(seconds, 4), "ops_per_sec": round(ops / seconds, 1) if seconds else None}
+    if samples:
+        out.update(_percentiles(samples))
+    return out
+
+
+def _generate(rng: random.Random, agents: int, count: int) -> Iterator[Dict[str, Any]]:
+    for _ in range(count):
+        yield {
+            "agent_id": f"agent{rng.randrange(agents)}",
+            "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 24))),
+            "tags": rng.sample(TAGS, rng.randint(0, 3)),
+            "importance": round(rng.random(), 3),
+            "ttl": 1e-6 if rng.random() < EXPIRED_FRACTION else None,
+            "metadata": {"priority": rng.randint(1, 5), "status": rng.choice(("open", "done"))},
+        }
+
+
+def _stores(prefix: str, shards: int) -> List[memory_store.MemoryStore]:
+    return [memory_store.MemoryStore(shard=f"{prefix}_{j}") for j in range(shards)]
+
+
+def _shard_of(agent_id: str, shards: int) -> int:
+    return int(agent_id[len("agent"):]) % shards
+
+
+def run_suite_config(entries: int, shards: int, agents: int, queries: int, batch: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    ops: Dict[str, Any] = {}
+    with tempfile.TemporaryDirectory(prefix="memory-bench-") as tmp:
+        _use_dir(Path(tmp))
+        stores = _stores("bench", shards)
+
+        samples: List[float] = []
+        pending: List[List[Dict[str, Any]]] = [[] for _ in range(shards)]
+
+        def write(j: int) -> None:
+            start = time.perf_counter()
+            stores[j].add_many(pending[j])
+            samples.append(time.perf_counter() - start)
+            pending[j] = []
+
+        for item in _generate(rng, agents, entries):
+            j = _shard_of(item["agent_id"], shards)
+            pending[j].append(item)
+            if len(pending[j]) >= batch:
+                write(j)
+        for j in range(shards):
+            if pending[j]:
+                write(j)
+        ops["add"] = _report(samples, ops=entries)
+
+        def measure(call: Callable[[memory_store.MemoryStore, str], Any]) -> Dict[str, Any]:
+            timings = []
+            for _ in range(queries):
+                agent = f"agent{rng.randrange(agents)}"
+                store = stores[_shard_of(agent, shards)]
+                start = time.perf_counter()
+                call(store, agent)
+                timings.append(time.perf_counter() - start)
+            return _report(timings)
+
+        word = lambda: rng.choice(WORDS)  # noqa: E731
+        ops["get"] = measure(lambda s, a: s.get(a, limit=10))
+        ops["search"] = measure(lambda s, a: s.search(a, word(), limit=10))
+        ops["get_relevant"] = measure(lambda s, a: s.get_relevant(a, word(), limit=10))
+        ops["get_tags"] = measure(lambda s, a: s.get(a, limit=10, tags_any=[rng.choice(TAGS)]))
+        ops["relevant_tags"] = measure(lambda s, a: s.get_relevant(a, word(), limit=10, tags_all=rng.sample(TAGS, 2)))
+        ops["search_metadata"] = measure(
+            lambda s, a: s.search(a, word(), limit=10, metadata_filter={"priority": {">=": 4}, "status": "open"})
+        )
+
+        purged = sum(s.fragmentation()["expired"] for s in stores)
+        start = time.perf_counter()
+        for store in stores:
+            store.prune_expired()
+        ops["ttl_purge"] = _report([], ops=purged, seconds=time.perf_counter() - start)
+
+        dumps = [Path(tmp) / f"dump_{j}.ndjson" for j in range(shards)]
+        start = time.perf_counter()
+        rows = sum(store.export_stream(path)["rows"] for store, path in zip(stores, dumps))
+        ops["dump"] = _report([], ops=rows, seconds=time.perf_counter() - start)
+        start = time.perf_counter()
+        rows = sum(store.import_stream(path)["rows"] for store, path in zip(_stores("restore", shards), dumps))
+        ops["load"] = _report([], ops=rows, seconds=time.perf_counter() - start)
+
+        db_bytes = sum(p.stat().st_size for p in (Path(tmp) / "shards").glob("bench_*.db"))
+        memory_store.shutdown()
+    return {"entries": entries, "shards": shards, "agents": agents, "db_bytes": db_bytes, "ops": ops}
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=10)
+    except Exception:
+        return None
+    return out.stdout.strip() or None
+
+
+def run_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    memory_cache.MEMORY_CACHE_ENABLED = args.cache
+    memory_metadata.MEMORY_METADATA_INDEX_KEYS = ("priority",)
+    configs = [
+        run_suite_config(size, shards, args.agents, args.queries, args.batch, args.seed)
+        for size in args.sizes
+        for shards in args.shards
+    ]
+    return {
+        "benchmark": "suite",
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "seed": args.seed,
+        "queries": args.queries,
+        "batch": args.batch,
+        "cache": args.cache,
+        "results": configs,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Operations whose ops/sec dropped (or p95 rose) by more than ``threshold`` versus ``baseline``."""
+    base = {(r["entries"], r["shards"]): r["ops"] for r in baseline.get("results", [])}
+    regressions = []
+    for result in current["results"]:
+        before = base.get((result["entries"], result["shards"]))
+        if before is None:
+            continue
+        for name, now in result["ops"].items():
+            old = before.get(name)
+            if not old:
+                continue
+            label = f"{name} @ {result['entries']} entries / {result['shards']} shards"
+            if old.get("ops_per_sec") and now.get("ops_per_sec") and now["ops_per_sec"] < old["ops_per_sec"] * (1 - threshold):
+                regressions.append(f"{label}: {old['ops_per_sec']} -> {now['ops_per_sec']} ops/sec")
+            if old.get("p95_ms") and now.get("p95_ms") and now["p95_ms"] > old["p95_ms"] * (1 + threshold):
+                regressions.append(f"{label}: p95 {old['p95_ms']} -> {now['p95_ms']} ms")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark core.memory_store.")
+    parser.add_argument("--entries", type=int, default=5000, help="Entries to write per path (default: 5000).")
+    parser.add_argument("--batch", type=int, default=256, help="Batch / buffer size (default: 256).")
+    parser.add_argument("--paths", nargs="+", choices=sorted(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--suite", action="store_true", help="Run the read/write/maintenance suite instead of ingest.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[10_000, 100_000], help="Suite entry counts.")
+    parser.add_argument("--shards", nargs="+", type=int, default=[1, 8], help="Suite shard counts.")
+    parser.add_argument("--agents", type=int, default=50, help="Synthetic agents (default: 50).")
+    parser.add_argument("--queries", type=int, default=200, help="Calls per read operation (default: 200).")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--cache", action="store_true", help="Keep the result cache enabled during the suite.")
+    parser.add_argument("--output", type=Path, help="Also write the JSON report to this file.")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON report to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression tolerance (default: 0.10).")
+    args = parser.parse_args()
+
+    if args.suite:
+        report = run_suite(args)
+    else:
+        report = {"benchmark": "ingest", "results": [run(name, args.entries, args.batch) for name in args.paths]}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n")
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())